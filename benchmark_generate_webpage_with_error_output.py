@@ -0,0 +1,116 @@
+"""
+benchmark_generate_webpage_with_error_output.py
+
+generates synthetic reports and renders review, obvious and test pages
+with previous implementation (rescanning all reports for each error type)
+and with current one (reports grouped by error_id once)
+and checks that generated files are identical
+
+python3 benchmark_generate_webpage_with_error_output.py 100000
+"""
+import sys
+import os
+import time
+import random
+import filecmp
+import tempfile
+import config
+import generate_webpage_with_error_output as webpage
+
+def synthetic_reports(report_count):
+    random.seed(0)
+    error_ids = webpage.for_review() + webpage.obvious_fixes() + webpage.for_tests() + ["error not listed anywhere"]
+    reports = []
+    for i in range(report_count):
+        osm_type = random.choice(["node", "way", "relation"])
+        osm_id = random.randint(1, report_count * 10)
+        report = {
+            "error_id": random.choice(error_ids),
+            "error_message": "problem with <" + str(i) + "> in Kraków",
+            "error_general_intructions": random.choice([None, "check it\nand fix it"]),
+            "osm_object_url": "https://www.openstreetmap.org/" + osm_type + "/" + str(osm_id),
+            "tags": {"name": "Obiekt " + str(osm_id), "wikidata": "Q" + str(i)},
+            "proposed_tagging_changes": None,
+        }
+        if i % 5 == 0:
+            report["proposed_tagging_changes"] = [{"from": {"wikipedia": "pl:Stary " + str(i)}, "to": {"wikipedia": "pl:Nowy " + str(i)}}]
+        if i % 7 == 0:
+            report["prerequisite"] = {"wikidata": "Q" + str(i), "name": None}
+        reports.append(report)
+        if i % 10 == 0:
+            # merged pages contain the same report from overlapping areas
+            reports.append(dict(report))
+    return reports
+
+def legacy_generate_html_file(errors, output_file_name, types, information_header, timestamps_of_data):
+    # implementation used before reports were grouped by error_id, kept for comparison
+    prefix_of_lines = "\t\t\t"
+    total_error_count = 0
+    added_reports = {}
+    table_of_contents_text = "<ul>"
+    reported_errors_text = ""
+    with open( output_file_name, 'w') as file:
+        file.write(webpage.object_list_header(timestamps_of_data))
+        file.write(webpage.row( '<hr>', prefix_of_lines=prefix_of_lines))
+        file.write(webpage.row( information_header, prefix_of_lines=prefix_of_lines ))
+        file.write(webpage.row( '<hr>', prefix_of_lines=prefix_of_lines ))
+        reported_errors = sorted(errors, key=lambda error: error['osm_object_url'])
+        for error_type_id in types:
+            error_count = 0
+            for e in reported_errors:
+                if e['error_id'] == error_type_id:
+                    error_text = webpage.error_description(e, prefix_of_lines + "\t")
+                    if error_text in added_reports:
+                        continue
+                    if error_count == 0:
+                        table_of_contents_text += '<li><a href="#' + error_type_id + '">' + error_type_id + '</a></li>'
+                        reported_errors_text += webpage.row( '<a href="#' + error_type_id + '"><h2 id="' + error_type_id + '">' + error_type_id + '</h2></a>', prefix_of_lines=prefix_of_lines)
+                        if e['error_general_intructions'] != None:
+                            instructions = webpage.htmlify(e['error_general_intructions'])
+                            reported_errors_text += webpage.row(instructions, prefix_of_lines=prefix_of_lines)
+                    added_reports[error_text] = "added!"
+                    error_count += 1
+                    total_error_count += 1
+                    reported_errors_text += error_text
+            if error_count != 0:
+                reported_errors_text += webpage.row( '<a href="https://overpass-turbo.eu/">overpass query</a> usable in JOSM that will load all objects where this specific error is present:', prefix_of_lines=prefix_of_lines )
+                query = webpage.get_query_for_loading_errors_by_category_from_error_data(errors, printed_error_ids = [error_type_id], format = "josm")
+                query_html = "<blockquote>" + webpage.escape_from_internal_python_string_to_html_ascii(query) + "</blockquote>"
+                reported_errors_text += webpage.row(query_html, prefix_of_lines=prefix_of_lines)
+                reported_errors_text += webpage.row( '<hr>', prefix_of_lines=prefix_of_lines )
+        table_of_contents_text += "</ul>"
+        file.write(table_of_contents_text)
+        file.write(reported_errors_text)
+        file.write(webpage.html_file_suffix())
+    return total_error_count
+
+def legacy_generate_output_for_given_area(directory, main_output_name_part, reports_data, timestamps_of_data):
+    legacy_generate_html_file(reports_data, directory + '/' + main_output_name_part + ".html", webpage.for_review(), "Remember to check whatever edit makes sense! All reports are at this page because this tasks require human judgment to verify whatever proposed edit makes sense.", timestamps_of_data)
+    legacy_generate_html_file(reports_data, directory + '/' + main_output_name_part + " - obvious.html", webpage.obvious_fixes(), "Proposed edits at this page are so obvious that automatic edit makes sense.", timestamps_of_data)
+    legacy_generate_html_file(reports_data, directory + '/' + main_output_name_part + " - test.html", webpage.for_tests(), "This page contains reports that are tested or are known to produce false positives. Be careful with using this data.", timestamps_of_data)
+
+def main():
+    report_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    reports = synthetic_reports(report_count)
+    timestamps = [1675000000]
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_directory = os.path.join(directory, "legacy")
+        current_directory = os.path.join(directory, "current")
+        os.mkdir(legacy_directory)
+        os.mkdir(current_directory)
+
+        start = time.time()
+        legacy_generate_output_for_given_area(legacy_directory, "area", reports, timestamps)
+        print("previous implementation:", round(time.time() - start, 2), "s")
+
+        config.get_report_directory = lambda: current_directory
+        start = time.time()
+        webpage.generate_output_for_given_area("area", reports, timestamps, [])
+        print("current implementation:", round(time.time() - start, 2), "s")
+
+        for filename in ["area.html", "area - obvious.html", "area - test.html"]:
+            identical = filecmp.cmp(os.path.join(legacy_directory, filename), os.path.join(current_directory, filename), shallow=False)
+            print(filename, "identical" if identical else "DIFFERENT")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+benchmark_load_osm_file.py
+
+generates large synthetic .osm file and compares reading it with
+previous three pass reader (one xml_stream pass for each of relations, ways, nodes)
+and with load_osm_file.xml_streaming_of_osm_file
+
+python3 benchmark_load_osm_file.py 300000
+"""
+import sys
+import os
+import time
+import tempfile
+import xml_stream
+import load_osm_file
+
+def generate_synthetic_osm_file(filepath, element_count):
+    with open(filepath, 'w') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        file.write('<osm version="0.6" generator="benchmark_load_osm_file.py">\n')
+        for i in range(element_count):
+            lat = 50 + (i % 1000) / 1000
+            lon = 19 + (i % 777) / 1000
+            file.write('  <node id="' + str(i) + '" lat="' + str(lat) + '" lon="' + str(lon) + '">\n')
+            file.write('    <tag k="name" v="Node ' + str(i) + '"/>\n')
+            file.write('    <tag k="wikidata" v="Q' + str(i) + '"/>\n')
+            file.write('  </node>\n')
+        for i in range(element_count):
+            file.write('  <way id="' + str(i) + '">\n')
+            file.write('    <center lat="50.1" lon="19.1"/>\n')
+            for node in range(10):
+                file.write('    <nd ref="' + str(i + node) + '"/>\n')
+            file.write('    <tag k="highway" v="residential"/>\n')
+            file.write('    <tag k="wikipedia" v="pl:Ulica ' + str(i) + '"/>\n')
+            file.write('  </way>\n')
+        for i in range(element_count // 10):
+            file.write('  <relation id="' + str(i) + '">\n')
+            file.write('    <center lat="50.2" lon="19.2"/>\n')
+            for member in range(20):
+                file.write('    <member type="way" ref="' + str(i + member) + '" role="outer"/>\n')
+            file.write('    <tag k="type" v="multipolygon"/>\n')
+            file.write('    <tag k="subject:wikidata" v="Q' + str(i) + '"/>\n')
+            file.write('  </relation>\n')
+        file.write('</osm>\n')
+
+def three_pass_reader(osm_file_filepath):
+    # implementation used before single pass reader was introduced, kept for comparison
+    nodes_iter = xml_stream.read_xml_file(osm_file_filepath, records_tag="node")
+    ways_iter = xml_stream.read_xml_file(osm_file_filepath, records_tag="way")
+    relations_iter = xml_stream.read_xml_file(osm_file_filepath, records_tag="relation")
+    for complex_set in [relations_iter, ways_iter]:
+        for v in complex_set:
+            osm_tags = {}
+            for tag in v:
+                if tag.tag != "tag":
+                    continue
+                osm_tags[tag.attrib['k']] = tag.attrib['v']
+            if len(osm_tags) > 0:
+                for tag in v:
+                    if tag.tag != "center":
+                        continue
+                    yield({"osm_type": v.tag, "osm_id": v.attrib['id'], "lat": float(tag.attrib['lat']), "lon": float(tag.attrib['lon']), "osm_tags": osm_tags})
+    for v in nodes_iter:
+        osm_tags = {}
+        for tag in v:
+            if tag.tag != "tag":
+                continue
+            osm_tags[tag.attrib['k']] = tag.attrib['v']
+        if len(osm_tags) > 0:
+            yield({"osm_type": v.tag, "osm_id": v.attrib['id'], "lat": float(v.attrib['lat']), "lon": float(v.attrib['lon']), "osm_tags": osm_tags})
+
+def measure(name, reader, filepath):
+    start = time.time()
+    records = list(reader(filepath))
+    duration = time.time() - start
+    print(name, "-", len(records), "records in", round(duration, 2), "s")
+    return records
+
+def key_of_record(record):
+    return (record["osm_type"], record["osm_id"])
+
+def main():
+    element_count = 100_000
+    if len(sys.argv) > 1:
+        element_count = int(sys.argv[1])
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "synthetic.osm")
+        generate_synthetic_osm_file(filepath, element_count)
+        print("synthetic file has", os.path.getsize(filepath) // 1024 // 1024, "MB")
+        old = measure("three pass xml_stream reader", three_pass_reader, filepath)
+        new = measure("single pass reader", load_osm_file.xml_streaming_of_osm_file, filepath)
+        if sorted(old, key=key_of_record) != sorted(new, key=key_of_record):
+            raise Exception("readers returned different records!")
+
+if __name__ == '__main__':
+    main()
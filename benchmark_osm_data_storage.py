@@ -0,0 +1,103 @@
+"""
+benchmark_osm_data_storage.py
+
+creates synthetic database with tags and reports stored in previous format
+(tags with default separators or indent=3, reports including copy of tags and osm_object_url),
+converts it with osm_data_storage.compact_existing_rows and compares
+file size and time of scanning all reports before and after
+
+python3 benchmark_osm_data_storage.py 500000
+"""
+import sys
+import os
+import time
+import json
+import random
+import sqlite3
+import tempfile
+import database_schema
+import osm_data_storage
+
+def create_database(filepath):
+    connection = sqlite3.connect(filepath)
+    database_schema.create_legacy_osm_data_table(connection.cursor())
+    connection.commit()
+    return connection
+
+def synthetic_tags(index):
+    tags = {"name": "Obiekt " + str(index), "wikidata": "Q" + str(index), "wikipedia": "pl:Obiekt " + str(index)}
+    tags[random.choice(["amenity", "building", "highway", "place", "historic"])] = random.choice(["yes", "school", "residential", "village", "memorial"])
+    if index % 3 == 0:
+        tags["addr:street"] = "Długa"
+        tags["addr:housenumber"] = str(index % 200)
+        tags["addr:city"] = "Kraków"
+    return tags
+
+def synthetic_report(index):
+    return {"error_id": "wikipedia tag links to 404", "error_message": "article linked in wikipedia tag (pl:Obiekt " + str(index) + ") does not exist", "error_general_intructions": None, "prerequisite": {"wikipedia": "pl:Obiekt " + str(index)}, "proposed_tagging_changes": None}
+
+def fill_in_previous_format(connection, object_count):
+    random.seed(0)
+    rows = []
+    for index in range(object_count):
+        tags = synthetic_tags(index)
+        validator_complaint = ""
+        status = 1
+        error_id = ""
+        if index % 5 == 0:
+            report = synthetic_report(index)
+            report['osm_object_url'] = "https://openstreetmap.org/node/" + str(index)
+            report['tags'] = tags
+            validator_complaint = json.dumps(report)
+            error_id = report["error_id"]
+            status = 2
+        # only objects updated by update_outdated_elements had tags stored with indent=3
+        stored_tags = json.dumps(tags)
+        if index % 20 == 0:
+            stored_tags = json.dumps(tags, indent=3)
+        rows.append(("node", index, 50.0, 19.0, stored_tags, "area_" + str(index % 20), 1675000000, validator_complaint, error_id, "hash", status))
+    connection.executemany("INSERT INTO osm_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    connection.commit()
+
+def scan_all_reports(connection):
+    start = time.time()
+    reports = 0
+    for area_index in range(20):
+        cursor = connection.execute("SELECT type, id, tags, validator_complaint FROM osm_data WHERE area_identifier = :identifier AND status = 2", {"identifier": "area_" + str(area_index)})
+        for entry in cursor.fetchall():
+            osm_data_storage.rehydrated_report(*entry)
+            reports += 1
+    return reports, time.time() - start
+
+def full_table_scan(connection):
+    start = time.time()
+    connection.execute("SELECT COUNT(*) FROM osm_data WHERE tags LIKE '%memorial%'").fetchall()
+    return time.time() - start
+
+def main():
+    object_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "database.db")
+        connection = create_database(filepath)
+        fill_in_previous_format(connection, object_count)
+        connection.execute("VACUUM")
+        size_before = os.path.getsize(filepath)
+        reports, report_scan_before = scan_all_reports(connection)
+        table_scan_before = full_table_scan(connection)
+
+        start = time.time()
+        osm_data_storage.compact_existing_rows(connection.cursor())
+        print("migration:", round(time.time() - start, 2), "s")
+
+        size_after = os.path.getsize(filepath)
+        reports, report_scan_after = scan_all_reports(connection)
+        table_scan_after = full_table_scan(connection)
+        connection.close()
+
+        print(object_count, "objects,", reports, "reports")
+        print("database size:", round(size_before / 1024 / 1024, 1), "MB ->", round(size_after / 1024 / 1024, 1), "MB")
+        print("loading and rehydrating all reports:", round(report_scan_before, 2), "s ->", round(report_scan_after, 2), "s")
+        print("full table scan:", round(table_scan_before, 2), "s ->", round(table_scan_after, 2), "s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+benchmark_overpass_output_formats.py
+
+generates the same synthetic dataset as XML and as [out:json] Overpass output
+and compares load_osm_file.xml_streaming_of_osm_file with load_osm_file.json_streaming_of_osm_file
+- throughput and peak RSS, each reader runs in a separate fresh process
+
+python3 benchmark_overpass_output_formats.py 300000
+"""
+import sys
+import os
+import time
+import json
+import resource
+import tempfile
+import multiprocessing
+import load_osm_file
+import benchmark_load_osm_file
+
+def generate_synthetic_json_file(filepath, element_count):
+    # the same elements as benchmark_load_osm_file.generate_synthetic_osm_file, laid out like Overpass output
+    with open(filepath, 'w') as file:
+        file.write('{\n  "version": 0.6,\n  "generator": "benchmark_overpass_output_formats.py",\n  "elements": [\n\n')
+        separator = ""
+        for element in synthetic_elements(element_count):
+            file.write(separator + json.dumps(element, indent=2, ensure_ascii=False))
+            separator = ",\n"
+        file.write('\n\n  ]\n}\n')
+
+def synthetic_elements(element_count):
+    for i in range(element_count):
+        lat = 50 + (i % 1000) / 1000
+        lon = 19 + (i % 777) / 1000
+        yield {"type": "node", "id": i, "lat": lat, "lon": lon, "tags": {"name": "Node " + str(i), "wikidata": "Q" + str(i)}}
+    for i in range(element_count):
+        nodes = [i + node for node in range(10)]
+        yield {"type": "way", "id": i, "center": {"lat": 50.1, "lon": 19.1}, "nodes": nodes, "tags": {"highway": "residential", "wikipedia": "pl:Ulica " + str(i)}}
+    for i in range(element_count // 10):
+        members = [{"type": "way", "ref": i + member, "role": "outer"} for member in range(20)]
+        yield {"type": "relation", "id": i, "center": {"lat": 50.2, "lon": 19.2}, "members": members, "tags": {"type": "multipolygon", "subject:wikidata": "Q" + str(i)}}
+
+def readers():
+    return {"none": lambda filepath: [], "xml": load_osm_file.xml_streaming_of_osm_file, "json": load_osm_file.json_streaming_of_osm_file}
+
+def run_reader(name, filepath, results):
+    # records are counted, not kept - so peak RSS shows memory used by reader itself
+    start = time.time()
+    count = 0
+    for entry in readers()[name](filepath):
+        count += 1
+    duration = time.time() - start
+    # kilobytes on Linux
+    results.put({"count": count, "duration": duration, "peak_rss_in_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+def measure(name, filepath):
+    # spawned, not forked - so process does not start with memory of the parent
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_reader, args=(name, filepath, results))
+    process.start()
+    returned = results.get()
+    process.join()
+    return returned
+
+def key_of_record(record):
+    return (record["osm_type"], record["osm_id"])
+
+def main():
+    element_count = 100_000
+    if len(sys.argv) > 1:
+        element_count = int(sys.argv[1])
+    with tempfile.TemporaryDirectory() as directory:
+        xml_filepath = os.path.join(directory, "synthetic.osm")
+        json_filepath = os.path.join(directory, "synthetic.json")
+        benchmark_load_osm_file.generate_synthetic_osm_file(xml_filepath, element_count)
+        generate_synthetic_json_file(json_filepath, element_count)
+        print("synthetic XML file has", os.path.getsize(xml_filepath) // 1024 // 1024, "MB")
+        print("synthetic JSON file has", os.path.getsize(json_filepath) // 1024 // 1024, "MB")
+        baseline = measure("none", xml_filepath)
+        for name, filepath in [("xml", xml_filepath), ("json", json_filepath)]:
+            measured = measure(name, filepath)
+            print(name, "-", measured["count"], "records in", round(measured["duration"], 2), "s,", int(measured["count"] / measured["duration"]), "records/s,",
+                "peak RSS", measured["peak_rss_in_kb"] // 1024, "MB (", (measured["peak_rss_in_kb"] - baseline["peak_rss_in_kb"]) // 1024, "MB above empty process)")
+        xml_records = sorted(load_osm_file.xml_streaming_of_osm_file(xml_filepath), key=key_of_record)
+        json_records = sorted(load_osm_file.json_streaming_of_osm_file(json_filepath), key=key_of_record)
+        if xml_records != json_records:
+            raise Exception("readers returned different records!")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+benchmark_region_pipeline.py
+
+compares processing regions one by one (download, then ingest and validate, then render)
+with region_pipeline, where the next region is downloaded while previous ones are processed
+
+network is stubbed with local fake Overpass server responding after delay
+ingest uses load_osm_file with a temporary database, validation and rendering
+are replaced by CPU bound work proportional to amount of objects
+
+python3 benchmark_region_pipeline.py 10 2.0
+(10 regions, each download taking 2 seconds)
+"""
+import sys
+import os
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import http.server
+import database_schema
+import obtain_from_overpass
+import object_store
+import region_pipeline
+
+objects_per_region = 20_000
+
+def synthetic_osm_data():
+    returned = '<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="benchmark_region_pipeline.py">\n'
+    for i in range(objects_per_region):
+        returned += '<node id="' + str(i) + '" lat="50.0" lon="19.0"><tag k="wikidata" v="Q' + str(i) + '"/></node>\n'
+    returned += '</osm>\n'
+    return returned.encode('utf-8')
+
+class FakeOverpass(http.server.BaseHTTPRequestHandler):
+    delay = 1.0
+    response = synthetic_osm_data()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"Rate limit: 0\n")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(FakeOverpass.delay)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(FakeOverpass.response)
+
+    def log_message(self, format, *args):
+        pass
+
+def create_database(filepath):
+    connection = sqlite3.connect(filepath)
+    database_schema.create_tables(connection.cursor())
+    connection.commit()
+    connection.close()
+
+def simulated_cpu_work(cursor, region):
+    cursor.execute("SELECT osm_objects.tags FROM " + object_store.area_join() + " WHERE osm_object_areas.area_identifier = :identifier", {"identifier": region})
+    for entry in cursor.fetchall():
+        for _ in range(10):
+            hashlib.sha256(entry[0].encode('utf-8')).hexdigest()
+
+def main():
+    region_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    FakeOverpass.delay = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeOverpass)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = "http://127.0.0.1:" + str(server.server_address[1]) + "/api/interpreter"
+    regions = ["region_" + str(index) for index in range(region_count)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        def download(region):
+            filepath = os.path.join(directory, region + ".osm")
+            obtain_from_overpass.download_area(lambda bbox: "[timeout:25];node;out;", "", "searchArea", filepath, api_url)
+            return {"filepath": filepath, "download_type": "initial_full_data", "timestamp": int(time.time())}
+
+        def ingest_and_validate(cursor, region, downloaded):
+            obtain_from_overpass.load_downloaded_data(cursor, region, downloaded, "pl")
+            simulated_cpu_work(cursor, region)
+            cursor.connection.commit()
+            os.remove(downloaded["filepath"])
+
+        def render(cursor, region):
+            simulated_cpu_work(cursor, region)
+
+        database = os.path.join(directory, "serial.db")
+        create_database(database)
+        start = time.time()
+        connection = sqlite3.connect(database)
+        for region in regions:
+            ingest_and_validate(connection.cursor(), region, download(region))
+            render(connection.cursor(), region)
+        connection.close()
+        serial_time = time.time() - start
+        print("one region at a time:", round(serial_time, 2), "s")
+
+        database = os.path.join(directory, "pipeline.db")
+        create_database(database)
+
+        def download_stage(inputs):
+            for region in inputs:
+                yield region, download(region)
+
+        def ingest_and_validate_stage(inputs):
+            connection = sqlite3.connect(database, timeout=600)
+            for region, downloaded in inputs:
+                ingest_and_validate(connection.cursor(), region, downloaded)
+                yield region
+            connection.close()
+
+        def render_stage(inputs):
+            connection = sqlite3.connect(database, timeout=600)
+            for region in inputs:
+                render(connection.cursor(), region)
+                yield region
+            connection.close()
+
+        start = time.time()
+        region_pipeline.run_pipeline(regions, [download_stage, ingest_and_validate_stage, render_stage])
+        pipeline_time = time.time() - start
+        print("pipeline:", round(pipeline_time, 2), "s")
+        print("speedup:", round(serial_time / pipeline_time, 2))
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import json
+import math
+import xml.etree.ElementTree
+
+# offline check whether location is within given country or region
+#
+# boundaries are loaded from GeoJSON (Polygon/MultiPolygon features) or from .osm file
+# with boundary relations, for example exported with Overpass query
+# relation["boundary"="administrative"]["ISO3166-1"];(._;>;);out;
+#
+# each boundary is identified by its lowercase ISO 3166 codes, so "pl" or "pl-ma",
+# and by lowercase wikidata id, so "q54169" - matching identifier of most entries in regions_processed.yaml
+#
+# index is a grid of cells with list of boundaries that may contain points in that cell,
+# edges of each boundary are additionally split into horizontal bands so point in polygon
+# test looks only at edges which may cross ray from the tested point
+
+def code_keys():
+    return ["ISO3166-1", "ISO3166-1:alpha2", "ISO3166-2", "country_code", "wikidata"]
+
+def code_of_identifier(identifier):
+    # identifier is identifier from entry in regions_processed.yaml
+    # returns None if boundary matching it cannot be found in index
+    for key in ["ISO3166-1", "ISO3166-2", "wikidata"]:
+        if key in identifier:
+            return identifier[key].lower()
+    return None
+
+def grid_cell_size_in_degrees():
+    return 1.0
+
+def band_height_in_degrees():
+    return 0.05
+
+def codes_from_properties(properties):
+    returned = []
+    for key in code_keys():
+        if properties.get(key) != None:
+            returned.append(properties[key].lower())
+    return returned
+
+def load_boundaries(filepath):
+    # returns list of dictionaries with "codes" and "rings"
+    # ring is list of (lon, lat) tuples, holes are rings as well - point in polygon
+    # test counts crossings of all rings of a boundary
+    if filepath.endswith(".osm"):
+        return load_boundaries_from_osm_file(filepath)
+    return load_boundaries_from_geojson_file(filepath)
+
+def load_boundaries_from_geojson_file(filepath):
+    with open(filepath) as file:
+        data = json.load(file)
+    returned = []
+    for feature in data["features"]:
+        codes = codes_from_properties(feature.get("properties") or {})
+        if len(codes) == 0:
+            continue
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            continue
+        rings = []
+        for polygon in polygons:
+            for ring in polygon:
+                rings.append([(point[0], point[1]) for point in ring])
+        returned.append({"codes": codes, "rings": rings})
+    return returned
+
+def load_boundaries_from_osm_file(filepath):
+    nodes = {}
+    ways = {}
+    relations = []
+    for event, element in xml.etree.ElementTree.iterparse(filepath, events=('end',)):
+        if element.tag == "node":
+            nodes[element.attrib["id"]] = (float(element.attrib["lon"]), float(element.attrib["lat"]))
+        elif element.tag == "way":
+            ways[element.attrib["id"]] = [nd.attrib["ref"] for nd in element.findall("nd")]
+        elif element.tag == "relation":
+            tags = {tag.attrib["k"]: tag.attrib["v"] for tag in element.findall("tag")}
+            members = [member.attrib["ref"] for member in element.findall("member") if member.attrib["type"] == "way" and member.attrib.get("role") in ["outer", "inner", ""]]
+            relations.append({"tags": tags, "members": members})
+        else:
+            continue
+        # keeps memory use low for large files
+        element.clear()
+    returned = []
+    for relation in relations:
+        codes = codes_from_properties(relation["tags"])
+        if len(codes) == 0:
+            continue
+        member_ways = [ways[way_id] for way_id in relation["members"] if way_id in ways]
+        rings = []
+        for ring in assemble_rings(member_ways):
+            if all(node_id in nodes for node_id in ring):
+                rings.append([nodes[node_id] for node_id in ring])
+        if len(rings) > 0:
+            returned.append({"codes": codes, "rings": rings})
+    return returned
+
+def assemble_rings(way_node_lists):
+    # joins ways sharing end nodes into closed rings
+    # ways that do not form closed ring are skipped
+    unused = [list(way) for way in way_node_lists if len(way) >= 2]
+    rings = []
+    while len(unused) > 0:
+        ring = unused.pop(0)
+        while ring[0] != ring[-1]:
+            for index, way in enumerate(unused):
+                if way[0] == ring[-1]:
+                    ring += way[1:]
+                elif way[-1] == ring[-1]:
+                    ring += way[::-1][1:]
+                else:
+                    continue
+                unused.pop(index)
+                break
+            else:
+                # not closed
+                ring = None
+                break
+        if ring != None:
+            rings.append(ring)
+    return rings
+
+def build_index(boundaries):
+    cell_size = grid_cell_size_in_degrees()
+    index = {"boundaries": [], "cells": {}}
+    for boundary in boundaries:
+        prepared = prepare_boundary(boundary)
+        boundary_number = len(index["boundaries"])
+        index["boundaries"].append(prepared)
+        min_lon, min_lat, max_lon, max_lat = prepared["bbox"]
+        for x in range(math.floor(min_lon / cell_size), math.floor(max_lon / cell_size) + 1):
+            for y in range(math.floor(min_lat / cell_size), math.floor(max_lat / cell_size) + 1):
+                if (x, y) not in index["cells"]:
+                    index["cells"][(x, y)] = []
+                index["cells"][(x, y)].append(boundary_number)
+    return index
+
+def prepare_boundary(boundary):
+    band_height = band_height_in_degrees()
+    bands = {}
+    min_lon = min_lat = math.inf
+    max_lon = max_lat = -math.inf
+    for ring in boundary["rings"]:
+        for i in range(len(ring)):
+            start = ring[i]
+            end = ring[(i + 1) % len(ring)]
+            if start == end:
+                continue
+            min_lon = min(min_lon, start[0])
+            max_lon = max(max_lon, start[0])
+            min_lat = min(min_lat, start[1])
+            max_lat = max(max_lat, start[1])
+            if start[1] == end[1]:
+                # horizontal edge never crosses horizontal ray
+                continue
+            for band in range(math.floor(min(start[1], end[1]) / band_height), math.floor(max(start[1], end[1]) / band_height) + 1):
+                if band not in bands:
+                    bands[band] = []
+                bands[band].append((start[0], start[1], end[0], end[1]))
+    return {"codes": boundary["codes"], "bbox": (min_lon, min_lat, max_lon, max_lat), "bands": bands}
+
+def is_inside_boundary(prepared, lat, lon):
+    min_lon, min_lat, max_lon, max_lat = prepared["bbox"]
+    if lon < min_lon or lon > max_lon or lat < min_lat or lat > max_lat:
+        return False
+    # ray casting towards east, even-odd rule
+    inside = False
+    for x1, y1, x2, y2 in prepared["bands"].get(math.floor(lat / band_height_in_degrees()), []):
+        if (y1 > lat) != (y2 > lat):
+            crossing_lon = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+            if crossing_lon > lon:
+                inside = not inside
+    return inside
+
+def codes_at(index, lat, lon):
+    # returns list of codes of boundaries containing given location
+    cell_size = grid_cell_size_in_degrees()
+    returned = []
+    for boundary_number in index["cells"].get((math.floor(lon / cell_size), math.floor(lat / cell_size)), []):
+        prepared = index["boundaries"][boundary_number]
+        if is_inside_boundary(prepared, lat, lon):
+            returned += prepared["codes"]
+    return returned
+
+def is_within(index, lat, lon, code):
+    return code.lower() in codes_at(index, lat, lon)
+
+def are_all_within(index, coordinates, code):
+    # coordinates is list of (lat, lon)
+    for lat, lon in coordinates:
+        if is_within(index, lat, lon, code) == False:
+            return False
+    return True
+
+def load_index(filepath):
+    return build_index(load_boundaries(filepath))
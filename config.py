@@ -2,15 +2,126 @@ import yaml
 import pwd
 import os
 
+# parsed YAML files are cached and parsed again only when file was modified
+# returned data is shared between callers, it must not be modified
+parsed_yaml_files = {}
+
+# lookups for entries in regions_processed.yaml, rebuilt when entries change
+region_lookups = {}
+
 def get_entries_to_process():
-    return parse_yaml_file("regions_processed.yaml")
+    entries = parse_yaml_file("regions_processed.yaml")
+    if region_lookups.get("validated_entries") is not entries:
+        validate_entries(entries)
+        region_lookups["validated_entries"] = entries
+    return entries
+
+def get_visible_entries_to_process():
+    # entries without hidden: true
+    return get_region_lookups()["visible"]
+
+def get_entry_by_internal_region_name(internal_region_name):
+    # returns None if there is no such entry
+    return get_region_lookups()["by_internal_region_name"].get(internal_region_name)
+
+def get_entries_by_merged_group():
+    # dictionary with name of merged group as key and list of its entries as value
+    # (hidden entries included), in order of appearance in regions_processed.yaml
+    return get_region_lookups()["by_merged_group"]
+
+def get_entries_by_language_code():
+    # dictionary with language_code as key (None for entries without it) and list of entries as value
+    return get_region_lookups()["by_language_code"]
+
+def get_region_lookups():
+    entries = get_entries_to_process()
+    if region_lookups.get("entries") is not entries:
+        lookups = {"visible": [], "by_internal_region_name": {}, "by_merged_group": {}, "by_language_code": {}}
+        for entry in entries:
+            if entry.get("hidden", False) != True:
+                lookups["visible"].append(entry)
+            lookups["by_internal_region_name"][entry['internal_region_name']] = entry
+            for parent in entry.get('merged_into', None) or []:
+                if parent not in lookups["by_merged_group"]:
+                    lookups["by_merged_group"][parent] = []
+                lookups["by_merged_group"][parent].append(entry)
+            language_code = entry.get('language_code', None)
+            if language_code not in lookups["by_language_code"]:
+                lookups["by_language_code"][language_code] = []
+            lookups["by_language_code"][language_code].append(entry)
+        region_lookups["lookups"] = lookups
+        region_lookups["entries"] = entries
+    return region_lookups["lookups"]
+
+def required_entry_keys():
+    return {"internal_region_name": [str], "website_main_title_part": [str], "identifier": [dict]}
+
+def optional_entry_keys():
+    return {
+        "language_code": [str, type(None)],
+        "merged_into": [list],
+        "requested_by": [str],
+        "priority_multiplier": [int, float],
+        "ignored_problems": [list],
+        "hidden": [bool],
+        "download_format": [str],
+    }
+
+def download_formats():
+    # format of Overpass output used to download data of area, see load_osm_file.streaming_of_osm_file
+    # xml is used if download_format is not specified
+    return ["xml", "json"]
+
+def validate_entries(entries):
+    # raises exception describing the first problem found in regions_processed.yaml
+    if type(entries) != list:
+        raise Exception("regions_processed.yaml should contain list of entries")
+    internal_region_names = set()
+    website_main_title_parts = set()
+    for entry in entries:
+        if type(entry) != dict:
+            raise Exception("entry should be a dictionary, got " + str(entry))
+        for key, allowed_types in required_entry_keys().items():
+            if key not in entry:
+                raise Exception(key + " missing in " + str(entry))
+        for key, value in entry.items():
+            allowed_types = required_entry_keys().get(key, optional_entry_keys().get(key))
+            if allowed_types == None:
+                raise Exception("unexpected key " + key + " in " + str(entry))
+            if type(value) not in allowed_types:
+                raise Exception(key + " has unexpected value " + str(value) + " in " + str(entry))
+        for key in ["merged_into", "ignored_problems"]:
+            for value in entry.get(key, []):
+                if type(value) != str:
+                    raise Exception(key + " should be a list of texts in " + str(entry))
+        if entry.get("download_format", "xml") not in download_formats():
+            raise Exception("download_format should be one of " + str(download_formats()) + " in " + str(entry))
+        # used in filenames
+        if "/" in entry['internal_region_name']:
+            raise Exception("/ in " + entry['internal_region_name'])
+        if "/" in entry['website_main_title_part']:
+            raise Exception("/ in " + entry['website_main_title_part'])
+        if entry['internal_region_name'] in internal_region_names:
+            raise Exception("duplicated internal_region_name " + entry['internal_region_name'])
+        if entry['website_main_title_part'] in website_main_title_parts:
+            raise Exception("duplicated website_main_title_part " + entry['website_main_title_part'])
+        internal_region_names.add(entry['internal_region_name'])
+        website_main_title_parts.add(entry['website_main_title_part'])
+
+def yaml_loader():
+    # C implementation (using libyaml) is many times faster, it is not always available
+    return getattr(yaml, "CFullLoader", yaml.FullLoader)
 
 def parse_yaml_file(filename):
+    stat = os.stat(filename)
+    state = (stat.st_mtime_ns, stat.st_size)
+    cached = parsed_yaml_files.get(filename)
+    if cached != None and cached["state"] == state:
+        return cached["data"]
     with open(filename, 'r') as stream:
-        try:
-            return yaml.full_load(stream)
-        except yaml.YAMLError as exc:
-            raise(exc)
+        data = yaml.load(stream, Loader=yaml_loader())
+    parsed_yaml_files[filename] = {"state": state, "data": data}
+    return data
 
 def downloaded_osm_data_location():
     return parse_yaml_file("cache_config.yaml")["downloaded_osm_file_storage_location"]
@@ -22,7 +133,43 @@ def get_wikimedia_connection_cache_location():
     return parse_yaml_file("cache_config.yaml")['wikimedia_connection_library_cache']
 
 def user_agent():
-  "wikipedia/wikidata tag validator, operated by " + pwd.getpwuid(os.getuid()).pw_name + " username, written by Mateusz Konieczny (matkoniecz@gmail.com)"
+  return "wikipedia/wikidata tag validator, operated by " + pwd.getpwuid(os.getuid()).pw_name + " username, written by Mateusz Konieczny (matkoniecz@gmail.com)"
+
+def boundaries_filepath():
+    # GeoJSON or .osm file with country and region boundaries, see boundary_index.py
+    # None if not configured
+    return parse_yaml_file("cache_config.yaml").get('boundaries_filepath', None)
+
+def reverse_geocode_cache_filepath():
+    # see geocode_cache.py, by default placed next to the main database
+    default = os.path.join(os.path.dirname(database_filepath()), "reverse_geocode_cache.db")
+    return parse_yaml_file("cache_config.yaml").get('reverse_geocode_cache_filepath', default)
+
+def reverse_geocode_cache_precision():
+    # number of decimal places of coordinates used as cache key
+    return parse_yaml_file("cache_config.yaml").get('reverse_geocode_cache_precision', 4)
+
+def reverse_geocode_cache_maximum_age_in_seconds():
+    # borders change rarely
+    return parse_yaml_file("cache_config.yaml").get('reverse_geocode_cache_maximum_age_in_days', 180) * 24 * 60 * 60
+
+def replication_source():
+    # directory or URL with OSM replication diffs, see replication_diff.py
+    # None if areas should be updated with Overpass queries
+    return parse_yaml_file("cache_config.yaml").get('replication_source', None)
+
+def download_archive_location():
+    # directory with archive of downloaded files, see download_archive.py
+    # None if downloaded files should not be kept
+    default = os.path.join(downloaded_osm_data_location(), "archive")
+    return parse_yaml_file("cache_config.yaml").get('download_archive_location', default)
+
+def download_archive_maximum_size_in_bytes():
+    return parse_yaml_file("cache_config.yaml").get('download_archive_maximum_size_in_gigabytes', 20) * 1000 * 1000 * 1000
+
+def validation_worker_count():
+    # number of processes used to validate objects, 1 means that validation runs in the main process
+    return parse_yaml_file("cache_config.yaml").get('validation_worker_count', 1)
 
 def get_report_directory():
     return parse_yaml_file("cache_config.yaml")['validator_report_repository_location']
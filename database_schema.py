@@ -0,0 +1,112 @@
+import sqlite3
+import error_statistics
+
+# tables used by script.py, tests and benchmarks create them with create_tables
+# so they do not keep separate copies of the schema
+
+def existing_tables(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    table_listing = cursor.fetchall()
+    returned = []
+    for entry in table_listing:
+        returned.append(entry[0])
+    return returned
+
+def existing_indexes(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index';")
+    index_listing = cursor.fetchall()
+    returned = []
+    for entry in index_listing:
+        returned.append(entry[0])
+    return returned
+
+def existing_columns(cursor, table):
+    cursor.execute("SELECT name FROM pragma_table_info(:table)", {"table": table})
+    returned = []
+    for entry in cursor.fetchall():
+        returned.append(entry[0])
+    return returned
+
+def create_tables(cursor):
+    # creates tables that are missing, existing ones are left as they are
+    # (see script.migrate_database_if_needed for changes of existing tables)
+    if "osm_objects" in existing_tables(cursor):
+        print("osm_objects table exists already, delete file with database to recreate")
+    else:
+        # see object_store.py
+        #
+        # validator_complaint needs to hold
+        # - not checked
+        # - checked, no problem found
+        # - error data
+        #
+        # right now for "checked, no error" I plan to use empty string but I am not too happy
+        # status allows to query it without looking at validator_complaint, see report_status.py
+        cursor.execute('''CREATE TABLE osm_objects
+                    (type text, id integer, language_code text, lat float, lon float, tags text, download_timestamp integer, validator_complaint text, error_id text, validation_input_hash text, status integer, PRIMARY KEY (type, id, language_code))''')
+        cursor.execute("""CREATE INDEX idx_osm_objects_status ON osm_objects (status);""")
+        cursor.execute("""CREATE INDEX idx_osm_objects_error_id ON osm_objects (error_id);""")
+    if "osm_object_areas" in existing_tables(cursor):
+        print("osm_object_areas table exists already, delete file with database to recreate")
+    else:
+        # areas where given object is present
+        cursor.execute('''CREATE TABLE osm_object_areas
+                    (area_identifier text, type text, id integer, language_code text, download_timestamp integer, PRIMARY KEY (area_identifier, type, id))''')
+        cursor.execute("""CREATE INDEX idx_osm_object_areas_object ON osm_object_areas (type, id, language_code);""")
+    if "osm_data_update_log" in existing_tables(cursor):
+        print("osm_data_update_log table exists already, delete file with database to recreate")
+    else:
+        # register when data was downloaded so update can be done without downloading
+        # and processing the entire dataset
+        #
+        # instead just entries that were changed since then
+        # - and carry *(wikipedia|wikidata)* tags
+        # - that previously had problem reported about them
+        # should be downloaded
+        #
+        # archive_key identifies downloaded file in archive, see download_archive.py
+        cursor.execute('''CREATE TABLE osm_data_update_log
+                    (area_identifier text, filename text, download_type text, download_timestamp integer, archive_key text)''')
+    if "validation_cache" in existing_tables(cursor):
+        print("validation_cache table exists already, delete file with database to recreate")
+    else:
+        # see validation_cache.py
+        cursor.execute('''CREATE TABLE validation_cache
+                    (cache_key text PRIMARY KEY, validator_version text, validation_result text, cached_timestamp integer)''')
+    if "error_statistics" in existing_tables(cursor):
+        print("error_statistics table exists already, delete file with database to recreate")
+    else:
+        # see error_statistics.py
+        # for already existing database counts are calculated from present data
+        error_statistics.create_table_and_triggers(cursor)
+        error_statistics.rebuild(cursor)
+    if "replication_state" in existing_tables(cursor):
+        print("replication_state table exists already, delete file with database to recreate")
+    else:
+        # last applied replication diff, see replication_diff.py
+        cursor.execute('''CREATE TABLE replication_state
+                    (source text PRIMARY KEY, sequence_number integer, timestamp integer)''')
+    if "render_state" in existing_tables(cursor):
+        print("render_state table exists already, delete file with database to recreate")
+    else:
+        # fingerprints of reports used to generate given page
+        # allows to skip regenerating pages where nothing changed
+        # primary_report_count allows to update index page without recounting reports of all areas
+        cursor.execute('''CREATE TABLE render_state
+                    (page_identifier text PRIMARY KEY, fingerprint text, rendered_timestamp integer, primary_report_count integer)''')
+
+def create_in_memory_database():
+    # returns cursor of a new database with all tables, used by tests
+    connection = sqlite3.connect(":memory:")
+    cursor = connection.cursor()
+    create_tables(cursor)
+    return cursor
+
+def create_legacy_osm_data_table(cursor):
+    # osm_data in the last form it had, before being split into osm_objects and osm_object_areas
+    # (see script.migrate_osm_data_table), such tables are still present in older databases
+    cursor.execute('''CREATE TABLE osm_data
+                (type text, id number, lat float, lon float, tags text, area_identifier text, download_timestamp integer, validator_complaint text, error_id text, validation_input_hash text, status integer)''')
+    cursor.execute("""CREATE UNIQUE INDEX idx_osm_data_unique_object ON osm_data (type, id, area_identifier);""")
+    cursor.execute("""CREATE INDEX idx_osm_data_area_identifier_status ON osm_data (area_identifier, status);""")
+    cursor.execute("""CREATE INDEX idx_osm_data_error_id_area_identifier ON osm_data (error_id, area_identifier);""")
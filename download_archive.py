@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import os
+import shutil
+import load_osm_file
+import object_store
+import replication_diff
+
+# downloaded .osm files are kept in a compressed archive, so data of an area can be
+# rebuilt without downloading it again from Overpass (see replay_area)
+#
+# files are content-addressed - named by sha256 of uncompressed content, so identical
+# downloads (for example empty updates) are stored once
+# key of archived file is recorded in archive_key column of osm_data_update_log,
+# together with area, download type and timestamp of the download
+#
+# replay covers data loaded from downloaded files, changes made by replication diffs
+# are not archived - areas updated with them cannot be replayed (see replay_chain)
+#
+# retention (see apply_retention) keeps archive below given size, removing the oldest
+# files first - files needed to replay current data of any area are kept
+
+def archive_filepath(location, archive_key):
+    # subdirectories keep number of files in a single directory low
+    return os.path.join(location, archive_key[0:2], archive_key + ".osm.gz")
+
+def content_key(filepath):
+    hashed = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            hashed.update(chunk)
+    return hashed.hexdigest()
+
+def store(location, filepath):
+    # returns archive key of the file
+    archive_key = content_key(filepath)
+    destination = archive_filepath(location, archive_key)
+    if os.path.exists(destination):
+        return archive_key
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    # written under temporary name first, so interrupted write does not leave broken file behind
+    work_filepath = destination + ".in_progress"
+    with open(filepath, 'rb') as source:
+        with gzip.open(work_filepath, 'wb') as compressed:
+            shutil.copyfileobj(source, compressed)
+    os.replace(work_filepath, destination)
+    return archive_key
+
+def extract(location, archive_key, filepath):
+    source_filepath = archive_filepath(location, archive_key)
+    if os.path.exists(source_filepath) == False:
+        raise Exception("archived file " + source_filepath + " is missing")
+    with gzip.open(source_filepath, 'rb') as compressed:
+        with open(filepath, 'wb') as output:
+            shutil.copyfileobj(compressed, output)
+
+def download_chain(cursor, internal_region_name):
+    # returns list of (download_type, download_timestamp, archive_key) with the latest full download
+    # of area and updates loaded after it, empty if area was never downloaded
+    # entries without file (update skipped as nothing changed) are not listed
+    # replication diffs are listed, they are never archived
+    cursor.execute("""SELECT download_type, download_timestamp, archive_key FROM osm_data_update_log
+    WHERE area_identifier = :identifier AND (filename IS NOT NULL OR download_type = :replication) AND download_timestamp >= (
+        SELECT MAX(download_timestamp) FROM osm_data_update_log WHERE area_identifier = :identifier AND download_type = 'initial_full_data'
+    )
+    ORDER BY download_timestamp""", {"identifier": internal_region_name, "replication": replication_diff.replication_download_type()})
+    return cursor.fetchall()
+
+def is_replayable(chain):
+    return len(chain) > 0 and all(archive_key != None for download_type, download_timestamp, archive_key in chain)
+
+def replay_chain(cursor, internal_region_name):
+    # download_chain, raises exception if it cannot be replayed
+    chain = download_chain(cursor, internal_region_name)
+    if len(chain) == 0:
+        raise Exception("there is no full download of " + internal_region_name + " in osm_data_update_log")
+    for download_type, download_timestamp, archive_key in chain:
+        if archive_key == None:
+            raise Exception(internal_region_name + " cannot be replayed, " + download_type + " from " + str(download_timestamp) + " is not archived")
+    return chain
+
+def replay_area(cursor, location, internal_region_name, language_code, work_filepath):
+    # rebuilds osm_objects and osm_object_areas for given area from archived files, without network access
+    # objects keep newer data obtained in other areas
+    # returns number of replayed files
+    chain = replay_chain(cursor, internal_region_name)
+    for download_type, download_timestamp, archive_key in chain:
+        if os.path.exists(archive_filepath(location, archive_key)) == False:
+            raise Exception(internal_region_name + " cannot be replayed, archived file " + archive_filepath(location, archive_key) + " is missing")
+    previous_members = object_store.remove_area_membership(cursor, internal_region_name)
+    for download_type, download_timestamp, archive_key in chain:
+        print("replaying", download_type, "from", download_timestamp, "for", internal_region_name)
+        extract(location, archive_key, work_filepath)
+        try:
+            load_osm_file.load_osm_file(cursor, work_filepath, internal_region_name, download_timestamp, language_code)
+        finally:
+            os.remove(work_filepath)
+    object_store.remove_orphaned_objects(cursor, previous_members)
+    return len(chain)
+
+def stored_files(location):
+    # returns dictionary with archive key as key and size in bytes as value
+    returned = {}
+    if os.path.exists(location) == False:
+        return returned
+    for directory in os.listdir(location):
+        directory_path = os.path.join(location, directory)
+        if os.path.isdir(directory_path) == False:
+            continue
+        for filename in os.listdir(directory_path):
+            if filename.endswith(".osm.gz"):
+                returned[filename.removesuffix(".osm.gz")] = os.path.getsize(os.path.join(directory_path, filename))
+    return returned
+
+def needed_keys(cursor):
+    # archive keys needed to replay current data of each area
+    cursor.execute("SELECT DISTINCT area_identifier FROM osm_data_update_log")
+    returned = set()
+    for (area_identifier,) in cursor.fetchall():
+        chain = download_chain(cursor, area_identifier)
+        if is_replayable(chain) == False:
+            # files are useless for replay anyway
+            continue
+        for download_type, download_timestamp, archive_key in chain:
+            returned.add(archive_key)
+    return returned
+
+def apply_retention(cursor, location, maximum_size_in_bytes):
+    # returns number of removed files
+    files = stored_files(location)
+    total_size = sum(files.values())
+    if total_size <= maximum_size_in_bytes:
+        return 0
+    needed = needed_keys(cursor)
+    cursor.execute("SELECT archive_key, MAX(download_timestamp) FROM osm_data_update_log WHERE archive_key IS NOT NULL GROUP BY archive_key")
+    last_use = {archive_key: timestamp for archive_key, timestamp in cursor.fetchall()}
+    # files not listed in osm_data_update_log (left by interrupted runs) are removed first
+    candidates = sorted([archive_key for archive_key in files.keys() if archive_key not in needed], key=lambda archive_key: last_use.get(archive_key, 0))
+    removed = 0
+    for archive_key in candidates:
+        if total_size <= maximum_size_in_bytes:
+            break
+        os.remove(archive_filepath(location, archive_key))
+        cursor.execute("UPDATE osm_data_update_log SET archive_key = NULL WHERE archive_key = :archive_key", {"archive_key": archive_key})
+        total_size -= files[archive_key]
+        removed += 1
+    if total_size > maximum_size_in_bytes:
+        print("archive of downloads takes", total_size, "bytes, files needed to replay current data of areas exceed limit of", maximum_size_in_bytes, "bytes")
+    return removed
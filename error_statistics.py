@@ -0,0 +1,149 @@
+import time
+import object_store
+
+# error_statistics table holds count of reports for each area and error_id
+# so index page and merged pages do not need to fetch all complaints to count them
+#
+# it is maintained by triggers on osm_objects and osm_object_areas (see object_store.py),
+# so it is updated within the same transaction as any change of them - no matter whether
+# it is done by update_problem_for_entry, load_osm_file upsert or deletion of outdated data
+#
+# report of an object is counted in each area where object is present
+# only objects with actual report (not unchecked, not checked without problem) are counted
+
+def reported_condition(row):
+    # row is NEW or OLD or name of osm_objects table
+    return row + ".validator_complaint IS NOT NULL AND " + row + ".validator_complaint <> '' AND " + row + ".error_id IS NOT NULL"
+
+def same_object_condition(row):
+    return "osm_object_areas.type = " + row + ".type AND osm_object_areas.id = " + row + ".id AND osm_object_areas.language_code = " + row + ".language_code"
+
+def same_membership_condition(row):
+    return "osm_objects.type = " + row + ".type AND osm_objects.id = " + row + ".id AND osm_objects.language_code = " + row + ".language_code"
+
+def now_sql():
+    return "CAST(strftime('%s', 'now') AS integer)"
+
+def add_statement(select):
+    # select returns (area_identifier, error_id) pairs, each is counted once
+    # WHERE in select is needed to parse upsert following it
+    return """INSERT INTO error_statistics (area_identifier, error_id, count, last_changed)
+            """ + select + """
+            ON CONFLICT (area_identifier, error_id) DO UPDATE SET count = count + 1, last_changed = excluded.last_changed;"""
+
+def remove_statements(area_condition, error_id):
+    return """UPDATE error_statistics SET count = count - 1, last_changed = """ + now_sql() + """
+            WHERE """ + area_condition + """ AND error_id = """ + error_id + """;
+            DELETE FROM error_statistics WHERE """ + area_condition + """ AND error_id = """ + error_id + """ AND count <= 0;"""
+
+def add_report_statement(row):
+    # report of object in row is counted in all its areas
+    return add_statement("SELECT area_identifier, " + row + ".error_id, 1, " + now_sql() + " FROM osm_object_areas WHERE " + same_object_condition(row))
+
+def remove_report_statements(row):
+    return remove_statements("area_identifier IN (SELECT area_identifier FROM osm_object_areas WHERE " + same_object_condition(row) + ")", row + ".error_id")
+
+def add_membership_statement(row):
+    # report of object (if any) is counted in area of row
+    return add_statement("SELECT " + row + ".area_identifier, error_id, 1, " + now_sql() + " FROM osm_objects WHERE " + same_membership_condition(row) + " AND " + reported_condition("osm_objects"))
+
+def remove_membership_statements(row):
+    error_id = "(SELECT error_id FROM osm_objects WHERE " + same_membership_condition(row) + " AND " + reported_condition("osm_objects") + ")"
+    return remove_statements("area_identifier = " + row + ".area_identifier", error_id)
+
+def create_table_and_triggers(cursor):
+    cursor.execute('''CREATE TABLE error_statistics
+                (area_identifier text, error_id text, count integer, last_changed integer, PRIMARY KEY (area_identifier, error_id))''')
+    create_triggers(cursor)
+
+def create_triggers(cursor):
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS error_statistics_after_object_insert AFTER INSERT ON osm_objects
+        WHEN """ + reported_condition("NEW") + """
+        BEGIN
+            """ + add_report_statement("NEW") + """
+        END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS error_statistics_after_object_delete AFTER DELETE ON osm_objects
+        WHEN """ + reported_condition("OLD") + """
+        BEGIN
+            """ + remove_report_statements("OLD") + """
+        END""")
+    # update changing report to other one with the same error_id does not change counts
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS error_statistics_after_object_update_remove AFTER UPDATE OF validator_complaint, error_id ON osm_objects
+        WHEN (""" + reported_condition("OLD") + """) AND NOT ((""" + reported_condition("NEW") + """) AND OLD.error_id IS NEW.error_id)
+        BEGIN
+            """ + remove_report_statements("OLD") + """
+        END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS error_statistics_after_object_update_add AFTER UPDATE OF validator_complaint, error_id ON osm_objects
+        WHEN (""" + reported_condition("NEW") + """) AND NOT ((""" + reported_condition("OLD") + """) AND OLD.error_id IS NEW.error_id)
+        BEGIN
+            """ + add_report_statement("NEW") + """
+        END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS error_statistics_after_membership_insert AFTER INSERT ON osm_object_areas
+        BEGIN
+            """ + add_membership_statement("NEW") + """
+        END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS error_statistics_after_membership_delete AFTER DELETE ON osm_object_areas
+        BEGIN
+            """ + remove_membership_statements("OLD") + """
+        END""")
+    # membership may be switched to object validated for other language
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS error_statistics_after_membership_update AFTER UPDATE OF area_identifier, language_code ON osm_object_areas
+        WHEN OLD.area_identifier IS NOT NEW.area_identifier OR OLD.language_code IS NOT NEW.language_code
+        BEGIN
+            """ + remove_membership_statements("OLD") + """
+            """ + add_membership_statement("NEW") + """
+        END""")
+
+def counts_from_reports(cursor):
+    # returns dictionary with (area_identifier, error_id) as key and count as value
+    cursor.execute("""SELECT osm_object_areas.area_identifier, osm_objects.error_id, COUNT(*) FROM """ + object_store.area_join() + """
+    WHERE """ + reported_condition("osm_objects") + """
+    GROUP BY osm_object_areas.area_identifier, osm_objects.error_id""")
+    returned = {}
+    for area_identifier, error_id, count in cursor.fetchall():
+        returned[(area_identifier, error_id)] = count
+    return returned
+
+def stored_counts(cursor):
+    cursor.execute("SELECT area_identifier, error_id, count FROM error_statistics")
+    returned = {}
+    for area_identifier, error_id, count in cursor.fetchall():
+        returned[(area_identifier, error_id)] = count
+    return returned
+
+def rebuild(cursor):
+    cursor.execute("DELETE FROM error_statistics")
+    timestamp = int(time.time())
+    for (area_identifier, error_id), count in counts_from_reports(cursor).items():
+        cursor.execute("INSERT INTO error_statistics (area_identifier, error_id, count, last_changed) VALUES (:area_identifier, :error_id, :count, :last_changed)", {"area_identifier": area_identifier, "error_id": error_id, "count": count, "last_changed": timestamp})
+
+def inconsistencies(cursor):
+    # returns list of (area_identifier, error_id, stored count, actual count)
+    # empty list means that error_statistics matches stored reports
+    actual = counts_from_reports(cursor)
+    stored = stored_counts(cursor)
+    returned = []
+    for key in sorted(set(actual.keys()) | set(stored.keys())):
+        if actual.get(key, 0) != stored.get(key, 0):
+            returned.append((key[0], key[1], stored.get(key, 0), actual.get(key, 0)))
+    return returned
+
+def check_and_repair(cursor):
+    # returns True if error_statistics was consistent with stored reports
+    found = inconsistencies(cursor)
+    for area_identifier, error_id, stored_count, actual_count in found:
+        print("error_statistics mismatch for", area_identifier, error_id, "- stored", stored_count, "actual", actual_count)
+    if len(found) == 0:
+        return True
+    print("rebuilding error_statistics from stored reports")
+    rebuild(cursor)
+    return False
+
+def report_count(cursor, internal_region_name, error_ids, ignored_problems=[]):
+    # count of reports of listed types in given area
+    cursor.execute("SELECT error_id, count FROM error_statistics WHERE area_identifier = :identifier", {"identifier": internal_region_name})
+    returned = 0
+    for error_id, count in cursor.fetchall():
+        if error_id in error_ids and error_id not in ignored_problems:
+            returned += count
+    return returned
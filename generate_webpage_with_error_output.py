@@ -5,22 +5,81 @@ import datetime
 import pprint
 import json
 import sqlite3
+import hashlib
+import functools
 
 import config
 import obtain_from_overpass
-
-def generate_website_file_for_given_area(cursor, entry):
-    reports = reports_for_given_area(cursor, entry['internal_region_name'])
+import error_statistics
+import report_status
+import osm_data_storage
+import object_store
+
+def generate_website_file_for_given_area(cursor, entry, force=False):
+    # skipped if reports did not change since the last time page was generated
+    # unless force is set
+    raw_reports = raw_reports_for_given_area(cursor, entry['internal_region_name'])
     website_main_title_part = entry['website_main_title_part']
     timestamps = [obtain_from_overpass.get_data_timestamp(cursor, entry['internal_region_name'])]
     ignored_problems = entry.get('ignored_problems', [])
+    fingerprint = page_fingerprint(raw_reports, timestamps, ignored_problems)
+    if force == False and is_page_up_to_date(cursor, website_main_title_part, fingerprint):
+        return
+    reports = [osm_data_storage.rehydrated_report(*raw_report) for raw_report in raw_reports]
     generate_output_for_given_area(website_main_title_part, reports, timestamps, ignored_problems)
+    primary_report_count = human_review_problem_count_for_given_internal_region_name(cursor, entry['internal_region_name'])
+    store_page_state(cursor, website_main_title_part, fingerprint, primary_report_count)
 
 def reports_for_given_area(cursor, internal_region_name):
-    query = "SELECT rowid, type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id FROM osm_data WHERE area_identifier = :identifier AND validator_complaint IS NOT NULL AND validator_complaint <> ''"
-    query_parameters = {"identifier": internal_region_name}
+    query = "SELECT osm_objects.rowid, osm_objects.type, osm_objects.id, osm_objects.lat, osm_objects.lon, osm_objects.tags, osm_object_areas.area_identifier, osm_objects.download_timestamp, osm_objects.validator_complaint, osm_objects.error_id FROM " + object_store.area_join() + " WHERE osm_object_areas.area_identifier = :identifier AND osm_objects.status = :reported"
+    query_parameters = {"identifier": internal_region_name, "reported": report_status.reported()}
     return query_to_reports_data(cursor, query, query_parameters)
 
+def raw_reports_for_given_area(cursor, internal_region_name):
+    # list of (type, id, tags, validator_complaint), not parsed
+    # see osm_data_storage.rehydrated_report
+    cursor.execute("SELECT osm_objects.type, osm_objects.id, osm_objects.tags, osm_objects.validator_complaint FROM " + object_store.area_join() + " WHERE osm_object_areas.area_identifier = :identifier AND osm_objects.status = :reported", {"identifier": internal_region_name, "reported": report_status.reported()})
+    return cursor.fetchall()
+
+@functools.lru_cache(maxsize=None)
+def renderer_version():
+    # any change in page generation code invalidates stored fingerprints
+    with open(__file__, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def page_fingerprint(raw_reports, timestamps_of_data, ignored_problem_codes):
+    # covers everything that affects content of generated pages
+    hashed = hashlib.sha256()
+    hashed.update(renderer_version().encode('utf-8'))
+    hashed.update(timestamp_listing(timestamps_of_data).encode('utf-8'))
+    hashed.update(json.dumps(sorted(ignored_problem_codes)).encode('utf-8'))
+    for raw_report in sorted(raw_reports):
+        hashed.update(b"\n")
+        hashed.update(json.dumps(raw_report).encode('utf-8'))
+    return hashed.hexdigest()
+
+def is_page_up_to_date(cursor, main_output_name_part, fingerprint):
+    if not os.path.isfile(config.get_report_directory() + '/' + main_output_name_part + ".html"):
+        return False
+    cursor.execute("SELECT fingerprint, primary_report_count FROM render_state WHERE page_identifier = :page_identifier", {"page_identifier": main_output_name_part})
+    returned = cursor.fetchall()
+    if len(returned) == 0:
+        return False
+    stored_fingerprint, primary_report_count = returned[0]
+    return stored_fingerprint == fingerprint and primary_report_count != None
+
+def store_page_state(cursor, main_output_name_part, fingerprint, primary_report_count):
+    # primary_report_count is count of reports requiring human review, displayed on index page
+    cursor.execute("INSERT OR REPLACE INTO render_state (page_identifier, fingerprint, rendered_timestamp, primary_report_count) VALUES (:page_identifier, :fingerprint, :rendered_timestamp, :primary_report_count)", {"page_identifier": main_output_name_part, "fingerprint": fingerprint, "rendered_timestamp": int(datetime.datetime.now().timestamp()), "primary_report_count": primary_report_count})
+
+def stored_primary_report_count(cursor, main_output_name_part):
+    # returns None if it is not known
+    cursor.execute("SELECT primary_report_count FROM render_state WHERE page_identifier = :page_identifier", {"page_identifier": main_output_name_part})
+    returned = cursor.fetchall()
+    if len(returned) == 0:
+        return None
+    return returned[0][0]
+
 def query_to_reports_data(cursor, query, query_parameters):
     try:
         cursor.execute(query, query_parameters)
@@ -28,9 +87,7 @@ def query_to_reports_data(cursor, query, query_parameters):
         reports = []
         for entry in returned:
             rowid, object_type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id = entry
-            tags = json.loads(tags)
-            validator_complaint = json.loads(validator_complaint)
-            reports.append(validator_complaint)
+            reports.append(osm_data_storage.rehydrated_report(object_type, id, tags, validator_complaint))
         return reports
     except sqlite3.DatabaseError as e:
         print(query)
@@ -38,69 +95,78 @@ def query_to_reports_data(cursor, query, query_parameters):
         raise e
 
 def generate_output_for_given_area(main_output_name_part, reports_data, timestamps_of_data, ignored_problem_codes):
+    # reports are sorted and split by error_id once, all pages are generated from these buckets
+    reports_by_error_id = group_reports_by_error_id(reports_data)
+
     filepath = config.get_report_directory() + '/' + main_output_name_part + ".html"
     issues = for_review()
     issues_without_skipped = [i for i in issues if i not in ignored_problem_codes]
-    main_report_count = generate_html_file(reports_data, filepath, issues_without_skipped, "Remember to check whatever edit makes sense! All reports are at this page because this tasks require human judgment to verify whatever proposed edit makes sense.", timestamps_of_data)
+    main_report_count = generate_html_file(reports_data, filepath, issues_without_skipped, "Remember to check whatever edit makes sense! All reports are at this page because this tasks require human judgment to verify whatever proposed edit makes sense.", timestamps_of_data, reports_by_error_id)
 
     issues = obvious_fixes()
     issues_without_skipped = [i for i in issues if i not in ignored_problem_codes]
     filepath = config.get_report_directory() + '/' + main_output_name_part + " - obvious.html"
-    generate_html_file(reports_data, filepath, issues_without_skipped, "Proposed edits at this page are so obvious that automatic edit makes sense.", timestamps_of_data)
+    generate_html_file(reports_data, filepath, issues_without_skipped, "Proposed edits at this page are so obvious that automatic edit makes sense.", timestamps_of_data, reports_by_error_id)
 
     filepath = config.get_report_directory() + '/' + main_output_name_part + " - test.html"
-    generate_test_issue_listing(reports_data, timestamps_of_data, filepath, ignored_problem_codes)
+    generate_test_issue_listing(reports_data, timestamps_of_data, filepath, ignored_problem_codes, reports_by_error_id)
 
     note_unused_errors(reports_data, main_output_name_part)
     return main_report_count
 
-def generate_test_issue_listing(reports_data, timestamps_of_data, filepath, ignored_problem_codes):
+def generate_test_issue_listing(reports_data, timestamps_of_data, filepath, ignored_problem_codes, reports_by_error_id=None):
     issues = for_tests()
     issues_without_skipped = [i for i in issues if i not in ignored_problem_codes]
-    generate_html_file(reports_data, filepath, issues_without_skipped, "This page contains reports that are tested or are known to produce false positives. Be careful with using this data.", timestamps_of_data)
-
-def generate_html_file(errors, output_file_name, types, information_header, timestamps_of_data):
+    generate_html_file(reports_data, filepath, issues_without_skipped, "This page contains reports that are tested or are known to produce false positives. Be careful with using this data.", timestamps_of_data, reports_by_error_id)
+
+def group_reports_by_error_id(reports_data):
+    # returns dictionary with error_id as key and list of reports sorted by osm_object_url
+    grouped = {}
+    for e in sorted(reports_data, key=lambda error: error['osm_object_url']):
+        if e['error_id'] not in grouped:
+            grouped[e['error_id']] = []
+        grouped[e['error_id']].append(e)
+    return grouped
+
+def generate_html_file(errors, output_file_name, types, information_header, timestamps_of_data, reports_by_error_id=None):
+    if reports_by_error_id == None:
+        reports_by_error_id = group_reports_by_error_id(errors)
     prefix_of_lines = "\t\t\t"
     total_error_count = 0
     added_reports = {}
     table_of_contents_text = "<ul>"
-    reported_errors_text = ""
+    reported_errors_text = []
     with open( output_file_name, 'w') as file:
         file.write(object_list_header(timestamps_of_data))
         file.write(row( '<hr>', prefix_of_lines=prefix_of_lines))
         file.write(row( information_header, prefix_of_lines=prefix_of_lines ))
         file.write(row( '<hr>', prefix_of_lines=prefix_of_lines ))
-        #print("LOADING ERRORS START")
-        reported_errors = sorted(errors, key=lambda error: error['osm_object_url'])
-        #print("LOADING ERRORS END")
         for error_type_id in types:
-            #print(error_type_id)
             error_count = 0
-            for e in reported_errors:
-                if e['error_id'] == error_type_id:
-                    error_text = error_description(e, prefix_of_lines + "\t")
-                    if error_text in added_reports:
-                        #normal in merged entries
-                        continue
-                    if error_count == 0:
-                        table_of_contents_text += '<li><a href="#' + error_type_id + '">' + error_type_id + '</a></li>'
-                        reported_errors_text += row( '<a href="#' + error_type_id + '"><h2 id="' + error_type_id + '">' + error_type_id + '</h2></a>', prefix_of_lines=prefix_of_lines)
-                        if e['error_general_intructions'] != None:
-                            instructions = htmlify(e['error_general_intructions'])
-                            reported_errors_text += row(instructions, prefix_of_lines=prefix_of_lines)
-                    added_reports[error_text] = "added!"
-                    error_count += 1
-                    total_error_count += 1
-                    reported_errors_text += error_text
+            for e in reports_by_error_id.get(error_type_id, []):
+                error_text = error_description(e, prefix_of_lines + "\t")
+                if error_text in added_reports:
+                    #normal in merged entries
+                    continue
+                if error_count == 0:
+                    table_of_contents_text += '<li><a href="#' + error_type_id + '">' + error_type_id + '</a></li>'
+                    reported_errors_text.append(row( '<a href="#' + error_type_id + '"><h2 id="' + error_type_id + '">' + error_type_id + '</h2></a>', prefix_of_lines=prefix_of_lines))
+                    if e['error_general_intructions'] != None:
+                        instructions = htmlify(e['error_general_intructions'])
+                        reported_errors_text.append(row(instructions, prefix_of_lines=prefix_of_lines))
+                added_reports[error_text] = "added!"
+                error_count += 1
+                total_error_count += 1
+                reported_errors_text.append(error_text)
             if error_count != 0:
-                reported_errors_text += row( '<a href="https://overpass-turbo.eu/">overpass query</a> usable in JOSM that will load all objects where this specific error is present:', prefix_of_lines=prefix_of_lines )
-                query = get_query_for_loading_errors_by_category_from_error_data(errors, printed_error_ids = [error_type_id], format = "josm")
+                reported_errors_text.append(row( '<a href="https://overpass-turbo.eu/">overpass query</a> usable in JOSM that will load all objects where this specific error is present:', prefix_of_lines=prefix_of_lines ))
+                query = get_query_for_loading_errors_from_sorted_reports(reports_by_error_id[error_type_id], printed_error_ids = [error_type_id], format = "josm")
                 query_html = "<blockquote>" + escape_from_internal_python_string_to_html_ascii(query) + "</blockquote>"
-                reported_errors_text += row(query_html, prefix_of_lines=prefix_of_lines)
-                reported_errors_text += row( '<hr>', prefix_of_lines=prefix_of_lines )
+                reported_errors_text.append(row(query_html, prefix_of_lines=prefix_of_lines))
+                reported_errors_text.append(row( '<hr>', prefix_of_lines=prefix_of_lines ))
         table_of_contents_text += "</ul>"
         file.write(table_of_contents_text)
-        file.write(reported_errors_text)
+        file.writelines(reported_errors_text)
         file.write(html_file_suffix())
     return total_error_count
         
@@ -524,8 +590,12 @@ def escape_from_internal_python_string_to_html_ascii(string):
     return str(string).encode('ascii', 'xmlcharrefreplace').decode()
 
 def get_query_for_loading_errors_by_category_from_error_data(reported_errors, printed_error_ids, format, extra_query_part=""):
+    sorted_reports = sorted(reported_errors, key=lambda error: error['osm_object_url'] )
+    return get_query_for_loading_errors_from_sorted_reports(sorted_reports, printed_error_ids, format, extra_query_part)
+
+def get_query_for_loading_errors_from_sorted_reports(sorted_reports, printed_error_ids, format, extra_query_part=""):
     returned = get_query_header(format)
-    for e in sorted(reported_errors, key=lambda error: error['osm_object_url'] ):
+    for e in sorted_reports:
         if e['error_id'] in printed_error_ids:
             type = e['osm_object_url'].split("/")[3]
             id = e['osm_object_url'].split("/")[4]
@@ -596,10 +666,7 @@ def index_page_description():
 
 def all_timestamps_for_index_page(cursor):
     all_timestamps = []
-    for entry in config.get_entries_to_process():
-        if "hidden" in entry:
-            if entry["hidden"] == True:
-                continue
+    for entry in config.get_visible_entries_to_process():
         all_timestamps.append(obtain_from_overpass.get_data_timestamp(cursor, entry['internal_region_name']))
     return all_timestamps
 
@@ -613,16 +680,15 @@ def html_header_for_index_page(all_timestamps):
     return index_header
 
 def list_of_processed_entries_for_each_merged_group():
-    merged_outputs = {}
-    for entry in config.get_entries_to_process():
-        if entry.get('merged_into', None) != None:
-            for parent in entry['merged_into']:
-                if parent not in merged_outputs:
-                    merged_outputs[parent] = []
-                merged_outputs[parent].append(entry)
-    return merged_outputs
-
-def write_index_and_merged_entries(cursor):
+    return config.get_entries_by_merged_group()
+
+def write_index_and_merged_entries(cursor, force=False, updated_areas=None):
+    # pages with unchanged content are not written again, unless force is set
+    #
+    # updated_areas is list of internal_region_name values of areas changed since the last call
+    # if given, only merged pages including them are updated, shared test page is not updated
+    # and report counts for other areas are taken from render_state
+    # None means full rebuild
     all_timestamps = all_timestamps_for_index_page(cursor)
     website_html = html_header_for_index_page(all_timestamps)
 
@@ -630,26 +696,19 @@ def write_index_and_merged_entries(cursor):
     merged_outputs = list_of_processed_entries_for_each_merged_group()
 
     for merged_code in merged_outputs.keys():
+        components = [component for component in merged_outputs[merged_code] if component.get("hidden", False) != True]
         timestamps_of_data = []
-        merged_reports = []
-        primary_report_count = 0
-        for component in merged_outputs[merged_code]:
-            if "hidden" in component:
-                if component["hidden"] == True:
-                    continue
-            cursor.execute("SELECT rowid, type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id FROM osm_data WHERE area_identifier = :identifier AND validator_complaint IS NOT NULL AND validator_complaint <> ''", {"identifier": component['internal_region_name']})
-            returned = cursor.fetchall()
-            for entry in returned:
-                rowid, object_type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id = entry
-                #tags = json.loads(tags) - unused
-                validator_complaint = json.loads(validator_complaint)
-                if error_id not in component.get('ignored_problems', []):
-                    merged_reports.append(validator_complaint)
-                    if error_id in for_review():
-                        primary_report_count += 1
+        for component in components:
             timestamps_of_data.append(obtain_from_overpass.get_data_timestamp(cursor, component['internal_region_name']))
-        generate_output_for_given_area(merged_code, merged_reports, timestamps_of_data, component.get('ignored_problems', []))
-        
+        primary_report_count = None
+        if updated_areas != None:
+            if len([component for component in components if component['internal_region_name'] in updated_areas]) == 0:
+                primary_report_count = stored_primary_report_count(cursor, merged_code)
+        if primary_report_count == None:
+            # ignored problems of the last listed component, hidden or not
+            ignored_problems = merged_outputs[merged_code][-1].get('ignored_problems', [])
+            primary_report_count = generate_merged_output(cursor, merged_code, components, timestamps_of_data, ignored_problems, force)
+
         if(list(set(timestamps_of_data)) == [0]):
             print(merged_code, "has no collected data at all, skipping")
         else:
@@ -659,13 +718,14 @@ def write_index_and_merged_entries(cursor):
             else:
                 completed += line
 
-    for entry in config.get_entries_to_process():
-        if "hidden" in entry:
-            if entry["hidden"] == True:
-                continue
+    for entry in config.get_visible_entries_to_process():
         website_main_title_part = entry['website_main_title_part']
         filename = website_main_title_part + '.html'
-        report_count = human_review_problem_count_for_given_internal_region_name(cursor, entry['internal_region_name'])
+        report_count = None
+        if updated_areas != None:
+            report_count = stored_primary_report_count(cursor, website_main_title_part)
+        if report_count == None:
+            report_count = human_review_problem_count_for_given_internal_region_name(cursor, entry['internal_region_name'])
         report_count_string = problem_count_string(report_count)
         line = '<a href = "./' + htmlify(filename) + '">' + htmlify(website_main_title_part) + '</a> ' + report_count_string + '\n'
         if obtain_from_overpass.get_data_timestamp(cursor, entry['internal_region_name']) == 0:
@@ -681,29 +741,53 @@ def write_index_and_merged_entries(cursor):
         completed = "<p>nothing for now :(<p>\n"
     website_html += completed
     website_html += html_file_suffix()
-    with open(config.get_report_directory() + '/' + 'index.html', 'w') as index:
-        index.write(website_html)
-    generate_shared_test_results_page(cursor, all_timestamps)
-
-def generate_shared_test_results_page(cursor, all_timestamps):
-    query = "SELECT rowid, type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id FROM osm_data WHERE validator_complaint IS NOT NULL AND validator_complaint <> ''"
-    query_parameters = {}
-    reports_data = query_to_reports_data(cursor, query, query_parameters)
-    filepath = config.get_report_directory() + '/' + "all merged - test.html"
+    write_file_if_changed(config.get_report_directory() + '/' + 'index.html', website_html)
+    if updated_areas == None:
+        generate_shared_test_results_page(cursor, all_timestamps, force)
+
+def generate_merged_output(cursor, merged_code, components, timestamps_of_data, ignored_problems, force):
+    # returns count of reports requiring human review
+    merged_raw_reports = []
+    primary_report_count = 0
+    for component in components:
+        ignored_problems_of_component = component.get('ignored_problems', [])
+        primary_report_count += error_statistics.report_count(cursor, component['internal_region_name'], for_review(), ignored_problems_of_component)
+        cursor.execute("SELECT osm_objects.type, osm_objects.id, osm_objects.tags, osm_objects.validator_complaint, osm_objects.error_id FROM " + object_store.area_join() + " WHERE osm_object_areas.area_identifier = :identifier AND osm_objects.status = :reported", {"identifier": component['internal_region_name'], "reported": report_status.reported()})
+        for object_type, object_id, tags, validator_complaint, error_id in cursor.fetchall():
+            if error_id not in ignored_problems_of_component:
+                merged_raw_reports.append((object_type, object_id, tags, validator_complaint))
+    fingerprint = page_fingerprint(merged_raw_reports, timestamps_of_data, ignored_problems)
+    if force or not is_page_up_to_date(cursor, merged_code, fingerprint):
+        merged_reports = [osm_data_storage.rehydrated_report(*raw_report) for raw_report in merged_raw_reports]
+        generate_output_for_given_area(merged_code, merged_reports, timestamps_of_data, ignored_problems)
+    store_page_state(cursor, merged_code, fingerprint, primary_report_count)
+    return primary_report_count
+
+def write_file_if_changed(filepath, content):
+    # avoids touching unchanged files
+    if os.path.isfile(filepath):
+        with open(filepath) as file:
+            if file.read() == content:
+                return
+    with open(filepath, 'w') as file:
+        file.write(content)
+
+def generate_shared_test_results_page(cursor, all_timestamps, force=False):
+    cursor.execute("SELECT type, id, tags, validator_complaint FROM osm_objects WHERE status = :reported", {"reported": report_status.reported()})
+    raw_reports = cursor.fetchall()
+    main_output_name_part = "all merged - test"
     ignored_problem_codes = []
+    fingerprint = page_fingerprint(raw_reports, all_timestamps, ignored_problem_codes)
+    if force == False and is_page_up_to_date(cursor, main_output_name_part, fingerprint):
+        return
+    reports_data = [osm_data_storage.rehydrated_report(*raw_report) for raw_report in raw_reports]
+    filepath = config.get_report_directory() + '/' + main_output_name_part + ".html"
     generate_test_issue_listing(reports_data, all_timestamps, filepath, ignored_problem_codes)
+    # not listed on index page
+    store_page_state(cursor, main_output_name_part, fingerprint, 0)
 
 def human_review_problem_count_for_given_internal_region_name(cursor, internal_region_name):
-    # TODO smart COUNT() may be better
-    cursor.execute("SELECT rowid, type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id FROM osm_data WHERE area_identifier = :identifier AND validator_complaint IS NOT NULL AND validator_complaint <> ''", {"identifier": internal_region_name})
-    returned = cursor.fetchall()
-    report_count = 0
-    for entry in returned:
-        rowid, object_type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id = entry
-        #validator_complaint = json.loads(validator_complaint) - unused
-        if(error_id in for_review()):
-            report_count += 1
-    return report_count
+    return error_statistics.report_count(cursor, internal_region_name, for_review())
 
 def problem_count_string(report_count):
     if report_count == 1:
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import time
+
+# results of reverse geocoding (country code for given location) are stored
+# in a separate database file, so they survive recreating the main database
+# and repeated runs of the bot do not query Nominatim for the same locations
+#
+# locations are keyed by coordinates rounded to given number of decimal places,
+# 4 decimal places is about 11 m - so rounding is not changing country of nodes
+# except ones placed directly on the border
+
+# counters for the current run, totals over all runs are stored in reverse_geocode_cache_counters
+run_counters = {"hit": 0, "miss": 0, "expired": 0}
+
+def open_cache(filepath):
+    # directory is created if needed, sqlite3 creates only the file itself
+    if os.path.dirname(filepath) != "":
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    connection = sqlite3.connect(filepath)
+    create_tables_if_needed(connection.cursor())
+    connection.commit()
+    return connection
+
+def create_tables_if_needed(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS reverse_geocode_cache
+                (lat_key integer, lon_key integer, precision integer, country_code text, cached_timestamp integer, PRIMARY KEY (lat_key, lon_key, precision))''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS reverse_geocode_cache_counters
+                (name text PRIMARY KEY, count integer)''')
+
+def coordinate_key(value, precision):
+    # integer rather than rounded float, so equality in SQL is exact
+    return round(value * 10 ** precision)
+
+def get_cached_country_code(cursor, lat, lon, precision, maximum_age_in_seconds):
+    # returns None if there is no usable cached result
+    cursor.execute("""SELECT country_code, cached_timestamp FROM reverse_geocode_cache
+    WHERE lat_key = :lat_key AND lon_key = :lon_key AND precision = :precision""",
+    {"lat_key": coordinate_key(lat, precision), "lon_key": coordinate_key(lon, precision), "precision": precision})
+    returned = cursor.fetchall()
+    if len(returned) == 0:
+        record(cursor, "miss")
+        return None
+    country_code, cached_timestamp = returned[0]
+    if cached_timestamp <= int(time.time()) - maximum_age_in_seconds:
+        record(cursor, "expired")
+        return None
+    record(cursor, "hit")
+    return country_code
+
+def store_country_code(cursor, lat, lon, precision, country_code):
+    cursor.execute("""INSERT OR REPLACE INTO reverse_geocode_cache (lat_key, lon_key, precision, country_code, cached_timestamp)
+    VALUES (:lat_key, :lon_key, :precision, :country_code, :cached_timestamp)""",
+    {"lat_key": coordinate_key(lat, precision), "lon_key": coordinate_key(lon, precision), "precision": precision, "country_code": country_code, "cached_timestamp": int(time.time())})
+
+def country_code(cursor, lat, lon, precision, maximum_age_in_seconds, lookup_function):
+    # lookup_function(lat, lon) is called only if there is no usable cached result
+    # result is committed immediately, so it is not lost if bot crashes later
+    cached = get_cached_country_code(cursor, lat, lon, precision, maximum_age_in_seconds)
+    if cached != None:
+        cursor.connection.commit()
+        return cached
+    returned = lookup_function(lat, lon)
+    store_country_code(cursor, lat, lon, precision, returned)
+    cursor.connection.commit()
+    return returned
+
+def record(cursor, name):
+    run_counters[name] += 1
+    cursor.execute("""INSERT INTO reverse_geocode_cache_counters (name, count) VALUES (:name, 1)
+    ON CONFLICT(name) DO UPDATE SET count = count + 1""", {"name": name})
+
+def stored_counters(cursor):
+    cursor.execute("SELECT name, count FROM reverse_geocode_cache_counters")
+    returned = {"hit": 0, "miss": 0, "expired": 0}
+    for name, count in cursor.fetchall():
+        returned[name] = count
+    return returned
+
+def print_counters(cursor):
+    total = stored_counters(cursor)
+    print("reverse geocode cache in this run:", run_counters["hit"], "hits,", run_counters["miss"], "misses,", run_counters["expired"], "expired")
+    print("reverse geocode cache in all runs:", total["hit"], "hits,", total["miss"], "misses,", total["expired"], "expired")
+
+def remove_outdated_entries(cursor, maximum_age_in_seconds):
+    cursor.execute("""DELETE FROM reverse_geocode_cache WHERE cached_timestamp <= :oldest_allowed_timestamp""",
+    {"oldest_allowed_timestamp": int(time.time()) - maximum_age_in_seconds})
+    print(cursor.rowcount, "outdated entries removed from reverse geocode cache")
@@ -1,83 +1,234 @@
-import xml_stream
+import xml.etree.ElementTree
 import sqlite3
+import hashlib
 import json
 import config
+import report_status
+import osm_data_storage
+import object_store
 
-def load_osm_file(cursor, osm_file_filepath, identifier_of_region, timestamp_when_file_was_downloaded):
+def load_osm_file(cursor, osm_file_filepath, identifier_of_region, timestamp_when_file_was_downloaded, language_code, batch_size=10_000):
+    # relevant objects are buffered and written in batches, what is much faster
+    # than issuing separate queries for each object
     update_count = 0
-    for entry in xml_streaming_of_osm_file(osm_file_filepath):
-        if record(cursor, entry, identifier_of_region, timestamp_when_file_was_downloaded):
-            update_count += 1
+    batch = []
+    for entry in streaming_of_osm_file(osm_file_filepath):
+        if is_relevant(entry):
+            batch.append(database_row(entry, identifier_of_region, timestamp_when_file_was_downloaded, language_code))
+        if len(batch) >= batch_size:
+            update_count += record_batch(cursor, batch)
+            batch = []
+    update_count += record_batch(cursor, batch)
     print(update_count, "relevant objects were updated/added")
+    cursor.execute("SELECT COUNT(*) FROM " + object_store.area_join() + " WHERE osm_object_areas.area_identifier = :area_identifier AND osm_objects.download_timestamp = :download_timestamp AND osm_objects.status <> :not_checked", {"area_identifier": identifier_of_region, "download_timestamp": timestamp_when_file_was_downloaded, "not_checked": report_status.not_checked()})
+    print(cursor.fetchall()[0][0], "of them kept validation results as changes were not affecting validation")
 
-def record(cursor, entry, identifier_of_region, timestamp):
-    if entry["osm_tags"] == {}:
-        return
+def record(cursor, entry, identifier_of_region, timestamp, language_code):
+    if is_relevant(entry) == False:
+        return False
+    return record_batch(cursor, [database_row(entry, identifier_of_region, timestamp, language_code)]) > 0
 
-    relevant = False
+def is_relevant(entry):
     for key in entry["osm_tags"].keys():
         if "wikidata" in key or "wikipedia" in key:
-            relevant = True
-    if relevant:
-        # note that object may cross border and be in area with multiple area_identifier
-        # what should be done in such case?
-        # note that object may be moved...
-        # but we do not want to delete/recreate object constantly...
-        # TODO
-        cursor.execute("SELECT download_timestamp FROM osm_data WHERE type = :type and id = :id and area_identifier = :area_identifier", {'type': entry["osm_type"], 'id': entry["osm_id"], "area_identifier": identifier_of_region})
-        data = cursor.fetchall()
-        if len(data) > 1:
-            raise "unexpected" # TODO store old data in osm_data or move it to somewhere else to record statistics
-        if len(data) == 1:
-            present_already_timestamp = data[0][0]
-            #print("currently stored object for", "https://osm.org/" + entry["osm_type"] + "/" + entry["osm_id"], "has timestamp", present_already_timestamp, "our is", timestamp, (timestamp-present_already_timestamp), "seconds later")
-            if timestamp > present_already_timestamp:
-                #print("deleting older")
-                cursor.execute("DELETE FROM osm_data WHERE type = :type and id = :id", {'type': entry["osm_type"], 'id': entry["osm_id"]})
-            else:
-                #print("so skipping")
-                return False
-
-        cursor.execute("INSERT INTO osm_data VALUES (:type, :id, :lat, :lon, :tags, :area_identifier, :download_timestamp, :validator_complaint, :error_id)", {'type': entry["osm_type"], 'id': entry["osm_id"], 'lat': entry["lat"], 'lon': entry["lon"], "tags": json.dumps(entry["osm_tags"]), "area_identifier": identifier_of_region, "download_timestamp": timestamp, "validator_complaint": None, "error_id": None})
-        return True
+            return True
     return False
 
+def tags_affecting_validation(tags):
+    # validator looks at wiki* tags and few others
+    # name is included as it is displayed in reports
+    returned = {}
+    for key, value in tags.items():
+        if "wiki" in key or key in ["teryt:simc", "type", "historic", "boundary", "name"]:
+            returned[key] = value
+    return returned
+
+def validation_input_hash(tags, language_code):
+    # if it did not change, there is no need to validate object again
+    # after changes in geometry or unrelated tags
+    validated = {"tags": tags_affecting_validation(tags), "language_code": language_code}
+    return hashlib.sha256(json.dumps(validated, sort_keys=True).encode('utf-8')).hexdigest()
+
+def database_row(entry, identifier_of_region, timestamp, language_code):
+    return {'type': entry["osm_type"], 'id': entry["osm_id"], 'language_code': object_store.language_key(language_code), 'lat': entry["lat"], 'lon': entry["lon"], "tags": osm_data_storage.encode_tags(entry["osm_tags"]), "area_identifier": identifier_of_region, "download_timestamp": timestamp, "validator_complaint": None, "error_id": None, "validation_input_hash": validation_input_hash(entry["osm_tags"], language_code), "status": report_status.not_checked()}
+
+def record_batch(cursor, rows):
+    # object crossing border of areas (or in area and its subarea) is stored once,
+    # each area where it was found is recorded in osm_object_areas - see object_store.py
+    #
+    # already present object is replaced only by a newer data, older data is ignored
+    # returns number of added or updated objects
+    #
+    # validation result is kept if nothing affecting validation has changed
+    if len(rows) == 0:
+        return 0
+    cursor.executemany("""INSERT INTO osm_objects (type, id, language_code, lat, lon, tags, download_timestamp, validator_complaint, error_id, validation_input_hash, status)
+    VALUES (:type, :id, :language_code, :lat, :lon, :tags, :download_timestamp, :validator_complaint, :error_id, :validation_input_hash, :status)
+    ON CONFLICT(type, id, language_code) DO UPDATE SET
+        lat = excluded.lat,
+        lon = excluded.lon,
+        tags = excluded.tags,
+        download_timestamp = excluded.download_timestamp,
+        validator_complaint = CASE WHEN osm_objects.validation_input_hash = excluded.validation_input_hash THEN osm_objects.validator_complaint ELSE excluded.validator_complaint END,
+        error_id = CASE WHEN osm_objects.validation_input_hash = excluded.validation_input_hash THEN osm_objects.error_id ELSE excluded.error_id END,
+        status = CASE WHEN osm_objects.validation_input_hash = excluded.validation_input_hash THEN osm_objects.status ELSE excluded.status END,
+        validation_input_hash = excluded.validation_input_hash
+    WHERE excluded.download_timestamp > osm_objects.download_timestamp""", rows)
+    updated = cursor.rowcount
+    cursor.executemany("""INSERT INTO osm_object_areas (area_identifier, type, id, language_code, download_timestamp)
+    VALUES (:area_identifier, :type, :id, :language_code, :download_timestamp)
+    ON CONFLICT(area_identifier, type, id) DO UPDATE SET
+        language_code = excluded.language_code,
+        download_timestamp = excluded.download_timestamp
+    WHERE excluded.download_timestamp > osm_object_areas.download_timestamp""", rows)
+    return updated
+
+def streaming_of_osm_file(osm_file_filepath):
+    # Overpass output may be XML or JSON (see download_format in regions_processed.yaml)
+    # both readers return the same entries
+    if osm_file_format(osm_file_filepath) == "json":
+        return json_streaming_of_osm_file(osm_file_filepath)
+    return xml_streaming_of_osm_file(osm_file_filepath)
+
+def osm_file_format(osm_file_filepath):
+    # detected from content, so archived files can be loaded without knowing how they were downloaded
+    with open(osm_file_filepath, 'rb') as osm_file:
+        start = osm_file.read(1024).lstrip()
+    if start.startswith(b"{"):
+        return "json"
+    return "xml"
+
 def xml_streaming_of_osm_file(osm_file_filepath):
+    # single pass over the file, handling nodes, ways and relations in order of appearance
+    # (xml_stream.read_xml_file handles single tag, so it required reading file three times)
     # based on https://github.com/sopherapps/xml_stream/issues/6 and osm_iterator
-    nodes_iter = xml_stream.read_xml_file(osm_file_filepath, records_tag="node")
-    ways_iter = xml_stream.read_xml_file(osm_file_filepath, records_tag="way")
-    relations_iter = xml_stream.read_xml_file(osm_file_filepath, records_tag="relation")
-
-
-    for complex_set in [relations_iter, ways_iter]:
-        for v in complex_set:
-            osm_tags = {}
-            for tag in v:
-                if tag.tag != "tag":
-                    continue
-                key = tag.attrib['k']
-                value = tag.attrib['v']
-                osm_tags[key] = value
-            if len(osm_tags) > 0:
-                osm_type = v.tag
-                osm_id = v.attrib['id']
-                for tag in v:
-                    if tag.tag != "center":
-                        continue
-                    lat = float(tag.attrib['lat'])
-                    lon = float(tag.attrib['lon'])
-                    yield({"osm_type": osm_type, "osm_id": osm_id, "lat": lat, "lon": lon, "osm_tags": osm_tags})
-    for v in nodes_iter:
-        osm_tags = {}
-        for tag in v:
-            if tag.tag != "tag":
+    with open(osm_file_filepath, 'rb') as osm_file:
+        context = iter(xml.etree.ElementTree.iterparse(osm_file, events=('start', 'end')))
+        event, root = next(context)
+        for event, element in context:
+            if event != 'end':
+                continue
+            if element.tag not in ["node", "way", "relation"]:
                 continue
-            key = tag.attrib['k']
-            value = tag.attrib['v']
-            osm_tags[key] = value
-        if len(osm_tags) > 0:
-            osm_type = v.tag
-            osm_id = v.attrib['id']
-            lat = float(v.attrib['lat'])
-            lon = float(v.attrib['lon'])
-            yield({"osm_type": osm_type, "osm_id": osm_id, "lat": lat, "lon": lon, "osm_tags": osm_tags})
+            entry = osm_element_to_entry(element)
+            # processed elements are no longer needed, this keeps memory use flat
+            # no matter how large file is
+            root.clear()
+            if entry != None:
+                yield entry
+
+def osm_element_to_entry(element):
+    osm_tags = {}
+    for tag in element:
+        if tag.tag != "tag":
+            continue
+        key = tag.attrib['k']
+        value = tag.attrib['v']
+        osm_tags[key] = value
+    if len(osm_tags) == 0:
+        return None
+    osm_type = element.tag
+    osm_id = element.attrib['id']
+    if osm_type == "node":
+        lat = float(element.attrib['lat'])
+        lon = float(element.attrib['lon'])
+        return {"osm_type": osm_type, "osm_id": osm_id, "lat": lat, "lon": lon, "osm_tags": osm_tags}
+    for tag in element:
+        if tag.tag != "center":
+            continue
+        lat = float(tag.attrib['lat'])
+        lon = float(tag.attrib['lon'])
+        return {"osm_type": osm_type, "osm_id": osm_id, "lat": lat, "lon": lon, "osm_tags": osm_tags}
+    return None
+
+def json_chunk_size():
+    return 1024 * 1024
+
+def json_streaming_of_osm_file(osm_file_filepath, chunk_size=None):
+    # single pass over [out:json] output, yields the same entries as xml_streaming_of_osm_file
+    for element in json_elements_of_osm_file(osm_file_filepath, chunk_size):
+        entry = json_element_to_entry(element)
+        if entry != None:
+            yield entry
+
+def json_element_to_entry(element):
+    osm_tags = element.get("tags", {})
+    if len(osm_tags) == 0:
+        return None
+    osm_type = element["type"]
+    # text, like id attribute in XML output
+    osm_id = str(element["id"])
+    if osm_type == "node":
+        return {"osm_type": osm_type, "osm_id": osm_id, "lat": float(element["lat"]), "lon": float(element["lon"]), "osm_tags": osm_tags}
+    if "center" in element:
+        return {"osm_type": osm_type, "osm_id": osm_id, "lat": float(element["center"]["lat"]), "lon": float(element["center"]["lon"]), "osm_tags": osm_tags}
+    return None
+
+def json_elements_of_osm_file(osm_file_filepath, chunk_size=None):
+    # yields dictionaries from "elements" list of Overpass JSON output
+    #
+    # file is read in chunks and each element is decoded once it was read completely,
+    # so memory use does not depend on size of file - json.load would build entire document
+    # other top level values (version, osm3s with timestamp) are small and are skipped
+    if chunk_size == None:
+        chunk_size = json_chunk_size()
+    decoder = json.JSONDecoder()
+    with open(osm_file_filepath, 'r', encoding='utf-8') as osm_file:
+        state = {"file": osm_file, "chunk_size": chunk_size, "buffer": "", "position": 0, "finished": False}
+        expect_json_character(state, "{")
+        while next_json_character(state, ",") != "}":
+            key = decode_json_value(state, decoder)
+            expect_json_character(state, ":")
+            if key != "elements":
+                decode_json_value(state, decoder)
+                continue
+            expect_json_character(state, "[")
+            while next_json_character(state, ",") != "]":
+                yield decode_json_value(state, decoder)
+            state["position"] += 1
+
+def read_json_chunk(state):
+    # returns False if there is nothing more to read
+    if state["finished"]:
+        return False
+    chunk = state["file"].read(state["chunk_size"])
+    if chunk == "":
+        state["finished"] = True
+        return False
+    state["buffer"] = state["buffer"][state["position"]:] + chunk
+    state["position"] = 0
+    return True
+
+def next_json_character(state, skipped):
+    # skips whitespace and characters listed in skipped, returns the next character without consuming it
+    while True:
+        buffer = state["buffer"]
+        position = state["position"]
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] in skipped):
+            position += 1
+        state["position"] = position
+        if position < len(buffer):
+            return buffer[position]
+        if read_json_chunk(state) == False:
+            raise Exception("unexpected end of JSON file " + state["file"].name)
+
+def expect_json_character(state, character):
+    found = next_json_character(state, "")
+    if found != character:
+        raise Exception("expected " + character + " in JSON file " + state["file"].name + ", got " + found)
+    state["position"] += 1
+
+def decode_json_value(state, decoder):
+    next_json_character(state, "")
+    while True:
+        try:
+            value, end = decoder.raw_decode(state["buffer"], state["position"])
+            # number may continue in the next chunk, so it is complete only if followed by something else
+            if (end < len(state["buffer"]) and state["buffer"][end] not in "0123456789.eE+-") or state["finished"]:
+                state["position"] = end
+                return value
+        except json.JSONDecodeError:
+            if state["finished"]:
+                raise
+        # value is not read completely yet
+        read_json_chunk(state)
@@ -5,6 +5,7 @@ import json
 import generate_webpage_with_error_output
 import sqlite3
 import config
+import osm_data_storage
 
 api_key = None
 user_id = None
@@ -32,20 +33,18 @@ def get_matching_maproulette_projects(api, search_term, user_id):
 
 def get_reports_with_specific_error_id(cursor, error_id):
     print("COUNT WILL BE SHOWN")
-    cursor.execute('SELECT COUNT(rowid) FROM osm_data WHERE error_id = :error_id', {"error_id": name})
+    cursor.execute('SELECT COUNT(rowid) FROM osm_objects WHERE error_id = :error_id', {"error_id": name})
     #print(returned)
     print(cursor.fetchall()[0])
     #for entry in cursor.fetchall():
     #    print(entry)
     print("COUNT SHOWN")
 
-    cursor.execute('SELECT rowid, type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id FROM osm_data WHERE error_id = :error_id', {"error_id": name})
+    cursor.execute('SELECT rowid, type, id, lat, lon, tags, language_code, download_timestamp, validator_complaint, error_id FROM osm_objects WHERE error_id = :error_id', {"error_id": name})
     returned = []
     for entry in cursor.fetchall():
-        rowid, object_type, id, lat, lon, tags, area_identifier, updated, validator_complaint, error_id = entry
-        tags = json.loads(tags)
-        validator_complaint = json.loads(validator_complaint)
-        returned.append(validator_complaint)
+        rowid, object_type, id, lat, lon, tags, language_code, updated, validator_complaint, error_id = entry
+        returned.append(osm_data_storage.rehydrated_report(object_type, id, tags, validator_complaint))
     return returned
 
 
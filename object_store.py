@@ -0,0 +1,58 @@
+# each object is stored once in osm_objects, with its tags, location and validation result
+# and osm_object_areas lists areas where it is present - so object within country
+# and its provinces is downloaded, stored and validated once, not for each area
+#
+# validation depends on language expected in area (language_code of entry in regions_processed.yaml),
+# so osm_objects is keyed by (type, id, language_code) - object in areas with different
+# languages, for example river on a border, has a separate row for each of them
+#
+# areas without expected language use empty string as language_code
+# (NULL values would not be treated as equal in PRIMARY KEY)
+
+def language_key(language_code):
+    if language_code == None:
+        return ""
+    return language_code
+
+def area_join():
+    # FROM clause for queries about objects in given area, use with
+    # WHERE osm_object_areas.area_identifier = :identifier
+    return """osm_object_areas JOIN osm_objects
+    ON osm_objects.type = osm_object_areas.type AND osm_objects.id = osm_object_areas.id AND osm_objects.language_code = osm_object_areas.language_code"""
+
+def members_of_area(cursor, internal_region_name):
+    # returns list of (type, id, language_code)
+    cursor.execute("SELECT type, id, language_code FROM osm_object_areas WHERE area_identifier = :identifier", {"identifier": internal_region_name})
+    return cursor.fetchall()
+
+def is_stored(cursor, object_type, object_id):
+    # whether object is present in any area, for any language
+    cursor.execute("SELECT 1 FROM osm_object_areas WHERE type = :type AND id = :id LIMIT 1", {"type": object_type, "id": object_id})
+    return len(cursor.fetchall()) > 0
+
+def remove_area_membership(cursor, internal_region_name):
+    # returns removed members, see remove_orphaned_objects
+    members = members_of_area(cursor, internal_region_name)
+    cursor.execute("DELETE FROM osm_object_areas WHERE area_identifier = :identifier", {"identifier": internal_region_name})
+    return members
+
+def remove_orphaned_objects(cursor, keys):
+    # keys is list of (type, id, language_code), objects which are still present in some area are kept
+    cursor.executemany("""DELETE FROM osm_objects
+    WHERE type = :type AND id = :id AND language_code = :language_code
+    AND NOT EXISTS (SELECT 1 FROM osm_object_areas WHERE type = :type AND id = :id AND language_code = :language_code)""",
+    [{"type": object_type, "id": object_id, "language_code": language_code} for object_type, object_id, language_code in keys])
+
+def remove_objects(cursor, objects, older_than):
+    # objects is list of (type, id), removes them from all areas, for all languages
+    # objects with data downloaded at older_than or later are kept
+    # returns number of removed rows of osm_objects
+    if len(objects) == 0:
+        return 0
+    parameters = [{"type": object_type, "id": object_id, "timestamp": older_than} for object_type, object_id in objects]
+    # membership is removed first, so error_statistics triggers see reports that are being removed
+    cursor.executemany("""DELETE FROM osm_object_areas
+    WHERE type = :type AND id = :id
+    AND EXISTS (SELECT 1 FROM osm_objects WHERE type = :type AND id = :id AND language_code = osm_object_areas.language_code AND download_timestamp < :timestamp)""", parameters)
+    cursor.executemany("DELETE FROM osm_objects WHERE type = :type AND id = :id AND download_timestamp < :timestamp", parameters)
+    return cursor.rowcount
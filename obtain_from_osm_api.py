@@ -0,0 +1,116 @@
+import time
+import osmapi
+import config
+
+# fetching outdated objects one by one means separate round trip for each of them
+# OSM API allows to fetch many objects of the same type in one request
+# /api/0.6/nodes?nodes=1,2,3 (also ways and relations)
+
+def osm_api_url():
+    return "https://api.openstreetmap.org"
+
+def multi_fetch_chunk_size():
+    # keeps request URL well below length limits
+    return 200
+
+def get_api(api_url=None):
+    # multi fetch is read only, no need to authenticate
+    if api_url == None:
+        api_url = osm_api_url()
+    return osmapi.OsmApi(api=api_url, appid=config.user_agent())
+
+def chunks(items):
+    for index in range(0, len(items), multi_fetch_chunk_size()):
+        yield items[index:index + multi_fetch_chunk_size()]
+
+def get_data_of_many_objects(api, object_type, object_ids):
+    # returns dictionary with object id as key and data in osmapi format as value
+    # None is value for deleted and missing objects, like in osm_bot_abstraction_layer.get_data
+    try:
+        if object_type == "node":
+            returned = api.NodesGet(object_ids)
+        elif object_type == "way":
+            returned = api.WaysGet(object_ids)
+        elif object_type == "relation":
+            returned = api.RelationsGet(object_ids)
+        else:
+            raise Exception("unexpected type " + str(object_type))
+    except (osmapi.errors.ElementNotFoundApiError, osmapi.errors.ElementDeletedApiError):
+        # entire request fails if any of objects never existed
+        # split it to find which one is missing
+        if len(object_ids) == 1:
+            return {int(object_ids[0]): None}
+        middle = len(object_ids) // 2
+        data = get_data_of_many_objects(api, object_type, object_ids[:middle])
+        data.update(get_data_of_many_objects(api, object_type, object_ids[middle:]))
+        return data
+    except (osmapi.errors.TimeoutApiError, osmapi.errors.ConnectionApiError) as e:
+        print("was trying to get", object_type, "data, got", e, "! Will wait and retry")
+        time.sleep(60)
+        return get_data_of_many_objects(api, object_type, object_ids)
+    data = {}
+    for object_id in object_ids:
+        object_data = returned.get(int(object_id))
+        if object_data != None and object_data.get("visible", True) == False:
+            object_data = None
+        data[int(object_id)] = object_data
+    return data
+
+# location checks need coordinates of all nodes of an object
+# fetching them one by one means separate request for each node, instead
+# /api/0.6/way/ID/full and /api/0.6/relation/ID/full return object with its member ways and their nodes
+# and results are kept in cache for the entire run, so shared nodes and ways are fetched once
+
+def empty_geometry_cache():
+    return {"nodes": {}, "ways": {}, "relations": {}}
+
+def node_coordinates_of_object(api, object_type, object_id, cache):
+    # returns list of (lat, lon) for all nodes of object, for relations also nodes of members
+    node_ids = node_ids_of_object(api, object_type, int(object_id), cache, set())
+    missing = [node_id for node_id in set(node_ids) if node_id not in cache["nodes"]]
+    for chunk in chunks(missing):
+        for node_id, data in get_data_of_many_objects(api, "node", chunk).items():
+            if data == None:
+                raise Exception("node " + str(node_id) + " is deleted or missing")
+            cache["nodes"][node_id] = (data["lat"], data["lon"])
+    return [cache["nodes"][node_id] for node_id in node_ids]
+
+def node_ids_of_object(api, object_type, object_id, cache, visited_relations):
+    if object_type == "node":
+        return [object_id]
+    if object_type == "way":
+        if object_id not in cache["ways"]:
+            remember_elements(cache, get_full_data(api, "way", object_id))
+        return cache["ways"][object_id]
+    if object_type == "relation":
+        if object_id in visited_relations:
+            # relation is its own member, directly or indirectly
+            return []
+        visited_relations.add(object_id)
+        if object_id not in cache["relations"]:
+            remember_elements(cache, get_full_data(api, "relation", object_id))
+        returned = []
+        for member_type, member_id in cache["relations"][object_id]:
+            returned += node_ids_of_object(api, member_type, member_id, cache, visited_relations)
+        return returned
+    raise Exception("unexpected type " + str(object_type))
+
+def get_full_data(api, object_type, object_id):
+    try:
+        if object_type == "way":
+            return api.WayFull(object_id)
+        return api.RelationFull(object_id)
+    except (osmapi.errors.TimeoutApiError, osmapi.errors.ConnectionApiError) as e:
+        print("was trying to get full", object_type, "data, got", e, "! Will wait and retry")
+        time.sleep(60)
+        return get_full_data(api, object_type, object_id)
+
+def remember_elements(cache, elements):
+    for element in elements:
+        data = element["data"]
+        if element["type"] == "node":
+            cache["nodes"][data["id"]] = (data["lat"], data["lon"])
+        elif element["type"] == "way":
+            cache["ways"][data["id"]] = data["nd"]
+        elif element["type"] == "relation":
+            cache["relations"][data["id"]] = [(member["type"], member["ref"]) for member in data["member"]]
@@ -1,14 +1,19 @@
 import config
-from osm_bot_abstraction_layer.overpass_downloader import download_overpass_query
+import overpass_rate_limiter
 from osm_bot_abstraction_layer import overpass_query_maker
 import pathlib
 import shutil
 import time
 import sqlite3
 import load_osm_file
+import object_store
+import download_archive
 from datetime import datetime
 import osm_bot_abstraction_layer
 import os
+import json
+import concurrent.futures
+import xml.etree.ElementTree as ET
 
 def filepath_to_downloaded_osm_data(name, suffix):
   filename = name
@@ -27,38 +32,33 @@ def get_data_timestamp(cursor, internal_region_name):
     else:
         return returned[0][0]
 
-def download_entry(cursor, internal_region_name, identifier_data_for_overpass):
+def download_entry(cursor, internal_region_name, identifier_data_for_overpass, language_code, output_format="xml"):
+    remove_downloaded_files()
+    downloaded = download_data_for_entry(cursor, internal_region_name, identifier_data_for_overpass, output_format)
+    return load_downloaded_data(cursor, internal_region_name, downloaded, language_code)
+
+def remove_downloaded_files():
     files = os.listdir(config.downloaded_osm_data_location())
     for filename in files:
         if filename.endswith(".osm"):
             print("DELETE", filename)
             os.remove(config.downloaded_osm_data_location() + "/" + filename)
 
-
-    downloaded_filepath = filepath_to_downloaded_osm_data(internal_region_name, "_unprocessed") # load location from database instead, maybe? TODO
+def download_data_for_entry(cursor, internal_region_name, identifier_data_for_overpass, output_format="xml"):
+    # only reads from database, so it can run while other area is being loaded
+    # returns description of downloaded file, to be passed to load_downloaded_data
+    # output_format is xml or json, downloaded file has .osm extension in both cases
     work_filepath = filepath_to_downloaded_osm_data(internal_region_name, "_download_in_progress")
     latest_download_timestamp = get_data_timestamp(cursor, internal_region_name)
+    area_name_in_query = "searchArea"
+    area_finder_string = area_finder(identifier_data_for_overpass, area_name_in_query)
     if latest_download_timestamp == 0:
-        print("data was not downloaded for this area! cleaning data in database for this area just in case!")
-        # there could be old entries which are no longer valid and not present anymore in fetched data
-        # because elements are deleted or without wikidata/wikipedia tags
-        # so lets delete all of them
-        cursor.execute("""DELETE FROM osm_data WHERE area_identifier = :identifier""", {"identifier": internal_region_name})
+        downloaded_filepath = filepath_to_downloaded_osm_data(internal_region_name, "_unprocessed") # load location from database instead, maybe? TODO
         timestamp = int(time.time())
-        area_name_in_query = "searchArea"
-        area_finder_string = area_finder(identifier_data_for_overpass, area_name_in_query)
-        query = download_query_text(area_finder_string, area_name_in_query)
-        download_overpass_query(query, work_filepath, user_agent=config.user_agent())
+        query_for_bbox = lambda bbox: download_query_text(area_finder_string, area_name_in_query, bbox, output_format)
+        download_area(query_for_bbox, area_finder_string, area_name_in_query, work_filepath, output_format=output_format)
         shutil.move(work_filepath, downloaded_filepath) # this helps in cases where download was interupted and left empty file behind
-
-        load_osm_file.load_osm_file(cursor, downloaded_filepath, internal_region_name, timestamp)
-
-        # done AFTER data was safely loaded, committed together
-        # this way we avoid problems with data downloaded and only partially loaded in database
-        cursor.execute("INSERT INTO osm_data_update_log VALUES (:area_identifier, :filename, :download_type, :download_timestamp)", {"area_identifier": internal_region_name, "filename": downloaded_filepath, "download_type": "initial_full_data", "download_timestamp": timestamp})
-        print("sleeping extra time to prevent inevitable quota exhaustion")
-        time.sleep(60)
-        return timestamp
+        return {"filepath": downloaded_filepath, "download_type": "initial_full_data", "timestamp": timestamp}
     print("updating old data!")
     print("area_identifier, filename, download_type, download_timestamp")
     current_timestamp = int(time.time())
@@ -68,20 +68,203 @@ def download_entry(cursor, internal_region_name, identifier_data_for_overpass):
 
     dt_object = datetime.fromtimestamp(latest_download_timestamp)
     timestamp_formatted = overpass_query_maker.datetime_to_overpass_data_format(dt_object)
-    area_name_in_query = "searchArea"
-    area_finder_string = area_finder(identifier_data_for_overpass, area_name_in_query)
-    query = download_update_query_text(area_finder_string, area_name_in_query, latest_download_timestamp)
+    # taken before any query, so changes made while it runs are included in the next update
     timestamp = int(time.time())
-    download_overpass_query(query, work_filepath, user_agent=config.user_agent())
+    if is_unchanged_since(area_finder_string, area_name_in_query, latest_download_timestamp):
+        print("nothing with wikipedia/wikidata tags changed since the previous download, skipping it")
+        return {"filepath": None, "download_type": unchanged_download_type(), "timestamp": timestamp}
+    query_for_bbox = lambda bbox: download_update_query_text(area_finder_string, area_name_in_query, latest_download_timestamp, bbox, output_format)
+    download_area(query_for_bbox, area_finder_string, area_name_in_query, work_filepath, output_format=output_format)
     downloaded_filepath = filepath_to_downloaded_osm_data(internal_region_name, "_update_" + timestamp_formatted)
     shutil.move(work_filepath, downloaded_filepath) # this helps in cases where download was interupted and left empty file behind
-    load_osm_file.load_osm_file(cursor, downloaded_filepath, internal_region_name, timestamp)
+    return {"filepath": downloaded_filepath, "download_type": "update_since_previous_download", "timestamp": timestamp}
+
+def load_downloaded_data(cursor, internal_region_name, downloaded, language_code, archive_location=None):
+    # returns timestamp of loaded data
+    # downloaded file is kept in archive if archive_location is given, see download_archive.py
+    # filepath is None if nothing changed and nothing was downloaded (see is_unchanged_since),
+    # then only new timestamp is recorded
+    archive_key = None
+    if downloaded["filepath"] != None:
+        previous_members = []
+        if downloaded["download_type"] == "initial_full_data":
+            print("data was not downloaded for this area! cleaning data in database for this area just in case!")
+            # there could be old entries which are no longer valid and not present anymore in fetched data
+            # because elements are deleted or without wikidata/wikipedia tags
+            # so lets remove all of them from this area
+            previous_members = object_store.remove_area_membership(cursor, internal_region_name)
+        load_osm_file.load_osm_file(cursor, downloaded["filepath"], internal_region_name, downloaded["timestamp"], language_code)
+        # objects that were present again keep their validation results
+        # ones not present anywhere else are removed
+        object_store.remove_orphaned_objects(cursor, previous_members)
+        if archive_location != None:
+            archive_key = download_archive.store(archive_location, downloaded["filepath"])
     # done AFTER data was safely loaded, committed together
     # this way we avoid problems with data downloaded and only partially loaded in database
-    cursor.execute("INSERT INTO osm_data_update_log VALUES (:area_identifier, :filename, :download_type, :download_timestamp)", {"area_identifier": internal_region_name, "filename": downloaded_filepath, "download_type": "update_since_previous_download", "download_timestamp": timestamp})
-    print("sleeping extra time to prevent inevitable quota exhaustion")
-    time.sleep(60)
-    return timestamp
+    cursor.execute("INSERT INTO osm_data_update_log (area_identifier, filename, download_type, download_timestamp, archive_key) VALUES (:area_identifier, :filename, :download_type, :download_timestamp, :archive_key)", {"area_identifier": internal_region_name, "filename": downloaded["filepath"], "download_type": downloaded["download_type"], "download_timestamp": downloaded["timestamp"], "archive_key": archive_key})
+    return downloaded["timestamp"]
+
+def unchanged_download_type():
+    return "no_changes_since_previous_download"
+
+def is_unchanged_since(area_finder_string, area_name, timestamp, api_url=None):
+    # cheap probe, counting objects that would be returned by update query, before downloading them
+    # in case of failure (for example on areas too large for a single query) update is downloaded
+    try:
+        return changed_object_count(download_update_count_query_text(area_finder_string, area_name, timestamp), api_url) == 0
+    except overpass_rate_limiter.QueryTooLarge as e:
+        print("counting changed objects failed", e)
+        return False
+
+def changed_object_count(query, api_url=None):
+    # query ends with "out count;"
+    response = overpass_rate_limiter.get_response_from_overpass_server(query, timeout(), api_url)
+    for count in ET.fromstring(response).findall("count"):
+        for tag in count.findall("tag"):
+            if tag.attrib["k"] == "total":
+                return int(tag.attrib["v"])
+    raise Exception("no total count in Overpass response " + response)
+
+def tile_download_concurrency():
+    # main Overpass instance gives 2 slots
+    return 2
+
+def maximum_tile_split_depth():
+    # each split divides tile into 2x2 grid, so up to 4**5 tiles
+    return 5
+
+def download_area(query_for_bbox, area_finder_string, area_name, filepath, api_url=None, output_format="xml"):
+    # query_for_bbox(None) is query for entire area
+    #
+    # large areas (Brandenburgia, entire countries) may fail even with long timeout
+    # in such case area is downloaded as a grid of tiles, merged into a single file
+    try:
+        overpass_rate_limiter.download_overpass_query(query_for_bbox(None), filepath, timeout(), api_url)
+        return
+    except overpass_rate_limiter.QueryTooLarge as e:
+        print(e)
+        print("area is too large for a single query, splitting it into tiles")
+    tiles = split_bbox(area_bounding_box(area_finder_string, area_name, api_url))
+    tile_filepaths = download_tiles(query_for_bbox, tiles, filepath, api_url)
+    if output_format == "json":
+        merge_json_files(tile_filepaths, filepath)
+    else:
+        merge_osm_files(tile_filepaths, filepath)
+    for tile_filepath in tile_filepaths:
+        os.remove(tile_filepath)
+
+def area_bounding_box(area_finder_string, area_name, api_url=None):
+    # returns (south, west, north, east)
+    query = "[timeout:" + str(timeout()) + "];\n"
+    query += area_finder_string
+    query += "(\n"
+    query += "relation(pivot." + area_name + ");\n"
+    query += "way(pivot." + area_name + ");\n"
+    query += ");\n"
+    query += "out bb;"
+    response = overpass_rate_limiter.get_response_from_overpass_server(query, timeout(), api_url)
+    bounds = ET.fromstring(response).findall(".//bounds")
+    if len(bounds) == 0:
+        raise Exception("no bounding box found for area " + area_finder_string)
+    south = min([float(entry.attrib["minlat"]) for entry in bounds])
+    west = min([float(entry.attrib["minlon"]) for entry in bounds])
+    north = max([float(entry.attrib["maxlat"]) for entry in bounds])
+    east = max([float(entry.attrib["maxlon"]) for entry in bounds])
+    return (south, west, north, east)
+
+def split_bbox(bbox):
+    south, west, north, east = bbox
+    middle_lat = (south + north) / 2
+    middle_lon = (west + east) / 2
+    return [
+        (south, west, middle_lat, middle_lon),
+        (south, middle_lon, middle_lat, east),
+        (middle_lat, west, north, middle_lon),
+        (middle_lat, middle_lon, north, east),
+    ]
+
+def tile_filepath(filepath, index):
+    return filepath.removesuffix(".osm") + "_tile_" + str(index) + ".osm"
+
+def download_tiles(query_for_bbox, tiles, filepath, api_url=None):
+    # tiles that are still too large are split further
+    downloaded = []
+    tile_index = 0
+    depth = 1
+    while len(tiles) > 0:
+        if depth > maximum_tile_split_depth():
+            raise Exception("area is too large even after splitting it into tiles " + str(maximum_tile_split_depth()) + " times")
+        print("downloading", len(tiles), "tiles")
+        failed = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=tile_download_concurrency()) as executor:
+            futures = []
+            for tile in tiles:
+                tile_index += 1
+                path = tile_filepath(filepath, tile_index)
+                futures.append((executor.submit(download_tile, query_for_bbox(tile), path, api_url), tile, path))
+            for future, tile, path in futures:
+                if future.result():
+                    downloaded.append(path)
+                else:
+                    failed.append(tile)
+        tiles = []
+        for tile in failed:
+            tiles += split_bbox(tile)
+        depth += 1
+    return downloaded
+
+def download_tile(query, filepath, api_url):
+    # returns False if tile is still too large
+    try:
+        overpass_rate_limiter.download_overpass_query(query, filepath, timeout(), api_url)
+        return True
+    except overpass_rate_limiter.QueryTooLarge as e:
+        print("tile is too large for a single query", e)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return False
+
+def merge_osm_files(filepaths, output_filepath):
+    # objects crossing tile borders are present in multiple tiles
+    # and are written only once
+    written = set()
+    with open(output_filepath, 'w') as output:
+        output.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="Overpass API, merged tiles">\n')
+        for filepath in filepaths:
+            depth = 0
+            root = None
+            for event, element in ET.iterparse(filepath, events=('start', 'end')):
+                if event == 'start':
+                    if root == None:
+                        root = element
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth != 1:
+                    continue
+                if element.tag in ['node', 'way', 'relation']:
+                    key = (element.tag, element.attrib['id'])
+                    if key not in written:
+                        written.add(key)
+                        element.tail = "\n"
+                        output.write(ET.tostring(element, encoding='unicode'))
+                root.clear()
+        output.write('</osm>\n')
+
+def merge_json_files(filepaths, output_filepath):
+    # [out:json] variant of merge_osm_files
+    written = set()
+    with open(output_filepath, 'w') as output:
+        output.write('{\n"generator": "Overpass API, merged tiles",\n"elements": [\n')
+        separator = ""
+        for filepath in filepaths:
+            for element in load_osm_file.json_elements_of_osm_file(filepath):
+                key = (element["type"], element["id"])
+                if key not in written:
+                    written.add(key)
+                    output.write(separator + json.dumps(element, ensure_ascii=False))
+                    separator = ",\n"
+        output.write('\n]\n}\n')
 
 def area_finder(identifier_tag_dictionary, name_of_area):
     for key in identifier_tag_dictionary.keys():
@@ -98,26 +281,50 @@ def area_finder(identifier_tag_dictionary, name_of_area):
     returned += "->." + name_of_area + ";\n"
     return returned
 
-def download_update_query_text(area_finder_string, area_name, timestamp):
-    dt_object = datetime.fromtimestamp(timestamp)
-    timestamp_formatted = overpass_query_maker.datetime_to_overpass_data_format(dt_object)
-    area_identifier = 'area.' + area_name
+def bbox_filter(bbox):
+    # bbox is (south, west, north, east)
+    if bbox == None:
+        return ""
+    return "(" + ",".join([str(coordinate) for coordinate in bbox]) + ")"
 
-    query = "[timeout:" + str(timeout()) + "];\n"
+def settings_text(output_format):
+    # output_format is xml (default output of Overpass) or json
+    returned = ""
+    if output_format == "json":
+        returned += "[out:json]"
+    return returned + "[timeout:" + str(timeout()) + "];\n"
+
+def download_update_query_text(area_finder_string, area_name, timestamp, bbox=None, output_format="xml"):
+    query = settings_text(output_format)
     query += area_finder_string 
-    query += "(\n"
-    query += 'nwr[~"(wikipedia|wikidata).*"~".*"](' + area_identifier+ ')(newer:"' + timestamp_formatted + '");\n'
-    query += ');\n'
+    query += changed_objects_statement(area_name, timestamp, bbox)
     query += "out center;"
     return query
 
-def download_query_text(area_finder_string, area_name):
+def download_update_count_query_text(area_finder_string, area_name, timestamp):
+    # the same objects as in download_update_query_text, output is a single count element
+    query = settings_text("xml")
+    query += area_finder_string
+    query += changed_objects_statement(area_name, timestamp, None)
+    query += "out count;"
+    return query
+
+def changed_objects_statement(area_name, timestamp, bbox):
+    dt_object = datetime.fromtimestamp(timestamp)
+    timestamp_formatted = overpass_query_maker.datetime_to_overpass_data_format(dt_object)
+    area_identifier = 'area.' + area_name
+    returned = "(\n"
+    returned += 'nwr[~"(wikipedia|wikidata).*"~".*"](' + area_identifier+ ')' + bbox_filter(bbox) + '(newer:"' + timestamp_formatted + '");\n'
+    returned += ');\n'
+    return returned
+
+def download_query_text(area_finder_string, area_name, bbox=None, output_format="xml"):
     area_identifier = 'area.' + area_name
 
-    query = "[timeout:" + str(timeout()) + "];\n"
+    query = settings_text(output_format)
     query += area_finder_string 
     query += "(\n"
-    query += 'nwr[~"(wikipedia|wikidata).*"~".*"](' + area_identifier+ ");\n"
+    query += 'nwr[~"(wikipedia|wikidata).*"~".*"](' + area_identifier+ ")" + bbox_filter(bbox) + ";\n"
     query += ');\n'
     query += "out center;"
     return query
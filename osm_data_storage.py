@@ -0,0 +1,66 @@
+import json
+
+# tags and validator_complaint in osm_data are stored in compact form
+#
+# tags are minified JSON
+# validator_complaint does not include osm_object_url and tags, as both can be
+# obtained from the same row - report in the usual form is rehydrated when needed
+
+def storage_version():
+    # stored in PRAGMA user_version, databases with lower value are migrated by compact_existing_rows
+    return 1
+
+def encode_tags(tags):
+    return json.dumps(tags, separators=(',', ':'), ensure_ascii=False)
+
+def encode_complaint(data):
+    # data is report as returned by get_the_most_important_problem_data, not modified
+    compact = {}
+    for key, value in data.items():
+        if key not in ["osm_object_url", "tags"]:
+            compact[key] = value
+    return json.dumps(compact, separators=(',', ':'), ensure_ascii=False)
+
+def osm_object_url(object_type, object_id):
+    return "https://openstreetmap.org/" + object_type + "/" + str(object_id)
+
+def rehydrated_report(object_type, object_id, tags, validator_complaint):
+    # returns report in the same form as it was produced by validator,
+    # with osm_object_url and tags of the object
+    report = json.loads(validator_complaint)
+    report['osm_object_url'] = osm_object_url(object_type, object_id)
+    report['tags'] = json.loads(tags)
+    return report
+
+def compaction_batch_size():
+    return 20_000
+
+def compact_existing_rows(cursor):
+    # rewrites rows stored in older, verbose format
+    # each batch of rowids is committed separately
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchall()[0][0] >= storage_version():
+        return
+    print("converting tags and reports in osm_data to compact form")
+    cursor.execute("SELECT MIN(rowid), MAX(rowid) FROM osm_data")
+    first_rowid, last_rowid = cursor.fetchall()[0]
+    if first_rowid != None:
+        for start in range(first_rowid, last_rowid + 1, compaction_batch_size()):
+            cursor.execute("SELECT rowid, tags, validator_complaint FROM osm_data WHERE rowid >= :start AND rowid < :end", {"start": start, "end": start + compaction_batch_size()})
+            updated = []
+            for rowid, tags, validator_complaint in cursor.fetchall():
+                compact_tags = tags
+                if tags != None:
+                    compact_tags = encode_tags(json.loads(tags))
+                compact_complaint = validator_complaint
+                if validator_complaint != None and validator_complaint != "":
+                    compact_complaint = encode_complaint(json.loads(validator_complaint))
+                if compact_tags != tags or compact_complaint != validator_complaint:
+                    updated.append({"rowid": rowid, "tags": compact_tags, "validator_complaint": compact_complaint})
+            cursor.executemany("UPDATE osm_data SET tags = :tags, validator_complaint = :validator_complaint WHERE rowid = :rowid", updated)
+            cursor.connection.commit()
+    cursor.execute("PRAGMA user_version = " + str(storage_version()))
+    cursor.connection.commit()
+    # space freed by shorter rows is reused only after rebuilding database file
+    print("running VACUUM to shrink database file")
+    cursor.execute("VACUUM")
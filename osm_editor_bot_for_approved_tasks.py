@@ -1,6 +1,7 @@
 import pprint
 import argparse
 import os
+import sys
 import wikimedia_connection.wikimedia_connection as wikimedia_connection
 import osm_bot_abstraction_layer.osm_bot_abstraction_layer as osm_bot_abstraction_layer
 import osm_handling_config.global_config as osm_handling_config
@@ -8,8 +9,13 @@ from wikibrain import wikimedia_link_issue_reporter
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut
 import sqlite3
-import json
 import config
+import report_status
+import osm_data_storage
+import object_store
+import boundary_index
+import obtain_from_osm_api
+import geocode_cache
 
 def parsed_args():
     parser = argparse.ArgumentParser(description='Production of webpage about validation of wikipedia tag in osm data.')
@@ -20,6 +26,15 @@ def parsed_args():
     return args
 
 def get_nominatim_country_code(lat, lon):
+    # Nominatim is queried only for locations missing in reverse geocode cache
+    cursor = get_geocode_cache_cursor()
+    if cursor == None:
+        return query_nominatim_country_code(lat, lon)
+    precision = config.reverse_geocode_cache_precision()
+    maximum_age = config.reverse_geocode_cache_maximum_age_in_seconds()
+    return geocode_cache.country_code(cursor, lat, lon, precision, maximum_age, query_nominatim_country_code)
+
+def query_nominatim_country_code(lat, lon):
     try:
         osm_bot_abstraction_layer.sleep(3)
         geolocator = Nominatim(user_agent="Wikipedia Validator", timeout=15)
@@ -27,7 +42,7 @@ def get_nominatim_country_code(lat, lon):
         print(returned)
     except GeocoderTimedOut:
         osm_bot_abstraction_layer.sleep(20)
-        return get_nominatim_country_code(lat, lon)
+        return query_nominatim_country_code(lat, lon)
     if "address" not in returned:
         print(returned)
         print(link_to_point(lat, lon))
@@ -59,13 +74,11 @@ def note_or_fixme_review_request_indication(data):
     return None
 
 def load_errors(cursor, processed_area):
-    cursor.execute("SELECT rowid, type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint FROM osm_data WHERE validator_complaint IS NOT NULL AND validator_complaint <> '' AND area_identifier == :area_identifier", {"area_identifier": processed_area})
+    cursor.execute("SELECT osm_objects.rowid, osm_objects.type, osm_objects.id, osm_objects.lat, osm_objects.lon, osm_objects.tags, osm_object_areas.area_identifier, osm_objects.download_timestamp, osm_objects.validator_complaint FROM " + object_store.area_join() + " WHERE osm_object_areas.area_identifier = :area_identifier AND osm_objects.status = :reported", {"area_identifier": processed_area, "reported": report_status.reported()})
     returned = []
     for entry in cursor.fetchall():
         rowid, object_type, id, lat, lon, tags, area_identifier, updated, validator_complaint = entry
-        tags = json.loads(tags)
-        validator_complaint = json.loads(validator_complaint)
-        returned.append(validator_complaint)
+        returned.append(osm_data_storage.rehydrated_report(object_type, id, tags, validator_complaint))
     return returned
 
 def fit_wikipedia_edit_description_within_character_limit_new(new, reason):
@@ -176,14 +189,53 @@ def filter_reported_errors(reported_errors, matching_error_ids):
             errors_for_removal.append(e)
     return errors_for_removal
 
+# loaded on the first use
+loaded_boundary_index = {}
+
+# node coordinates, ways and relations fetched during this run
+geometry_cache = obtain_from_osm_api.empty_geometry_cache()
+
+# opened on the first use, None if cache could not be opened
+opened_geocode_cache = {}
+
+def get_geocode_cache_cursor():
+    # returns None if cache is unusable, lookups are not cached then
+    # location is set by reverse_geocode_cache_filepath in cache_config.yaml
+    filepath = config.reverse_geocode_cache_filepath()
+    if filepath not in opened_geocode_cache:
+        try:
+            opened_geocode_cache[filepath] = geocode_cache.open_cache(filepath).cursor()
+        except (OSError, sqlite3.Error) as e:
+            print("reverse geocode cache at", filepath, "cannot be opened, Nominatim will be queried without caching:", e)
+            opened_geocode_cache[filepath] = None
+    return opened_geocode_cache[filepath]
+
+def get_boundary_index():
+    # returns None if boundaries file is not configured
+    filepath = config.boundaries_filepath()
+    if filepath == None:
+        return None
+    if filepath not in loaded_boundary_index:
+        loaded_boundary_index[filepath] = boundary_index.load_index(filepath)
+    return loaded_boundary_index[filepath]
+
 def is_edit_allowed_object_based_on_location(osm_object_url, object_data, target_country, verification_function_is_within_given_country):
-    if target_country != "pl":
+    # with local boundaries all nodes are checked offline, for any country or region code
+    # without them only Poland is supported and verification function is used for each node
+    index = get_boundary_index()
+    if index == None and target_country != "pl":
         raise "unimplemented"
     print()
-    for node_id in osm_bot_abstraction_layer.get_all_nodes_of_an_object(osm_object_url):
-        node_data = osm_bot_abstraction_layer.get_data(node_id, "node")
-        if verification_function_is_within_given_country(osm_object_url, node_data["lat"], node_data["lon"], target_country) == False:
+    object_type = osm_object_url.split("/")[3]
+    object_id = osm_object_url.split("/")[4]
+    coordinates = obtain_from_osm_api.node_coordinates_of_object(obtain_from_osm_api.get_api(), object_type, object_id, geometry_cache)
+    if index != None:
+        if boundary_index.are_all_within(index, coordinates, target_country) == False:
             return False
+    else:
+        for lat, lon in coordinates:
+            if verification_function_is_within_given_country(osm_object_url, lat, lon, target_country) == False:
+                return False
     print()
     print(object_data)
     return True
@@ -340,6 +392,35 @@ def add_wikipedia_tag_from_wikidata_tag(reported_errors):
         api.ChangesetClose()
         osm_bot_abstraction_layer.sleep(60)
 
+def error_ids_checked_with_nominatim():
+    # handled with detailed_verification_function_is_within_given_country
+    return ['wikipedia wikidata mismatch - follow wikipedia redirect', 'wikidata from wikipedia tag', 'wikipedia from wikidata tag']
+
+def warm_up_geocode_cache():
+    # fills reverse geocode cache for nodes of objects with pending bot edits
+    # which are close to the border, so that later run of bot does not need to wait for Nominatim
+    # Nominatim usage policy requires sequential requests, so there is no parallelism here
+    if get_boundary_index() != None:
+        print("boundaries_filepath is configured, Nominatim is not used by bot")
+        return
+    connection = sqlite3.connect(config.database_filepath())
+    cursor = connection.cursor()
+    for entry in config.get_entries_by_language_code().get("pl", []):
+        for e in filter_reported_errors(load_errors(cursor, entry["internal_region_name"]), error_ids_checked_with_nominatim()):
+            object_type = e['osm_object_url'].split("/")[3]
+            object_id = e['osm_object_url'].split("/")[4]
+            for lat, lon in obtain_from_osm_api.node_coordinates_of_object(obtain_from_osm_api.get_api(), object_type, object_id, geometry_cache):
+                if is_location_clearly_outside_territory(lat, lon, "pl"):
+                    continue
+                if is_location_possibly_outside_territory(lat, lon, "pl"):
+                    get_nominatim_country_code(lat, lon)
+    connection.close()
+    if get_geocode_cache_cursor() == None:
+        return
+    geocode_cache.remove_outdated_entries(get_geocode_cache_cursor(), config.reverse_geocode_cache_maximum_age_in_seconds())
+    get_geocode_cache_cursor().connection.commit()
+    geocode_cache.print_counters(get_geocode_cache_cursor())
+
 def link_to_point(lat, lon):
     return "https://www.openstreetmap.org/?mlat=" + str(lat) + "&mlon=" + str(lon) + "#map=10/" + str(lat) + "/" + str(lon)
 
@@ -349,15 +430,20 @@ def main():
     cursor = connection.cursor()
     # for testing: api="https://api06.dev.openstreetmap.org", 
     # website at https://master.apis.dev.openstreetmap.org/
-    for entry in config.get_entries_to_process():
-        if entry.get('language_code', None) == "pl":
-            reported_errors = load_errors(cursor, entry["internal_region_name"])
-            add_wikipedia_tag_from_wikidata_tag(reported_errors)
-            add_wikidata_tag_from_wikipedia_tag(reported_errors)
-            for e in reported_errors:
-                handle_follow_wikipedia_redirect(e)
-                change_to_local_language(e)
-                pass
+    for entry in config.get_entries_by_language_code().get("pl", []):
+        reported_errors = load_errors(cursor, entry["internal_region_name"])
+        add_wikipedia_tag_from_wikidata_tag(reported_errors)
+        add_wikidata_tag_from_wikipedia_tag(reported_errors)
+        for e in reported_errors:
+            handle_follow_wikipedia_redirect(e)
+            change_to_local_language(e)
+            pass
+    if len(opened_geocode_cache) > 0 and get_geocode_cache_cursor() != None:
+        geocode_cache.print_counters(get_geocode_cache_cursor())
 
 if __name__ == '__main__':
-    main()
+    # handled only when bot is run directly, script.py calls main() for its regular run
+    if "--warm-up-geocode-cache" in sys.argv:
+        warm_up_geocode_cache()
+    else:
+        main()
@@ -0,0 +1,147 @@
+import re
+import time
+import random
+import urllib.request, urllib.error, urllib.parse
+import http.client
+import config
+
+# Overpass server tells via /status endpoint how many query slots are available
+# for us and when occupied ones will be freed
+# see https://dev.overpass-api.de/overpass-doc/en/preface/commons.html
+#
+# instead of sleeping fixed time after each query, wait only when no slot is available
+# and back off (with jitter) when server responds with 429/503/504
+
+class QueryTooLarge(Exception):
+    # query timed out or run out of memory on server side, smaller area may succeed
+    pass
+
+def overpass_api_url():
+    return "https://overpass-api.de/api/interpreter"
+
+def status_url(api_url):
+    return api_url.replace("/interpreter", "/status")
+
+def maximum_status_wait_in_seconds():
+    # used also when /status response could not be parsed
+    return 120
+
+def backoff_base_in_seconds():
+    return 15
+
+def maximum_backoff_in_seconds():
+    return 600
+
+def retry_limit():
+    return 12
+
+def parse_status(text):
+    # returns dictionary with
+    # "slots_available" - number of free slots, None if not parsable
+    # "seconds_until_slot" - list with waiting times for occupied slots
+    #
+    # example response:
+    # Connected as: 1234567
+    # Current time: 2023-01-29T10:00:00Z
+    # Announced endpoint: none
+    # Rate limit: 2
+    # Slot available after: 2023-01-29T10:00:30Z, in 30 seconds.
+    # Slot available after: 2023-01-29T10:01:05Z, in 65 seconds.
+    # Currently running queries (pid, space limit, time limit, start time):
+    slots_available = None
+    seconds_until_slot = []
+    for line in text.split("\n"):
+        line = line.strip()
+        match = re.fullmatch(r"(\d+) slots? available now\.", line)
+        if match:
+            slots_available = int(match.group(1))
+        match = re.fullmatch(r"Slot available after: .*, in (-?\d+) seconds?\.", line)
+        if match:
+            seconds_until_slot.append(max(0, int(match.group(1))))
+    if slots_available == None and (len(seconds_until_slot) > 0 or "Rate limit:" in text):
+        slots_available = 0
+    if "Rate limit: 0" in text:
+        # no rate limit on this instance
+        slots_available = 1
+    return {"slots_available": slots_available, "seconds_until_slot": seconds_until_slot}
+
+def wait_time_in_seconds(status):
+    if status["slots_available"] == None:
+        return maximum_status_wait_in_seconds()
+    if status["slots_available"] > 0:
+        return 0
+    if len(status["seconds_until_slot"]) == 0:
+        # all slots taken by our running queries
+        return maximum_status_wait_in_seconds()
+    # one extra second as reported time is rounded
+    return min(min(status["seconds_until_slot"]) + 1, maximum_status_wait_in_seconds())
+
+def backoff_in_seconds(attempt):
+    # exponential with full jitter, so many clients throttled at once do not retry in lockstep
+    limit = min(backoff_base_in_seconds() * 2 ** attempt, maximum_backoff_in_seconds())
+    return random.uniform(limit / 2, limit)
+
+def is_runtime_error(response):
+    # remark is placed at the beginning or at the end of response
+    # as <remark> element in XML output, as "remark" key in [out:json] output
+    for marker in ["<remark> runtime error", '"remark": "runtime error']:
+        if marker in response[:10_000] or marker in response[-10_000:]:
+            return True
+    return False
+
+def get_status(api_url, user_agent):
+    request = urllib.request.Request(status_url(api_url), headers={'User-Agent': user_agent})
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return parse_status(response.read().decode('utf-8'))
+    except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+        print("fetching Overpass status failed", e)
+        return {"slots_available": None, "seconds_until_slot": []}
+
+def wait_for_free_slot(api_url, user_agent, sleep_function):
+    while True:
+        wait = wait_time_in_seconds(get_status(api_url, user_agent))
+        if wait == 0:
+            return
+        print("waiting", wait, "seconds for free Overpass slot")
+        sleep_function(wait)
+
+def download_overpass_query(query, filepath, timeout, api_url=None, user_agent=None, sleep_function=time.sleep):
+    with open(filepath, 'w') as file:
+        file.write(get_response_from_overpass_server(query, timeout, api_url, user_agent, sleep_function))
+
+def get_response_from_overpass_server(query, timeout, api_url=None, user_agent=None, sleep_function=time.sleep):
+    if api_url == None:
+        api_url = overpass_api_url()
+    if user_agent == None:
+        user_agent = config.user_agent()
+    data = urllib.parse.urlencode({"data": query}).encode('utf-8')
+    for attempt in range(retry_limit()):
+        wait_for_free_slot(api_url, user_agent, sleep_function)
+        request = urllib.request.Request(api_url, data=data, headers={'User-Agent': user_agent})
+        start = time.time()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                returned = response.read().decode('utf-8')
+            print("Overpass query completed in", int(time.time() - start), "seconds")
+            # query timeout and similar failures are reported within response with 200 code
+            # see https://github.com/drolbr/Overpass-API/issues/577
+            if is_runtime_error(returned):
+                raise QueryTooLarge('timeout in query or other failure!' + query)
+            return returned
+        except urllib.error.HTTPError as e:
+            # 429 - we are asked to slow down
+            # 503 - server is overloaded
+            # 504 - appears when server is overloaded, see https://github.com/drolbr/Overpass-API/issues/220
+            if e.code not in [429, 503, 504]:
+                raise
+            failure = str(e.code) + " error code"
+        except TimeoutError as e:
+            # no response within time given to the query
+            raise QueryTooLarge('timeout while waiting for response! ' + query) from e
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            failure = str(e)
+        wait = backoff_in_seconds(attempt)
+        print("Overpass query failed with", failure, "- retrying after", int(wait), "seconds")
+        sleep_function(wait)
+    raise Exception("Overpass query failed " + str(retry_limit()) + " times: " + query)
@@ -0,0 +1,85 @@
+import queue
+import threading
+
+# runs processing of regions as a chain of stages, each in its own thread
+# connected by bounded queues - so for example next region is downloaded
+# while previous one is validated and one before it is rendered
+#
+# stage is a generator function that takes iterable with outputs of the previous stage
+# (the first stage takes list of items) and yields its own outputs
+# stage is responsible for its own resources, such as database connection
+# (sqlite3 connections cannot be shared between threads)
+
+def queue_size():
+    # how far stage may run ahead of the next one
+    return 2
+
+class PipelineStopped(Exception):
+    pass
+
+end_of_stream = object()
+
+def run_pipeline(items, stages, maximum_queue_size=None):
+    # returns list of outputs of the last stage
+    # exception raised in any stage stops all of them and is reraised
+    if maximum_queue_size == None:
+        maximum_queue_size = queue_size()
+    queues = [queue.Queue(maxsize=maximum_queue_size) for _ in range(len(stages) - 1)]
+    stop = threading.Event()
+    failures = []
+    results = []
+
+    def inputs(index):
+        if index == 0:
+            for item in items:
+                if stop.is_set():
+                    return
+                yield item
+            return
+        while True:
+            item = get(queues[index - 1], stop)
+            if item is end_of_stream:
+                return
+            yield item
+
+    def worker(index):
+        try:
+            for output in stages[index](inputs(index)):
+                if index == len(stages) - 1:
+                    results.append(output)
+                elif not put(queues[index], output, stop):
+                    raise PipelineStopped()
+            if index < len(stages) - 1:
+                put(queues[index], end_of_stream, stop)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            failures.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=worker, args=(index,), name="pipeline stage " + str(index)) for index in range(len(stages))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if len(failures) > 0:
+        raise failures[0]
+    return results
+
+def put(target, item, stop):
+    # returns False if pipeline was stopped before item was accepted
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def get(source, stop):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return end_of_stream
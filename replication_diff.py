@@ -0,0 +1,273 @@
+import gzip
+import os
+import shutil
+import urllib.request
+import xml.etree.ElementTree
+from datetime import datetime, timezone
+import config
+import load_osm_file
+import boundary_index
+import obtain_from_osm_api
+import object_store
+
+# update of stored objects using OSM replication diffs (osmChange files) instead of
+# separate Overpass query with newer: filter for each area
+#
+# source is directory or URL laid out like https://planet.openstreetmap.org/replication/hour/
+# with state.txt describing the latest diff and 000/123/456.osc.gz + 000/123/456.state.txt for each diff
+#
+# from each diff only elements with wikipedia/wikidata keys are taken, deleted objects
+# and objects which lost such tags are removed from osm_objects together with their
+# rows in osm_object_areas (see object_store.remove_objects)
+#
+# changed objects already present in osm_objects are updated there and stay in areas
+# listed for them in osm_object_areas, new objects are assigned to areas with boundary
+# index (see boundary_index.py) - so without configured boundaries_filepath only
+# already known objects are updated
+#
+# sequence number of the last applied diff is stored in replication_state table
+# osm_data_update_log has a single replication_diff row for each area, with timestamp
+# of the last applied diff - diff files are not kept, so no filename is stored there
+
+def deletion_batch_size():
+    return 10_000
+
+def is_remote(source):
+    return source.startswith("http://") or source.startswith("https://")
+
+def sequence_path(sequence_number):
+    # 1234567 -> 001/234/567
+    text = str(sequence_number).zfill(9)
+    return text[0:3] + "/" + text[3:6] + "/" + text[6:9]
+
+def read_text(source, relative_path):
+    if is_remote(source):
+        request = urllib.request.Request(source.rstrip("/") + "/" + relative_path, headers={"User-Agent": config.user_agent()})
+        with urllib.request.urlopen(request, timeout=600) as response:
+            return response.read().decode('utf-8')
+    with open(os.path.join(source, relative_path)) as file:
+        return file.read()
+
+def parse_state(text):
+    # returns {"sequence_number": ..., "timestamp": ...}
+    values = {}
+    for line in text.split("\n"):
+        if line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        values[key.strip()] = value.strip().replace("\\", "")
+    timestamp = datetime.strptime(values["timestamp"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    return {"sequence_number": int(values["sequenceNumber"]), "timestamp": int(timestamp.timestamp())}
+
+def current_state(source):
+    return parse_state(read_text(source, "state.txt"))
+
+def state_of_diff(source, sequence_number):
+    return parse_state(read_text(source, sequence_path(sequence_number) + ".state.txt"))
+
+def local_copy_of_diff(source, sequence_number):
+    # returns filepath and whether it is a temporary copy to be removed after use
+    relative_path = sequence_path(sequence_number) + ".osc.gz"
+    if is_remote(source) == False:
+        return os.path.join(source, relative_path), False
+    filepath = config.downloaded_osm_data_location() + "/replication_" + str(sequence_number) + ".osc.gz"
+    request = urllib.request.Request(source.rstrip("/") + "/" + relative_path, headers={"User-Agent": config.user_agent()})
+    with urllib.request.urlopen(request, timeout=600) as response:
+        with open(filepath, 'wb') as file:
+            shutil.copyfileobj(response, file)
+    return filepath, True
+
+def applied_state(cursor, source):
+    # returns None if replication was not used yet with this source
+    cursor.execute("SELECT sequence_number, timestamp FROM replication_state WHERE source = :source", {"source": source})
+    returned = cursor.fetchall()
+    if len(returned) == 0:
+        return None
+    return {"sequence_number": returned[0][0], "timestamp": returned[0][1]}
+
+def store_applied_state(cursor, source, state):
+    cursor.execute("INSERT OR REPLACE INTO replication_state (source, sequence_number, timestamp) VALUES (:source, :sequence_number, :timestamp)",
+    {"source": source, "sequence_number": state["sequence_number"], "timestamp": state["timestamp"]})
+
+def diff_elements(filepath):
+    # single streaming pass over osmChange file
+    # yields dictionaries with action (create/modify/delete), osm_type, osm_id, lat, lon (None for ways and relations,
+    # and for deleted nodes), osm_tags and node_refs (empty for nodes and relations)
+    with gzip.open(filepath, 'rb') as file:
+        context = iter(xml.etree.ElementTree.iterparse(file, events=('start', 'end')))
+        event, root = next(context)
+        action_element = None
+        for event, element in context:
+            if event == 'start':
+                if element.tag in ["create", "modify", "delete"]:
+                    action_element = element
+                continue
+            if element.tag in ["create", "modify", "delete"]:
+                root.clear()
+                continue
+            if element.tag not in ["node", "way", "relation"] or action_element == None:
+                continue
+            osm_tags = {}
+            node_refs = []
+            for child in element:
+                if child.tag == "tag":
+                    osm_tags[child.attrib['k']] = child.attrib['v']
+                elif child.tag == "nd":
+                    node_refs.append(int(child.attrib['ref']))
+            lat = None
+            lon = None
+            if element.tag == "node" and "lat" in element.attrib:
+                lat = float(element.attrib['lat'])
+                lon = float(element.attrib['lon'])
+            returned = {"action": action_element.tag, "osm_type": element.tag, "osm_id": int(element.attrib['id']), "lat": lat, "lon": lon, "osm_tags": osm_tags, "node_refs": node_refs}
+            # processed elements are no longer needed, this keeps memory use flat
+            action_element.clear()
+            yield returned
+
+def stored_areas(cursor, object_type, object_id):
+    # returns list of (area_identifier, lat, lon) for given object, one for each area listed in osm_object_areas
+    cursor.execute("SELECT osm_object_areas.area_identifier, osm_objects.lat, osm_objects.lon FROM " + object_store.area_join() + " WHERE osm_object_areas.type = :type AND osm_object_areas.id = :id", {"type": object_type, "id": object_id})
+    return cursor.fetchall()
+
+def center_of(coordinates):
+    # center of bounding box, like "out center" in Overpass
+    # coordinates is list of (lat, lon)
+    lats = [lat for lat, lon in coordinates]
+    lons = [lon for lat, lon in coordinates]
+    return (min(lats) + max(lats)) / 2, (min(lons) + max(lons)) / 2
+
+def location_of_new_object(element, node_coordinates_in_diff, api, geometry_cache):
+    # returns (lat, lon)
+    if element["osm_type"] == "node":
+        return element["lat"], element["lon"]
+    if element["osm_type"] == "way" and all(node_id in node_coordinates_in_diff for node_id in element["node_refs"]):
+        return center_of([node_coordinates_in_diff[node_id] for node_id in element["node_refs"]])
+    # nodes not changed in this diff (or relation), current geometry is fetched from OSM API
+    if api == None:
+        api = obtain_from_osm_api.get_api()
+    return center_of(obtain_from_osm_api.node_coordinates_of_object(api, element["osm_type"], element["osm_id"], geometry_cache))
+
+def entries_by_code(entries):
+    returned = {}
+    for entry in entries:
+        code = boundary_index.code_of_identifier(entry['identifier'])
+        if code == None:
+            continue
+        if code not in returned:
+            returned[code] = []
+        returned[code].append(entry)
+    return returned
+
+def apply_diff(cursor, filepath, timestamp, entries, index, api=None):
+    # entries are areas from regions_processed.yaml which are updated
+    # index is boundary index used to assign new objects, may be None
+    # returns counts of changes
+    counts = {"updated": 0, "added": 0, "removed": 0, "not_assigned": 0}
+    entries_by_internal_region_name = {entry['internal_region_name']: entry for entry in entries}
+    # diff may contain several versions of the same object, the last one is used
+    # (None for deleted objects and ones without wikipedia/wikidata tags)
+    final_versions = {}
+    for element in diff_elements(filepath):
+        key = (element["osm_type"], element["osm_id"])
+        if element["action"] != "delete" and load_osm_file.is_relevant(element):
+            final_versions[key] = element
+        else:
+            final_versions[key] = None
+    relevant = []
+    removed = []
+    for key, element in final_versions.items():
+        if element != None:
+            relevant.append(element)
+            continue
+        # most of irrelevant elements in a diff were never tracked, there is nothing to remove
+        if object_store.is_stored(cursor, key[0], key[1]) == False:
+            continue
+        # tracked object was deleted or lost its wikipedia/wikidata tags
+        removed.append(key)
+        if len(removed) >= deletion_batch_size():
+            counts["removed"] += object_store.remove_objects(cursor, removed, timestamp)
+            removed = []
+    counts["removed"] += object_store.remove_objects(cursor, removed, timestamp)
+
+    rows = []
+    new_objects = []
+    for element in relevant:
+        stored = stored_areas(cursor, element["osm_type"], element["osm_id"])
+        if len(stored) == 0:
+            new_objects.append(element)
+            continue
+        for area_identifier, lat, lon in stored:
+            entry = entries_by_internal_region_name.get(area_identifier)
+            if entry == None:
+                continue
+            if element["osm_type"] == "node":
+                lat = element["lat"]
+                lon = element["lon"]
+            located = {"osm_type": element["osm_type"], "osm_id": element["osm_id"], "lat": lat, "lon": lon, "osm_tags": element["osm_tags"]}
+            rows.append(load_osm_file.database_row(located, area_identifier, timestamp, entry.get('language_code', None)))
+    counts["updated"] = load_osm_file.record_batch(cursor, rows)
+
+    if index == None:
+        counts["not_assigned"] = len(new_objects)
+        return counts
+    # second pass is needed only to locate new ways
+    needed_nodes = set()
+    for element in new_objects:
+        needed_nodes.update(element["node_refs"])
+    node_coordinates_in_diff = {}
+    if len(needed_nodes) > 0:
+        for element in diff_elements(filepath):
+            if element["osm_type"] == "node" and element["osm_id"] in needed_nodes and element["lat"] != None:
+                node_coordinates_in_diff[element["osm_id"]] = (element["lat"], element["lon"])
+    by_code = entries_by_code(entries)
+    geometry_cache = obtain_from_osm_api.empty_geometry_cache()
+    rows = []
+    for element in new_objects:
+        lat, lon = location_of_new_object(element, node_coordinates_in_diff, api, geometry_cache)
+        assigned = False
+        for code in boundary_index.codes_at(index, lat, lon):
+            for entry in by_code.get(code, []):
+                located = {"osm_type": element["osm_type"], "osm_id": element["osm_id"], "lat": lat, "lon": lon, "osm_tags": element["osm_tags"]}
+                rows.append(load_osm_file.database_row(located, entry['internal_region_name'], timestamp, entry.get('language_code', None)))
+                assigned = True
+        if assigned == False:
+            counts["not_assigned"] += 1
+    counts["added"] = load_osm_file.record_batch(cursor, rows)
+    return counts
+
+def start_tracking(cursor, source):
+    # diffs after the current one will be applied, earlier changes must be obtained in other way
+    state = current_state(source)
+    store_applied_state(cursor, source, state)
+    return state
+
+def replication_download_type():
+    return "replication_diff"
+
+def record_replication_progress(cursor, internal_region_name, timestamp):
+    # keeps obtain_from_overpass.get_data_timestamp up to date
+    # row is updated rather than added for each diff, so log does not grow with every applied diff
+    parameters = {"area_identifier": internal_region_name, "download_type": replication_download_type(), "download_timestamp": timestamp}
+    cursor.execute("UPDATE osm_data_update_log SET download_timestamp = :download_timestamp WHERE area_identifier = :area_identifier AND download_type = :download_type", parameters)
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO osm_data_update_log (area_identifier, filename, download_type, download_timestamp) VALUES (:area_identifier, NULL, :download_type, :download_timestamp)", parameters)
+
+def apply_pending_diffs(cursor, source, entries, index, api=None):
+    # each diff is committed separately, together with its state
+    # so interrupted update continues from the first not applied diff
+    applied = applied_state(cursor, source)
+    if applied == None:
+        raise Exception("replication was not started for " + source + ", see start_tracking")
+    latest = current_state(source)
+    for sequence_number in range(applied["sequence_number"] + 1, latest["sequence_number"] + 1):
+        state = state_of_diff(source, sequence_number)
+        filepath, is_temporary = local_copy_of_diff(source, sequence_number)
+        counts = apply_diff(cursor, filepath, state["timestamp"], entries, index, api)
+        print("applied replication diff", sequence_number, "-", counts["updated"], "updated,", counts["added"], "added,", counts["removed"], "removed,", counts["not_assigned"], "new objects not assigned to any area")
+        for entry in entries:
+            record_replication_progress(cursor, entry['internal_region_name'], state["timestamp"])
+        store_applied_state(cursor, source, state)
+        cursor.connection.commit()
+        if is_temporary:
+            os.remove(filepath)
+    return latest
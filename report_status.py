@@ -0,0 +1,26 @@
+# osm_objects.status tells whether object was validated and whether problem was found
+# it duplicates information encoded in validator_complaint
+# (NULL - not checked, empty string - checked, no problem found, otherwise report)
+# but unlike validator_complaint it is small and indexed
+#
+# validator_complaint and status must be always written together
+
+def not_checked():
+    return 0
+
+def no_problem():
+    return 1
+
+def reported():
+    return 2
+
+def status_for_complaint(validator_complaint):
+    if validator_complaint == None:
+        return not_checked()
+    if validator_complaint == "":
+        return no_problem()
+    return reported()
+
+def status_for_complaint_sql(column):
+    # SQL expression equivalent to status_for_complaint
+    return "CASE WHEN " + column + " IS NULL THEN " + str(not_checked()) + " WHEN " + column + " = '' THEN " + str(no_problem()) + " ELSE " + str(reported()) + " END"
@@ -3,31 +3,90 @@ from wikibrain import wikipedia_knowledge
 import wikimedia_connection.wikimedia_connection as wikimedia_connection
 import config
 import obtain_from_overpass
+import obtain_from_osm_api
+import load_osm_file
+import validation_cache
+import error_statistics
+import report_status
+import osm_data_storage
+import wikimedia_prefetch
 import json
+import sys
 import sqlite3
 import generate_webpage_with_error_output
 import os
-import osm_bot_abstraction_layer.osm_bot_abstraction_layer as osm_bot_abstraction_layer
 import time
 import osm_editor_bot_for_approved_tasks
+import multiprocessing
+import region_pipeline
+import replication_diff
+import object_store
+import boundary_index
+import download_archive
+import database_schema
 
 def main():
+    # --force-render regenerates all pages, also ones where reports have not changed
+    force_render = "--force-render" in sys.argv
+    if "--check-error-statistics" in sys.argv:
+        check_error_statistics()
+        return
+    if "--replay-from-archive" in sys.argv:
+        # python3 script.py --replay-from-archive <internal_region_name>
+        replay_from_archive(sys.argv[sys.argv.index("--replay-from-archive") + 1])
+        return
     osm_editor_bot_for_approved_tasks.main()
     check_for_malformed_definitions_of_entries()
-    update_validator_database_and_reports()
+    update_validator_database_and_reports(force_render)
 
-def update_validator_database_and_reports():
+def check_error_statistics():
+    # error_statistics is maintained by triggers, this verifies it against stored reports and repairs it
+    connection = sqlite3.connect(config.database_filepath())
+    cursor = connection.cursor()
+    if error_statistics.check_and_repair(cursor):
+        print("error_statistics is consistent with stored reports")
+    connection.commit()
+    connection.close()
+
+def replay_from_archive(internal_region_name):
+    # rebuilds stored data of area from archived downloads, without querying Overpass
+    # reports are updated on the next regular run
+    entry = config.get_entry_by_internal_region_name(internal_region_name)
+    if entry == None:
+        raise Exception(internal_region_name + " is not present in regions_processed.yaml")
+    location = config.download_archive_location()
+    if location == None:
+        raise Exception("download_archive_location is disabled in cache_config.yaml")
     connection = sqlite3.connect(config.database_filepath())
     cursor = connection.cursor()
     create_table_if_needed(cursor)
+    migrate_database_if_needed(cursor)
+    work_filepath = obtain_from_overpass.filepath_to_downloaded_osm_data(internal_region_name, "_replay")
+    replayed = download_archive.replay_area(cursor, location, internal_region_name, entry.get('language_code', None), work_filepath)
     connection.commit()
+    connection.close()
+    print(replayed, "archived downloads replayed for", internal_region_name)
 
-    for entry in config.get_entries_to_process():
-        if "hidden" in entry:
-            if entry["hidden"] == True:
-                continue
-        generate_webpage_with_error_output.generate_website_file_for_given_area(cursor, entry)
-    generate_webpage_with_error_output.write_index_and_merged_entries(cursor)
+def apply_download_archive_retention(cursor):
+    location = config.download_archive_location()
+    if location == None:
+        return
+    removed = download_archive.apply_retention(cursor, location, config.download_archive_maximum_size_in_bytes())
+    if removed > 0:
+        print(removed, "files removed from archive of downloads")
+
+def update_validator_database_and_reports(force_render=False):
+    connection = sqlite3.connect(config.database_filepath())
+    cursor = connection.cursor()
+    create_table_if_needed(cursor)
+    migrate_database_if_needed(cursor)
+    validation_cache.remove_outdated_entries(cursor, validation_cache.validator_version())
+    connection.commit()
+
+    for entry in config.get_visible_entries_to_process():
+        generate_webpage_with_error_output.generate_website_file_for_given_area(cursor, entry, force_render)
+    generate_webpage_with_error_output.write_index_and_merged_entries(cursor, force_render)
+    connection.commit()
     commit_and_publish_changes_in_report_directory()
 
     wikimedia_connection.set_cache_location(config.get_wikimedia_connection_cache_location())
@@ -40,8 +99,6 @@ def update_validator_database_and_reports():
     current_timestamp = int(time.time())
     entries_with_age = sorted(entries_with_age, key=lambda entry: -(current_timestamp - entry["data_timestamp"]) * entry["data"].get("priority_multiplier", 1))
     
-    total_entry_count = len(config.get_entries_to_process())
-    processed_entries = 0
     print()
     print()
     print()
@@ -51,79 +108,254 @@ def update_validator_database_and_reports():
         k = str(int((score+500)/1000))
         print(entry['internal_region_name'], entry.get("priority_multiplier", 1), k+"k")
 
+    entries_to_process = []
     for selected_processing_entry in entries_with_age:
-        print()
-        print()
-        print(processed_entries, "/", total_entry_count)
-        processed_entries += 1
         entry = selected_processing_entry['data']
-        internal_region_name = entry['internal_region_name']
-        print(internal_region_name)
         if "hidden" in entry:
             if entry["hidden"] == True:
                 continue
-        process_given_area(cursor, entry)
-        connection.commit()
-        generate_webpage_with_error_output.write_index_and_merged_entries(cursor) # update after each run
+        entries_to_process.append(entry)
     connection.close()
+    if config.replication_source() != None:
+        entries_to_process = update_areas_using_replication(entries_to_process)
+    process_areas_in_pipeline(entries_to_process)
     commit_and_publish_changes_in_report_directory()
 
+def update_areas_using_replication(entries):
+    # returns entries which still need to be updated with Overpass
+    # areas without data need initial full download, on the first run all areas are updated
+    # with Overpass as diffs cover only changes made after replication was started
+    source = config.replication_source()
+    connection = pipeline_database_connection()
+    cursor = connection.cursor()
+    if replication_diff.applied_state(cursor, source) == None:
+        state = replication_diff.start_tracking(cursor, source)
+        connection.commit()
+        connection.close()
+        print("replication started at diff", state["sequence_number"], "- areas are updated with Overpass this time")
+        return entries
+    with_data = []
+    without_data = []
+    for entry in entries:
+        if obtain_from_overpass.get_data_timestamp(cursor, entry['internal_region_name']) == 0:
+            without_data.append(entry)
+        else:
+            with_data.append(entry)
+    index = None
+    if config.boundaries_filepath() != None:
+        index = boundary_index.load_index(config.boundaries_filepath())
+    replication_diff.apply_pending_diffs(cursor, source, with_data, index)
+    connection.close()
+    region_pipeline.run_pipeline(with_data, [validate_stage, render_stage])
+    return without_data
+
+def process_areas_in_pipeline(entries):
+    # download of the next area overlaps with validation and rendering of previous ones
+    # only ingest_and_validate_stage writes to osm_objects and osm_object_areas
+    obtain_from_overpass.remove_downloaded_files()
+    region_pipeline.run_pipeline(entries, [download_stage, ingest_and_validate_stage, render_stage])
+    # render_stage updates index page incrementally, final full rebuild
+    # ensures that output matches one generated from scratch
+    connection = pipeline_database_connection()
+    try:
+        generate_webpage_with_error_output.write_index_and_merged_entries(connection.cursor())
+        connection.commit()
+    finally:
+        connection.close()
+
+def pipeline_database_connection():
+    # each stage has its own connection, waiting rather than failing when other one holds a lock
+    return sqlite3.connect(config.database_filepath(), timeout=600)
+
+def download_stage(entries):
+    connection = pipeline_database_connection()
+    try:
+        cursor = connection.cursor()
+        for entry in entries:
+            downloaded = obtain_from_overpass.download_data_for_entry(cursor, entry['internal_region_name'], entry['identifier'], entry.get('download_format', 'xml'))
+            yield entry, downloaded
+    finally:
+        connection.close()
+
+def ingest_and_validate_stage(inputs):
+    connection = pipeline_database_connection()
+    try:
+        cursor = connection.cursor()
+        processed_entries = 0
+        for entry, downloaded in inputs:
+            print()
+            print()
+            print(processed_entries, "/", len(config.get_entries_to_process()))
+            processed_entries += 1
+            print(entry['internal_region_name'])
+            ingest_and_validate_given_area(cursor, entry, downloaded)
+            connection.commit()
+            if downloaded["filepath"] != None:
+                os.remove(downloaded["filepath"])
+            apply_download_archive_retention(cursor)
+            connection.commit()
+            yield entry
+    finally:
+        connection.close()
+
+def validate_stage(entries):
+    # for areas where data was already loaded, see update_areas_using_replication
+    connection = pipeline_database_connection()
+    try:
+        cursor = connection.cursor()
+        for entry in entries:
+            print(entry['internal_region_name'])
+            update_validator_reports_for_given_area(cursor, entry['internal_region_name'], entry.get('language_code', None), entry.get('ignored_problems', []))
+            connection.commit()
+            yield entry
+    finally:
+        connection.close()
+
+def render_stage(entries):
+    connection = pipeline_database_connection()
+    try:
+        cursor = connection.cursor()
+        for entry in entries:
+            generate_webpage_with_error_output.generate_website_file_for_given_area(cursor, entry)
+            # update after each run, only merged pages including this area are regenerated
+            generate_webpage_with_error_output.write_index_and_merged_entries(cursor, updated_areas=[entry['internal_region_name']])
+            connection.commit()
+            yield entry
+    finally:
+        connection.close()
+
 def check_for_malformed_definitions_of_entries():
-    for entry in config.get_entries_to_process():
-        if "/" in entry['internal_region_name']:
-            raise Exception("/ in " + entry['internal_region_name'])
-        if "/" in entry['website_main_title_part']:
-            raise Exception("/ in " + entry['website_main_title_part'])
-
-def existing_tables(cursor):
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    table_listing = cursor.fetchall()
-    returned = []
-    for entry in table_listing:
-        returned.append(entry[0])
-    return returned
+    # see config.validate_entries, also done whenever regions_processed.yaml is loaded
+    config.validate_entries(config.get_entries_to_process())
 
 def create_table_if_needed(cursor):
-    if "osm_data" in existing_tables(cursor):
-        print("osm_data table exists already, delete file with database to recreate")
-    else:
-        # validator_complaint needs to hold
-        # - not checked
-        # - checked, no problem found
-        # - error data
-        #
-        # right now for "checked, no error" I plan to use empty string but I am not too happy
-        cursor.execute('''CREATE TABLE osm_data
-                    (type text, id number, lat float, lon float, tags text, area_identifier text, download_timestamp integer, validator_complaint text, error_id text)''')
-
-        # magnificent speedup
-        cursor.execute("""CREATE INDEX idx_osm_data_area_identifier ON osm_data (area_identifier);""")
-        cursor.execute("""CREATE INDEX idx_osm_data_id_type ON osm_data (id, type);""")
-    if "osm_data_update_log" in existing_tables(cursor):
-        print("osm_data_update_log table exists already, delete file with database to recreate")
-    else:
-        # register when data was downloaded so update can be done without downloading
-        # and processing the entire dataset
-        #
-        # instead just entries that were changed since then
-        # - and carry *(wikipedia|wikidata)* tags
-        # - that previously had problem reported about them
-        # should be downloaded
-        cursor.execute('''CREATE TABLE osm_data_update_log
-                    (area_identifier text, filename text, download_type text, download_timestamp integer)''')
-
-def process_given_area(cursor, entry):
+    database_schema.create_tables(cursor)
+
+def migrate_database_if_needed(cursor):
+    if "render_state" in database_schema.existing_tables(cursor) and "primary_report_count" not in database_schema.existing_columns(cursor, "render_state"):
+        # pages without stored count will be regenerated
+        print("adding primary_report_count column to render_state")
+        cursor.execute("""ALTER TABLE render_state ADD COLUMN primary_report_count integer""")
+    if "archive_key" not in database_schema.existing_columns(cursor, "osm_data_update_log"):
+        # downloads made earlier were not archived
+        print("adding archive_key column to osm_data_update_log")
+        cursor.execute("""ALTER TABLE osm_data_update_log ADD COLUMN archive_key text""")
+    cursor.execute("SELECT 1 FROM osm_data_update_log WHERE download_type = :replication GROUP BY area_identifier HAVING COUNT(*) > 1 LIMIT 1", {"replication": replication_diff.replication_download_type()})
+    if len(cursor.fetchall()) > 0:
+        # older code logged each applied replication diff, with filename of already removed diff
+        # only the latest one is needed, see replication_diff.record_replication_progress
+        print("keeping single replication_diff entry for each area in osm_data_update_log")
+        cursor.execute("""DELETE FROM osm_data_update_log
+        WHERE download_type = :replication AND rowid NOT IN (
+            SELECT MAX(rowid) FROM osm_data_update_log WHERE download_type = :replication GROUP BY area_identifier
+        )""", {"replication": replication_diff.replication_download_type()})
+        cursor.execute("UPDATE osm_data_update_log SET filename = NULL WHERE download_type = :replication", {"replication": replication_diff.replication_download_type()})
+    if "osm_data" in database_schema.existing_tables(cursor):
+        # older databases stored separate copy of object for each area
+        migrate_osm_data_table(cursor)
+        move_osm_data_to_object_store(cursor)
+
+def migrate_osm_data_table(cursor):
+    # brings osm_data to the last form it had, before being split into osm_objects and osm_object_areas
+    if "idx_osm_data_unique_object" not in database_schema.existing_indexes(cursor):
+        # required by upsert in load_osm_file
+        print("adding uniqueness constraint on (type, id, area_identifier) to osm_data")
+        # older code could leave duplicates behind, keep only the most recent entry
+        cursor.execute("""DELETE FROM osm_data
+        WHERE EXISTS (
+            SELECT 1 FROM osm_data AS newer
+            WHERE
+            newer.type = osm_data.type AND newer.id = osm_data.id AND newer.area_identifier = osm_data.area_identifier
+            AND
+            (newer.download_timestamp > osm_data.download_timestamp OR (newer.download_timestamp = osm_data.download_timestamp AND newer.rowid > osm_data.rowid))
+        )""")
+        print(cursor.rowcount, "duplicated entries removed")
+        cursor.execute("""CREATE UNIQUE INDEX idx_osm_data_unique_object ON osm_data (type, id, area_identifier);""")
+    if "validation_input_hash" not in database_schema.existing_columns(cursor, "osm_data"):
+        # allows to skip validation of objects where only unrelated tags or geometry changed
+        print("adding validation_input_hash column to osm_data")
+        cursor.execute("""ALTER TABLE osm_data ADD COLUMN validation_input_hash text""")
+    if "status" not in database_schema.existing_columns(cursor, "osm_data"):
+        print("adding status column to osm_data")
+        cursor.execute("""ALTER TABLE osm_data ADD COLUMN status integer""")
+        cursor.connection.commit()
+    if "idx_osm_data_area_identifier_status" not in database_schema.existing_indexes(cursor):
+        # index is created once status is filled, so its presence marks completed migration
+        fill_missing_report_status(cursor)
+        print("adding index on (area_identifier, status) to osm_data")
+        cursor.execute("""CREATE INDEX idx_osm_data_area_identifier_status ON osm_data (area_identifier, status);""")
+    if "idx_osm_data_error_id_area_identifier" not in database_schema.existing_indexes(cursor):
+        print("adding index on (error_id, area_identifier) to osm_data")
+        cursor.execute("""CREATE INDEX idx_osm_data_error_id_area_identifier ON osm_data (error_id, area_identifier);""")
+    osm_data_storage.compact_existing_rows(cursor)
+
+def move_osm_data_to_object_store(cursor):
+    # each area is moved in a separate transaction, so interrupted migration continues with remaining ones
+    # rows of areas no longer listed in regions_processed.yaml are dropped
+    # (language expected there is unknown, they would be deleted on the next download anyway)
+    print("moving osm_data to osm_objects and osm_object_areas")
+    # error_statistics is rebuilt once data is moved, there is no point in updating it for each removed row
+    for name in ["error_statistics_after_insert", "error_statistics_after_delete", "error_statistics_after_update_remove", "error_statistics_after_update_add"]:
+        cursor.execute("DROP TRIGGER IF EXISTS " + name)
+    cursor.execute("SELECT DISTINCT area_identifier FROM osm_data")
+    for (area_identifier,) in cursor.fetchall():
+        entry = config.get_entry_by_internal_region_name(area_identifier)
+        if entry != None:
+            parameters = {"identifier": area_identifier, "language_code": object_store.language_key(entry.get('language_code', None))}
+            cursor.execute("""INSERT INTO osm_object_areas (area_identifier, type, id, language_code, download_timestamp)
+            SELECT area_identifier, type, id, :language_code, download_timestamp FROM osm_data WHERE area_identifier = :identifier
+            ON CONFLICT(area_identifier, type, id) DO NOTHING""", parameters)
+            # newest copy of object wins
+            cursor.execute("""INSERT INTO osm_objects (type, id, language_code, lat, lon, tags, download_timestamp, validator_complaint, error_id, validation_input_hash, status)
+            SELECT type, id, :language_code, lat, lon, tags, download_timestamp, validator_complaint, error_id, validation_input_hash, status FROM osm_data WHERE area_identifier = :identifier
+            ON CONFLICT(type, id, language_code) DO UPDATE SET
+                lat = excluded.lat,
+                lon = excluded.lon,
+                tags = excluded.tags,
+                download_timestamp = excluded.download_timestamp,
+                validator_complaint = excluded.validator_complaint,
+                error_id = excluded.error_id,
+                validation_input_hash = excluded.validation_input_hash,
+                status = excluded.status
+            WHERE excluded.download_timestamp > osm_objects.download_timestamp""", parameters)
+        cursor.execute("DELETE FROM osm_data WHERE area_identifier = :identifier", {"identifier": area_identifier})
+        cursor.connection.commit()
+    cursor.execute("DROP TABLE osm_data")
+    error_statistics.create_triggers(cursor)
+    error_statistics.rebuild(cursor)
+    cursor.connection.commit()
+    print("running VACUUM to shrink database file")
+    cursor.execute("VACUUM")
+
+def status_migration_batch_size():
+    return 50_000
+
+def fill_missing_report_status(cursor):
+    # done in batches of rowid ranges, each in a separate transaction
+    # so database is not locked for a long time and interrupted migration
+    # continues where it stopped
+    cursor.execute("SELECT MIN(rowid), MAX(rowid) FROM osm_data WHERE status IS NULL")
+    first_rowid, last_rowid = cursor.fetchall()[0]
+    if first_rowid == None:
+        return
+    print("filling status column in osm_data")
+    for start in range(first_rowid, last_rowid + 1, status_migration_batch_size()):
+        cursor.execute("UPDATE osm_data SET status = " + report_status.status_for_complaint_sql("validator_complaint") + " WHERE rowid >= :start AND rowid < :end AND status IS NULL", {"start": start, "end": start + status_migration_batch_size()})
+        cursor.connection.commit()
+
+def ingest_and_validate_given_area(cursor, entry, downloaded):
     ignored_problems = entry.get('ignored_problems', [])
-    update_outdated_elements(cursor, entry, ignored_problems)
+    update_outdated_elements(cursor, entry, ignored_problems, downloaded)
     update_validator_reports_for_given_area(cursor, entry['internal_region_name'], entry.get('language_code', None), ignored_problems)
-    generate_webpage_with_error_output.generate_website_file_for_given_area(cursor, entry)
 
-def update_outdated_elements(cursor, entry, ignored_problems):
-    identifier_of_region_for_overpass_query=entry['identifier']
-    timestamp_when_file_was_downloaded = obtain_from_overpass.download_entry(cursor, entry['internal_region_name'], identifier_of_region_for_overpass_query)
+def update_outdated_elements(cursor, entry, ignored_problems, downloaded):
+    timestamp_when_file_was_downloaded = obtain_from_overpass.load_downloaded_data(cursor, entry['internal_region_name'], downloaded, entry.get('language_code', None), config.download_archive_location())
 
     # properly update by fetching new info about entries which also must be updated and could be missed
+    # done also when update was skipped as nothing changed - objects which lost wikipedia/wikidata tags
+    # are not counted by obtain_from_overpass.is_unchanged_since
     outdated_objects = outdated_entries_in_area_that_must_be_updated(cursor, entry['internal_region_name'], timestamp_when_file_was_downloaded)
+    outdated_by_type = {}
     for outdated in outdated_objects:
         rowid, object_type, object_id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id = outdated
         validator_complaint = json.loads(validator_complaint)
@@ -131,26 +363,40 @@ def update_outdated_elements(cursor, entry, ignored_problems):
             continue
         else:
             print(validator_complaint['error_id'], "IS NOT AMONG", ignored_problems)
-        data = osm_bot_abstraction_layer.get_data(object_id, object_type)
-        timestamp = int(time.time())
-        #print(json.dumps(returned, default=str, indent=3))
-        new_tags = "was deleted"
-        cursor.execute("""
-        DELETE FROM osm_data
-        WHERE
-        type = :type AND id = :id AND area_identifier = :identifier
-        """, {"type": object_type, "id": object_id, "identifier": entry['internal_region_name']})
-        if data != None: # None means that it was deleted
-            new_tags =  json.dumps(data["tag"], indent=3) # pretty format also in database for easier debugging
-            new_lat = lat
-            new_lon = lon
-            if object_type == "node":
-                new_lat = data["lat"]
-                new_lon = data["lon"]
-                # what about ways and relations?
-            #print(data)
-            cursor.execute("INSERT INTO osm_data VALUES (:type, :id, :lat, :lon, :tags, :area_identifier, :download_timestamp, :validator_complaint, :error_id)", {'type': object_type, 'id': object_id, 'lat': new_lat, 'lon': new_lon, "tags": new_tags, "area_identifier": entry['internal_region_name'], "download_timestamp": timestamp, "validator_complaint": None, 'error_id': None})
-        print(object_type, object_id, "is outdated, not in the report so its entry needs to be updated for", validator_complaint['error_id'], "in", entry['internal_region_name'])
+        if object_type not in outdated_by_type:
+            outdated_by_type[object_type] = []
+        outdated_by_type[object_type].append({"id": object_id, "lat": lat, "lon": lon, "error_id": validator_complaint['error_id']})
+
+    api = obtain_from_osm_api.get_api()
+    for object_type, outdated_of_this_type in outdated_by_type.items():
+        for chunk in obtain_from_osm_api.chunks(outdated_of_this_type):
+            fetched = obtain_from_osm_api.get_data_of_many_objects(api, object_type, [outdated["id"] for outdated in chunk])
+            timestamp = int(time.time())
+            for outdated in chunk:
+                update_outdated_element(cursor, entry, object_type, outdated, fetched[int(outdated["id"])], timestamp)
+            # one transaction per fetched chunk
+            cursor.connection.commit()
+
+def update_outdated_element(cursor, entry, object_type, outdated, data, timestamp):
+    object_id = outdated["id"]
+    if data == None: # None means that it was deleted
+        object_store.remove_objects(cursor, [(object_type, object_id)], timestamp)
+    else:
+        new_lat = outdated["lat"]
+        new_lon = outdated["lon"]
+        if object_type == "node":
+            new_lat = data["lat"]
+            new_lon = data["lon"]
+            # what about ways and relations?
+        fetched = {"osm_type": object_type, "osm_id": object_id, "lat": new_lat, "lon": new_lon, "osm_tags": data["tag"]}
+        row = load_osm_file.database_row(fetched, entry['internal_region_name'], timestamp, entry.get('language_code', None))
+        load_osm_file.record_batch(cursor, [row])
+        # reported problem is checked again even if tags affecting validation are the same
+        cursor.execute("""UPDATE osm_objects
+        SET validator_complaint = NULL, error_id = NULL, status = :not_checked
+        WHERE type = :type AND id = :id AND language_code = :language_code""",
+        {"not_checked": report_status.not_checked(), "type": object_type, "id": object_id, "language_code": row["language_code"]})
+    print(object_type, object_id, "is outdated, not in the report so its entry needs to be updated for", outdated['error_id'], "in", entry['internal_region_name'])
 
 def outdated_entries_in_area_that_must_be_updated(cursor, internal_region_name, timestamp_when_file_was_downloaded):
     # - entries currently are carrying reports and with outdated timestamps
@@ -160,79 +406,248 @@ def outdated_entries_in_area_that_must_be_updated(cursor, internal_region_name,
     #   - will not generate valid report
     #   - will not be false positives
 
-    cursor.execute("""SELECT rowid, type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id
-    FROM osm_data
+    #
+    # object is outdated if it was not present in the last download of this area
+    cursor.execute("""SELECT osm_objects.rowid, osm_objects.type, osm_objects.id, osm_objects.lat, osm_objects.lon, osm_objects.tags, osm_object_areas.area_identifier, osm_object_areas.download_timestamp, osm_objects.validator_complaint, osm_objects.error_id
+    FROM """ + object_store.area_join() + """
     WHERE
-    area_identifier = :identifier
+    osm_object_areas.area_identifier = :identifier
     AND
-    download_timestamp < :timestamp_when_file_was_downloaded
+    osm_object_areas.download_timestamp < :timestamp_when_file_was_downloaded
     AND
-    validator_complaint IS NOT NULL
-    AND
-    validator_complaint <> ""
-    """, {"identifier": internal_region_name, "timestamp_when_file_was_downloaded": timestamp_when_file_was_downloaded})
+    osm_objects.status = :reported
+    """, {"identifier": internal_region_name, "timestamp_when_file_was_downloaded": timestamp_when_file_was_downloaded, "reported": report_status.reported()})
     return cursor.fetchall()
 
 def update_validator_reports_for_given_area(cursor, internal_region_name, language_code, ignored_problems):
+    wikimedia_prefetch.prefetch_for_unvalidated_entries(cursor, internal_region_name)
     detect_problems_using_cache_for_wikimedia_data(cursor, internal_region_name, language_code)
     print("SKIPPING CACHE REFRESH OF WIKIDATA DATA") # TODO reestablish it in a proper way
     #print("NOW CHECKING WHAT WAS REPORTED WITHOUT USING CACHE!")
     #verify_that_problem_exist_without_using_cache_for_wikimedia_data(cursor, internal_region_name, language_code, ignored_problems)
 
 def detect_problems_using_cache_for_wikimedia_data(cursor, internal_region_name, language_code):
-    issue_detector = get_wikimedia_link_issue_reporter_object(language_code)
     # will recheck reported errors
     # will not recheck entries that previously were free of errors
-    cursor.execute('SELECT rowid, type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id FROM osm_data WHERE area_identifier = :identifier AND validator_complaint IS NULL', {"identifier": internal_region_name})
+    # objects already validated for other area with the same language are not validated again
+    cursor.execute(area_objects_query("osm_objects.status = :not_checked"), {"identifier": internal_region_name, "not_checked": report_status.not_checked()})
     entries = cursor.fetchall()
-    update_problem_for_all_this_entries(issue_detector, cursor, entries, [])
+    cache_statistics = validate_entries(cursor, entries, [], language_code, forced_refresh=False)
+    print(cache_statistics["reused"], "of", cache_statistics["reused"] + cache_statistics["validated"], "validations in", internal_region_name, "were skipped thanks to validation cache")
 
 def verify_that_problem_exist_without_using_cache_for_wikimedia_data(cursor, internal_region_name, language_code, ignored_problems):
-    issue_detector_refreshing_cache = get_wikimedia_link_issue_reporter_object(language_code, forced_refresh=True)
     # recheck reported with request to fetch cache
     # done separately to avoid refetching over and over again where everything is fine
     # (say, tags on a road/river)
-    cursor.execute('SELECT rowid, type, id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id FROM osm_data WHERE area_identifier = :identifier AND validator_complaint IS NOT NULL AND validator_complaint <> ""', {"identifier": internal_region_name})
+    cursor.execute(area_objects_query("osm_objects.status = :reported"), {"identifier": internal_region_name, "reported": report_status.reported()})
     entries = cursor.fetchall()
-    update_problem_for_all_this_entries(issue_detector_refreshing_cache, cursor, entries, ignored_problems)
+    validate_entries(cursor, entries, ignored_problems, language_code, forced_refresh=True)
+
+def area_objects_query(condition):
+    # rows in the form expected by validate_entries, rowid is rowid of osm_objects
+    return """SELECT osm_objects.rowid, osm_objects.type, osm_objects.id, osm_objects.lat, osm_objects.lon, osm_objects.tags, osm_object_areas.area_identifier, osm_objects.download_timestamp, osm_objects.validator_complaint, osm_objects.error_id
+    FROM """ + object_store.area_join() + """
+    WHERE osm_object_areas.area_identifier = :identifier AND """ + condition
+
+def validate_entries(cursor, entries, ignored_problems, language_code, forced_refresh):
+    detector_settings = get_wikimedia_link_issue_reporter_settings(language_code, forced_refresh)
+    worker_count = config.validation_worker_count()
+    if worker_count > 1:
+        return update_problem_for_all_this_entries_in_parallel(language_code, detector_settings, cursor, entries, ignored_problems, worker_count)
+    issue_detector = get_wikimedia_link_issue_reporter_object(language_code, forced_refresh)
+    return update_problem_for_all_this_entries(issue_detector, detector_settings, cursor, entries, ignored_problems)
 
-def update_problem_for_all_this_entries(issue_detector, cursor, entries, ignored_problems):
+def entries_requiring_validation(entries, ignored_problems):
     for entry in entries:
         rowid, object_type, object_id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id = entry
-        tags = json.loads(tags)
-        location = (lat, lon)
-        object_description = object_type + "/" + str(object_id)
         if validator_complaint != None:
             if len(ignored_problems) > 0:
                 validator_complaint = json.loads(validator_complaint)
                 if validator_complaint['error_id'] in ignored_problems:
                     continue
-        update_problem_for_entry(issue_detector, cursor, tags, location, object_type, object_id, object_description, rowid)
+        yield entry
 
-def update_problem_for_entry(issue_detector, cursor, tags, location, object_type, object_id, object_description, rowid):
+def update_problem_for_all_this_entries(issue_detector, detector_settings, cursor, entries, ignored_problems):
+    cache_statistics = {"validated": 0, "reused": 0}
+    for entry in entries_requiring_validation(entries, ignored_problems):
+        rowid, object_type, object_id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id = entry
+        tags = json.loads(tags)
+        location = (lat, lon)
         object_description = object_type + "/" + str(object_id)
-        reported = issue_detector.get_the_most_important_problem_generic(tags, location, object_type, object_description)
+        update_problem_for_entry(issue_detector, detector_settings, cursor, tags, location, object_type, object_id, object_description, rowid, cache_statistics)
+    return cache_statistics
+
+def update_problem_for_all_this_entries_in_parallel(language_code, detector_settings, cursor, entries, ignored_problems, worker_count, detector_factory=None):
+    # validation is split across worker processes, each with its own WikimediaLinkIssueDetector
+    # (created by detector_factory, see worker_issue_detector)
+    # this process remains the only one writing to database
+    #
+    # produces the same results as update_problem_for_all_this_entries:
+    # in both cases only the first object with a given validation cache key is validated
+    # (unless result depends on location) and remaining ones are reusing its result
+    #
+    # entries are processed in slices, results are recorded and committed after each one
+    # so interrupted run keeps already completed validations
+    if detector_factory == None:
+        detector_factory = worker_issue_detector
+    cache_statistics = {"validated": 0, "reused": 0}
+    known_results = {}
+    workers = {"pool": None}
+    entries = sorted(entries_requiring_validation(entries, ignored_problems), key=lambda entry: entry[0])
+    try:
+        for index in range(0, len(entries), parallel_validation_slice_size()):
+            validate_slice_in_parallel(workers, language_code, detector_settings, cursor, entries[index:index + parallel_validation_slice_size()], worker_count, detector_factory, known_results, cache_statistics)
+            cursor.connection.commit()
+    finally:
+        if workers["pool"] != None:
+            workers["pool"].terminate()
+            workers["pool"].join()
+    return cache_statistics
+
+def parallel_validation_slice_size():
+    # objects recorded in database at once
+    return 10_000
+
+def validate_slice_in_parallel(workers, language_code, detector_settings, cursor, entries, worker_count, detector_factory, known_results, cache_statistics):
+    # known_results (cache key to report data or None) is kept across slices
+    version = validation_cache.validator_version()
+    pending = []
+    for entry in entries:
+        rowid, object_type, object_id, lat, lon, tags, area_identifier, download_timestamp, validator_complaint, error_id = entry
+        tags = json.loads(tags)
+        location = (lat, lon)
+        key = validation_cache.cache_key(tags, location, object_type, detector_settings)
+        if detector_settings["forced_refresh"] == False and key not in known_results:
+            cached = validation_cache.get_cached_result(cursor, key, version)
+            if cached == "":
+                known_results[key] = None
+            elif cached != None:
+                known_results[key] = cached
+        pending.append({"rowid": rowid, "object_type": object_type, "object_id": object_id, "tags": tags, "location": location, "key": key})
+
+    results_by_rowid = {}
+    # first one object for each cache key, then objects with location dependent results
+    # (there is no point in sending them all at once as most will share results)
+    for validation_round in range(2):
+        requested_keys = set()
+        to_validate = []
+        for object_data in pending:
+            if object_data["rowid"] in results_by_rowid or object_data["key"] in known_results:
+                continue
+            if validation_round == 0 and detector_settings["forced_refresh"] == False:
+                if object_data["key"] in requested_keys:
+                    continue
+                requested_keys.add(object_data["key"])
+            to_validate.append(object_data)
+        if len(to_validate) == 0:
+            continue
+        if workers["pool"] == None:
+            workers["pool"] = validation_worker_pool(language_code, detector_settings, worker_count, detector_factory)
+        for rowid, data in validate_in_worker_processes(workers["pool"], to_validate):
+            results_by_rowid[rowid] = data
+        for object_data in to_validate:
+            data = results_by_rowid[object_data["rowid"]]
+            validation_cache.store_result(cursor, object_data["key"], version, data)
+            if detector_settings["forced_refresh"] == False:
+                if data == None or data['error_id'] not in validation_cache.location_dependent_error_ids():
+                    known_results[object_data["key"]] = data
+
+    for object_data in pending:
+        if object_data["rowid"] in results_by_rowid:
+            cache_statistics["validated"] += 1
+            data = results_by_rowid[object_data["rowid"]]
+        else:
+            cache_statistics["reused"] += 1
+            data = known_results[object_data["key"]]
+        if data != None:
+            data = dict(data)
+        record_problem_for_entry(cursor, data, object_data["tags"], object_data["object_type"], object_data["object_id"], object_data["rowid"])
+
+def validation_chunk_size():
+    return 200
+
+def validation_worker_pool(language_code, detector_settings, worker_count, detector_factory):
+    # forking is unsafe as validation runs in a thread of region pipeline
+    # detector_factory is passed by reference, so it must be a module level function
+    return multiprocessing.get_context("forkserver").Pool(worker_count, initializer=initialize_validation_worker, initargs=(detector_factory, language_code, detector_settings["forced_refresh"]))
+
+def validate_in_worker_processes(pool, objects):
+    # yields (rowid, report data or None) pairs
+    chunks = []
+    for index in range(0, len(objects), validation_chunk_size()):
+        chunks.append(objects[index:index + validation_chunk_size()])
+    for chunk_results in pool.imap(validate_chunk_in_worker, chunks):
+        for result in chunk_results:
+            yield result
+
+validation_worker_issue_detector = None
+
+def worker_issue_detector(language_code, forced_refresh):
+    # default detector_factory of validation workers
+    wikimedia_connection.set_cache_location(config.get_wikimedia_connection_cache_location())
+    return get_wikimedia_link_issue_reporter_object(language_code, forced_refresh)
+
+def initialize_validation_worker(detector_factory, language_code, forced_refresh):
+    global validation_worker_issue_detector
+    validation_worker_issue_detector = detector_factory(language_code, forced_refresh)
+
+def validate_chunk_in_worker(objects):
+    returned = []
+    for object_data in objects:
+        object_description = object_data["object_type"] + "/" + str(object_data["object_id"])
+        reported = validation_worker_issue_detector.get_the_most_important_problem_generic(object_data["tags"], object_data["location"], object_data["object_type"], object_description)
+        data = None
         if reported != None:
-            link = "https://openstreetmap.org/" + object_type + "/" + str(object_id)
             data = reported.data()
-            data['osm_object_url'] = link # TODO eliminate need for this
-            data['tags'] = tags # TODO eliminate need for this
+        returned.append((object_data["rowid"], data))
+    return returned
+
+def get_the_most_important_problem_data(issue_detector, detector_settings, cursor, tags, location, object_type, object_description, cache_statistics):
+    # returns None if no problem was found
+    key = validation_cache.cache_key(tags, location, object_type, detector_settings)
+    version = validation_cache.validator_version()
+    if detector_settings["forced_refresh"] == False:
+        cached = validation_cache.get_cached_result(cursor, key, version)
+        if cached != None:
+            cache_statistics["reused"] += 1
+            if cached == "":
+                return None
+            return cached
+    cache_statistics["validated"] += 1
+    reported = issue_detector.get_the_most_important_problem_generic(tags, location, object_type, object_description)
+    data = None
+    if reported != None:
+        data = reported.data()
+    validation_cache.store_result(cursor, key, version, data)
+    return data
+
+def update_problem_for_entry(issue_detector, detector_settings, cursor, tags, location, object_type, object_id, object_description, rowid, cache_statistics):
+        object_description = object_type + "/" + str(object_id)
+        data = get_the_most_important_problem_data(issue_detector, detector_settings, cursor, tags, location, object_type, object_description, cache_statistics)
+        record_problem_for_entry(cursor, data, tags, object_type, object_id, rowid)
+
+def record_problem_for_entry(cursor, data, tags, object_type, object_id, rowid):
+        if data != None:
+            # osm_object_url and tags are added back by osm_data_storage.rehydrated_report
             error_id = data['error_id']
-            data = json.dumps(data)
-            cursor.execute("""UPDATE osm_data 
+            data = osm_data_storage.encode_complaint(data)
+            cursor.execute("""UPDATE osm_objects
             SET validator_complaint = :validator_complaint,
-                error_id = :error_id
+                error_id = :error_id,
+                status = :status
             WHERE rowid = :rowid""",
-            {"validator_complaint": data, "error_id": error_id, "rowid": rowid})
+            {"validator_complaint": data, "error_id": error_id, "status": report_status.reported(), "rowid": rowid})
         else:
-            cursor.execute("""UPDATE osm_data
+            cursor.execute("""UPDATE osm_objects
             SET validator_complaint = :validator_complaint,
-                error_id = :error_id
+                error_id = :error_id,
+                status = :status
             WHERE rowid = :rowid""",
-            {"validator_complaint": "", "error_id": "", "rowid": rowid})
+            {"validator_complaint": "", "error_id": "", "status": report_status.no_problem(), "rowid": rowid})
 
-def get_wikimedia_link_issue_reporter_object(language_code, forced_refresh=False):
-    return wikimedia_link_issue_reporter.WikimediaLinkIssueDetector(
+def get_wikimedia_link_issue_reporter_settings(language_code, forced_refresh=False):
+    # also part of validation cache key
+    return dict(
         forced_refresh=forced_refresh,
         expected_language_code=language_code, # may be None
         languages_ordered_by_preference=[language_code],
@@ -241,6 +656,9 @@ def get_wikimedia_link_issue_reporter_object(language_code, forced_refresh=False
         allow_false_positives=False
         )
 
+def get_wikimedia_link_issue_reporter_object(language_code, forced_refresh=False):
+    return wikimedia_link_issue_reporter.WikimediaLinkIssueDetector(**get_wikimedia_link_issue_reporter_settings(language_code, forced_refresh))
+
 def commit_and_publish_changes_in_report_directory():
     current_working_directory = os.getcwd()
     os.chdir(config.get_report_directory())
@@ -251,4 +669,5 @@ def commit_and_publish_changes_in_report_directory():
     os.system('git push')
     os.chdir(current_working_directory)
 
-main()
+if __name__ == '__main__':
+    main()
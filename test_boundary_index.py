@@ -0,0 +1,89 @@
+import unittest
+import os
+import json
+import time
+import tempfile
+import boundary_index
+
+# small fixture: square "country" with a lake (hole) and a separate island
+# and a region in its north-west corner
+def example_geojson():
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"ISO3166-1": "XA"}, "geometry": {"type": "MultiPolygon", "coordinates": [
+            [[[10.0, 50.0], [12.0, 50.0], [12.0, 52.0], [10.0, 52.0], [10.0, 50.0]], [[10.8, 50.8], [11.2, 50.8], [11.2, 51.2], [10.8, 51.2], [10.8, 50.8]]],
+            [[[13.0, 50.0], [13.5, 50.0], [13.5, 50.5], [13.0, 50.0]]],
+        ]}},
+        {"type": "Feature", "properties": {"ISO3166-2": "XA-NW"}, "geometry": {"type": "Polygon", "coordinates": [
+            [[10.0, 51.0], [11.0, 51.0], [11.0, 52.0], [10.0, 52.0], [10.0, 51.0]],
+        ]}},
+        {"type": "Feature", "properties": {"name": "without code"}, "geometry": {"type": "Polygon", "coordinates": [
+            [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 0.0]],
+        ]}},
+    ]}
+
+def example_osm_file_content():
+    # the same square country, outer ring split into two ways
+    return """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="50.0" lon="10.0"/>
+  <node id="2" lat="50.0" lon="12.0"/>
+  <node id="3" lat="52.0" lon="12.0"/>
+  <node id="4" lat="52.0" lon="10.0"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/></way>
+  <way id="11"><nd ref="1"/><nd ref="4"/><nd ref="3"/></way>
+  <relation id="100">
+    <member type="way" ref="10" role="outer"/>
+    <member type="way" ref="11" role="outer"/>
+    <tag k="boundary" v="administrative"/>
+    <tag k="ISO3166-1" v="XA"/>
+  </relation>
+</osm>
+"""
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.geojson_filepath = os.path.join(self.directory.name, "boundaries.geojson")
+        with open(self.geojson_filepath, 'w') as file:
+            json.dump(example_geojson(), file)
+        self.index = boundary_index.load_index(self.geojson_filepath)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_point_inside_country(self):
+        self.assertEqual(["xa"], boundary_index.codes_at(self.index, 50.5, 11.5))
+        self.assertTrue(boundary_index.is_within(self.index, 50.5, 11.5, "XA"))
+
+    def test_point_inside_region(self):
+        self.assertEqual(["xa", "xa-nw"], sorted(boundary_index.codes_at(self.index, 51.5, 10.5)))
+
+    def test_point_in_hole_and_outside(self):
+        self.assertEqual([], boundary_index.codes_at(self.index, 51.0, 11.0))
+        self.assertEqual([], boundary_index.codes_at(self.index, 53.0, 11.0))
+        self.assertEqual([], boundary_index.codes_at(self.index, 50.4, 13.1))
+
+    def test_point_on_island(self):
+        self.assertEqual(["xa"], boundary_index.codes_at(self.index, 50.1, 13.4))
+
+    def test_boundaries_without_code_are_skipped(self):
+        self.assertEqual(2, len(boundary_index.load_boundaries(self.geojson_filepath)))
+
+    def test_all_coordinates_must_be_within(self):
+        self.assertTrue(boundary_index.are_all_within(self.index, [(50.5, 11.5), (51.5, 10.5)], "xa"))
+        self.assertFalse(boundary_index.are_all_within(self.index, [(50.5, 11.5), (53.0, 11.0)], "xa"))
+
+    def test_osm_file_with_ring_split_into_ways(self):
+        filepath = os.path.join(self.directory.name, "boundaries.osm")
+        with open(filepath, 'w') as file:
+            file.write(example_osm_file_content())
+        index = boundary_index.load_index(filepath)
+        self.assertTrue(boundary_index.is_within(index, 51.0, 11.0, "xa"))
+        self.assertFalse(boundary_index.is_within(index, 49.0, 11.0, "xa"))
+
+    def test_batch_is_fast(self):
+        coordinates = [(50.0 + i * 0.0002, 10.0 + i * 0.0002) for i in range(10_000)]
+        start = time.time()
+        for lat, lon in coordinates:
+            boundary_index.codes_at(self.index, lat, lon)
+        self.assertLess(time.time() - start, 1)
@@ -0,0 +1,61 @@
+import unittest
+import os
+import tempfile
+import config
+
+def example_entry(name, **extra):
+    entry = {"internal_region_name": name, "website_main_title_part": name + " (page)", "identifier": {"wikidata": "Q1"}}
+    entry.update(extra)
+    return entry
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.original_entries_to_process = config.get_entries_to_process
+
+    def tearDown(self):
+        config.get_entries_to_process = self.original_entries_to_process
+
+    def test_yaml_file_is_parsed_again_only_after_modification(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "example.yaml")
+            with open(filepath, 'w') as file:
+                file.write("{a: 1}")
+            first = config.parse_yaml_file(filepath)
+            self.assertEqual({"a": 1}, first)
+            self.assertIs(first, config.parse_yaml_file(filepath))
+            with open(filepath, 'w') as file:
+                file.write("{a: 22}")
+            os.utime(filepath, ns=(os.stat(filepath).st_atime_ns, os.stat(filepath).st_mtime_ns + 1_000_000_000))
+            self.assertEqual({"a": 22}, config.parse_yaml_file(filepath))
+
+    def test_lookups(self):
+        entries = [
+            example_entry("Kraków", language_code="pl", merged_into=["Polska"]),
+            example_entry("Warszawa", language_code="pl", merged_into=["Polska"], hidden=True),
+            example_entry("Berlin"),
+        ]
+        config.get_entries_to_process = lambda: entries
+        self.assertEqual([entries[0], entries[2]], config.get_visible_entries_to_process())
+        self.assertEqual({"Polska": [entries[0], entries[1]]}, config.get_entries_by_merged_group())
+        self.assertEqual({"pl": [entries[0], entries[1]], None: [entries[2]]}, config.get_entries_by_language_code())
+        self.assertIs(entries[2], config.get_entry_by_internal_region_name("Berlin"))
+        self.assertEqual(None, config.get_entry_by_internal_region_name("Wien"))
+
+    def test_validation_accepts_valid_entries(self):
+        config.validate_entries([example_entry("Kraków", language_code=None, priority_multiplier=0.5, ignored_problems=["a"], requested_by="someone", download_format="json")])
+
+    def test_validation_rejects_malformed_entries(self):
+        for entries in [
+            [example_entry("Kraków/Nowa Huta")],
+            [example_entry("Kraków", website_main_title_part="a/b")],
+            [example_entry("Kraków"), example_entry("Kraków")],
+            [example_entry("Kraków", merged_into="Polska")],
+            [example_entry("Kraków", langauge_code="pl")],
+            [example_entry("Kraków", download_format="pbf")],
+            [{"internal_region_name": "Kraków", "website_main_title_part": "Kraków"}],
+        ]:
+            with self.assertRaises(Exception):
+                config.validate_entries(entries)
+
+    def test_regions_processed_yaml_is_valid(self):
+        config.validate_entries(config.parse_yaml_file("regions_processed.yaml"))
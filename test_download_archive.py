@@ -0,0 +1,94 @@
+import unittest
+import database_schema
+import os
+import gzip
+import tempfile
+import download_archive
+import obtain_from_overpass
+import object_store
+
+def example_osm_file_content(wikidata):
+    return """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="Overpass API">
+  <node id="1" lat="50.0" lon="19.0">
+    <tag k="wikidata" v=\"""" + wikidata + """\"/>
+  </node>
+</osm>
+"""
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, "archive")
+        self.cursor = database_schema.create_in_memory_database()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, filename, content):
+        filepath = os.path.join(self.directory.name, filename)
+        with open(filepath, 'w') as file:
+            file.write(content)
+        return filepath
+
+    def load(self, area_identifier, download_type, timestamp, wikidata):
+        filepath = self.write("downloaded.osm", example_osm_file_content(wikidata))
+        downloaded = {"filepath": filepath, "download_type": download_type, "timestamp": timestamp}
+        obtain_from_overpass.load_downloaded_data(self.cursor, area_identifier, downloaded, "pl", self.location)
+        os.remove(filepath)
+
+    def stored_tags(self):
+        self.cursor.execute("SELECT osm_object_areas.area_identifier, osm_objects.tags FROM " + object_store.area_join() + " ORDER BY osm_object_areas.area_identifier")
+        return self.cursor.fetchall()
+
+    def test_identical_content_is_stored_once_and_compressed(self):
+        first = download_archive.store(self.location, self.write("a.osm", example_osm_file_content("Q1")))
+        second = download_archive.store(self.location, self.write("b.osm", example_osm_file_content("Q1")))
+        third = download_archive.store(self.location, self.write("c.osm", example_osm_file_content("Q2")))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+        self.assertEqual(2, len(download_archive.stored_files(self.location)))
+        with gzip.open(download_archive.archive_filepath(self.location, first), 'rt') as file:
+            self.assertEqual(example_osm_file_content("Q1"), file.read())
+
+    def test_area_is_rebuilt_from_archive(self):
+        self.load("Kraków", "initial_full_data", 1000, "Q1")
+        self.load("Kraków", "update_since_previous_download", 2000, "Q2")
+        self.cursor.execute("DELETE FROM osm_object_areas")
+        self.cursor.execute("DELETE FROM osm_objects")
+        work_filepath = os.path.join(self.directory.name, "replay.osm")
+        self.assertEqual(2, download_archive.replay_area(self.cursor, self.location, "Kraków", "pl", work_filepath))
+        self.assertEqual([("Kraków", '{"wikidata":"Q2"}')], self.stored_tags())
+        self.assertFalse(os.path.exists(work_filepath))
+
+    def test_replay_starts_from_the_latest_full_download(self):
+        self.load("Kraków", "initial_full_data", 1000, "Q1")
+        self.load("Kraków", "initial_full_data", 2000, "Q3")
+        self.assertEqual([("initial_full_data", 2000, download_archive.content_key(self.write("x.osm", example_osm_file_content("Q3"))))], download_archive.replay_chain(self.cursor, "Kraków"))
+
+    def test_area_with_not_archived_update_is_not_replayed(self):
+        self.load("Kraków", "initial_full_data", 1000, "Q1")
+        self.cursor.execute("INSERT INTO osm_data_update_log (area_identifier, filename, download_type, download_timestamp) VALUES ('Kraków', NULL, 'replication_diff', 2000)")
+        with self.assertRaises(Exception):
+            download_archive.replay_area(self.cursor, self.location, "Kraków", "pl", os.path.join(self.directory.name, "replay.osm"))
+        self.assertEqual([("Kraków", '{"wikidata":"Q1"}')], self.stored_tags())
+
+    def test_skipped_update_is_recorded_and_ignored_in_replay(self):
+        self.load("Kraków", "initial_full_data", 1000, "Q1")
+        unchanged = {"filepath": None, "download_type": obtain_from_overpass.unchanged_download_type(), "timestamp": 2000}
+        self.assertEqual(2000, obtain_from_overpass.load_downloaded_data(self.cursor, "Kraków", unchanged, "pl", self.location))
+        self.assertEqual(2000, obtain_from_overpass.get_data_timestamp(self.cursor, "Kraków"))
+        self.assertEqual([("Kraków", '{"wikidata":"Q1"}')], self.stored_tags())
+        self.assertEqual(1, len(download_archive.replay_chain(self.cursor, "Kraków")))
+
+    def test_retention_removes_oldest_files_not_needed_for_replay(self):
+        self.load("Kraków", "initial_full_data", 1000, "Q1")
+        self.load("Kraków", "initial_full_data", 2000, "Q2")
+        self.load("Kraków", "update_since_previous_download", 3000, "Q3")
+        self.load("Warszawa", "initial_full_data", 1500, "Q4")
+        files = download_archive.stored_files(self.location)
+        self.assertEqual(0, download_archive.apply_retention(self.cursor, self.location, sum(files.values())))
+        self.assertEqual(1, download_archive.apply_retention(self.cursor, self.location, 0))
+        self.cursor.execute("SELECT area_identifier, download_timestamp FROM osm_data_update_log WHERE archive_key IS NULL")
+        self.assertEqual([("Kraków", 1000)], self.cursor.fetchall())
+        self.assertEqual(3, len(download_archive.stored_files(self.location)))
@@ -0,0 +1,63 @@
+import unittest
+import database_schema
+import error_statistics
+
+def insert(cursor, osm_id, area_identifier, validator_complaint, error_id):
+    add_to_area(cursor, osm_id, area_identifier)
+    cursor.execute("INSERT INTO osm_objects (type, id, language_code, validator_complaint, error_id) VALUES ('node', :id, 'pl', :validator_complaint, :error_id)", {"id": osm_id, "validator_complaint": validator_complaint, "error_id": error_id})
+
+def add_to_area(cursor, osm_id, area_identifier):
+    cursor.execute("INSERT INTO osm_object_areas (area_identifier, type, id, language_code) VALUES (:area_identifier, 'node', :id, 'pl')", {"id": osm_id, "area_identifier": area_identifier})
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.cursor = database_schema.create_in_memory_database()
+        insert(self.cursor, 1, "Kraków", '{"error_id": "a"}', "a")
+        insert(self.cursor, 2, "Kraków", '{"error_id": "a"}', "a")
+        insert(self.cursor, 3, "Kraków", '{"error_id": "b"}', "b")
+        insert(self.cursor, 4, "Kraków", "", "")
+        insert(self.cursor, 5, "Kraków", None, None)
+        insert(self.cursor, 6, "Warszawa", '{"error_id": "a"}', "a")
+
+    def test_counts_are_maintained_on_insert(self):
+        self.assertEqual({("Kraków", "a"): 2, ("Kraków", "b"): 1, ("Warszawa", "a"): 1}, error_statistics.stored_counts(self.cursor))
+
+    def test_counts_are_maintained_on_update(self):
+        # report replaced by other one, removed, added and changed to other type
+        self.cursor.execute("UPDATE osm_objects SET validator_complaint = '{\"error_id\": \"a\", \"x\": 1}' WHERE id = 1")
+        self.cursor.execute("UPDATE osm_objects SET validator_complaint = '', error_id = '' WHERE id = 2")
+        self.cursor.execute("UPDATE osm_objects SET validator_complaint = '{\"error_id\": \"b\"}', error_id = 'b' WHERE id = 4")
+        self.cursor.execute("UPDATE osm_objects SET validator_complaint = '{\"error_id\": \"c\"}', error_id = 'c' WHERE id = 6")
+        self.assertEqual({("Kraków", "a"): 1, ("Kraków", "b"): 2, ("Warszawa", "c"): 1}, error_statistics.stored_counts(self.cursor))
+        self.assertEqual([], error_statistics.inconsistencies(self.cursor))
+
+    def test_counts_are_maintained_on_delete(self):
+        self.cursor.execute("DELETE FROM osm_object_areas WHERE area_identifier = 'Kraków'")
+        self.assertEqual({("Warszawa", "a"): 1}, error_statistics.stored_counts(self.cursor))
+        self.cursor.execute("DELETE FROM osm_objects WHERE id = 6")
+        self.assertEqual({}, error_statistics.stored_counts(self.cursor))
+
+    def test_report_is_counted_in_each_area_of_object(self):
+        add_to_area(self.cursor, 1, "Małopolska")
+        add_to_area(self.cursor, 4, "Małopolska")
+        self.assertEqual({("Kraków", "a"): 2, ("Kraków", "b"): 1, ("Małopolska", "a"): 1, ("Warszawa", "a"): 1}, error_statistics.stored_counts(self.cursor))
+        self.cursor.execute("UPDATE osm_objects SET validator_complaint = '{\"error_id\": \"b\"}', error_id = 'b' WHERE id = 1")
+        self.assertEqual({("Kraków", "a"): 1, ("Kraków", "b"): 2, ("Małopolska", "b"): 1, ("Warszawa", "a"): 1}, error_statistics.stored_counts(self.cursor))
+        # membership switched to object validated for other language
+        self.cursor.execute("INSERT INTO osm_objects (type, id, language_code, validator_complaint, error_id) VALUES ('node', 1, 'de', '', '')")
+        self.cursor.execute("UPDATE osm_object_areas SET language_code = 'de' WHERE area_identifier = 'Małopolska' AND id = 1")
+        self.assertEqual({("Kraków", "a"): 1, ("Kraków", "b"): 2, ("Warszawa", "a"): 1}, error_statistics.stored_counts(self.cursor))
+        self.assertEqual([], error_statistics.inconsistencies(self.cursor))
+
+    def test_report_count(self):
+        self.assertEqual(3, error_statistics.report_count(self.cursor, "Kraków", ["a", "b"]))
+        self.assertEqual(1, error_statistics.report_count(self.cursor, "Kraków", ["a", "b"], ["a"]))
+        self.assertEqual(0, error_statistics.report_count(self.cursor, "Gdańsk", ["a", "b"]))
+
+    def test_checker_repairs_inconsistent_table(self):
+        self.cursor.execute("UPDATE error_statistics SET count = 7 WHERE area_identifier = 'Warszawa'")
+        self.cursor.execute("DELETE FROM error_statistics WHERE error_id = 'b'")
+        self.assertEqual([("Kraków", "b", 0, 1), ("Warszawa", "a", 7, 1)], error_statistics.inconsistencies(self.cursor))
+        self.assertFalse(error_statistics.check_and_repair(self.cursor))
+        self.assertEqual([], error_statistics.inconsistencies(self.cursor))
+        self.assertTrue(error_statistics.check_and_repair(self.cursor))
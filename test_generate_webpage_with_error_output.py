@@ -0,0 +1,58 @@
+import unittest
+import os
+import tempfile
+import generate_webpage_with_error_output as webpage
+
+def example_report(error_id, osm_object_url, message):
+    return {"error_id": error_id, "error_message": message, "error_general_intructions": None, "osm_object_url": osm_object_url, "tags": {}, "proposed_tagging_changes": None}
+
+class Tests(unittest.TestCase):
+    def render(self, reports, types):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "page.html")
+            count = webpage.generate_html_file(reports, filepath, types, "header", [1675000000])
+            with open(filepath) as file:
+                return count, file.read()
+
+    def test_group_reports_by_error_id_sorts_each_group(self):
+        reports = [
+            example_report("b", "https://www.openstreetmap.org/way/2", "1"),
+            example_report("a", "https://www.openstreetmap.org/node/5", "2"),
+            example_report("b", "https://www.openstreetmap.org/node/1", "3"),
+        ]
+        grouped = webpage.group_reports_by_error_id(reports)
+        self.assertEqual(["2"], [e["error_message"] for e in grouped["a"]])
+        self.assertEqual(["3", "1"], [e["error_message"] for e in grouped["b"]])
+
+    def test_sections_follow_order_of_types_and_duplicates_are_listed_once(self):
+        reports = [
+            example_report("second", "https://www.openstreetmap.org/node/1", "second problem"),
+            example_report("first", "https://www.openstreetmap.org/node/2", "first problem"),
+            example_report("first", "https://www.openstreetmap.org/node/2", "first problem"),
+            example_report("not listed", "https://www.openstreetmap.org/node/3", "skipped problem"),
+        ]
+        count, page = self.render(reports, ["first", "second", "first"])
+        self.assertEqual(2, count)
+        self.assertEqual(1, page.count("first problem"))
+        self.assertNotIn("skipped problem", page)
+        self.assertTrue(page.index('<h2 id="first">') < page.index('<h2 id="second">'))
+        self.assertEqual(1, page.count('<h2 id="first">'))
+
+    def test_josm_query_lists_objects_of_given_type(self):
+        reports = [
+            example_report("first", "https://www.openstreetmap.org/way/7", "a"),
+            example_report("second", "https://www.openstreetmap.org/node/8", "b"),
+        ]
+        count, page = self.render(reports, ["first"])
+        self.assertIn("way(7);", page)
+        self.assertNotIn("node(8);", page)
+
+    def test_query_from_sorted_reports_matches_query_from_unsorted_ones(self):
+        reports = [
+            example_report("first", "https://www.openstreetmap.org/way/7", "a"),
+            example_report("first", "https://www.openstreetmap.org/node/8", "b"),
+        ]
+        grouped = webpage.group_reports_by_error_id(reports)
+        self.assertEqual(
+            webpage.get_query_for_loading_errors_by_category_from_error_data(reports, ["first"], "josm"),
+            webpage.get_query_for_loading_errors_from_sorted_reports(grouped["first"], ["first"], "josm"))
@@ -0,0 +1,65 @@
+import unittest
+import os
+import tempfile
+import time
+import geocode_cache
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.directory.name, "reverse_geocode_cache.db")
+        self.lookups = []
+        for name in geocode_cache.run_counters:
+            geocode_cache.run_counters[name] = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fake_lookup(self, lat, lon):
+        # stand-in for Nominatim
+        self.lookups.append((lat, lon))
+        if lon > 19.0:
+            return "pl"
+        return "cz"
+
+    def test_repeated_location_is_looked_up_once(self):
+        cursor = geocode_cache.open_cache(self.filepath).cursor()
+        self.assertEqual("pl", geocode_cache.country_code(cursor, 50.12345, 19.5, 4, 1000, self.fake_lookup))
+        self.assertEqual("pl", geocode_cache.country_code(cursor, 50.12345, 19.5, 4, 1000, self.fake_lookup))
+        self.assertEqual([(50.12345, 19.5)], self.lookups)
+        self.assertEqual({"hit": 1, "miss": 1, "expired": 0}, geocode_cache.run_counters)
+
+    def test_missing_directory_is_created(self):
+        filepath = os.path.join(self.directory.name, "missing", "reverse_geocode_cache.db")
+        cursor = geocode_cache.open_cache(filepath).cursor()
+        self.assertEqual("pl", geocode_cache.country_code(cursor, 50.0, 19.5, 4, 1000, self.fake_lookup))
+        self.assertTrue(os.path.exists(filepath))
+
+    def test_cache_persists_between_runs(self):
+        connection = geocode_cache.open_cache(self.filepath)
+        geocode_cache.country_code(connection.cursor(), 50.0, 18.5, 4, 1000, self.fake_lookup)
+        connection.close()
+        cursor = geocode_cache.open_cache(self.filepath).cursor()
+        self.assertEqual("cz", geocode_cache.country_code(cursor, 50.0, 18.5, 4, 1000, self.fake_lookup))
+        self.assertEqual(1, len(self.lookups))
+        self.assertEqual({"hit": 1, "miss": 1, "expired": 0}, geocode_cache.stored_counters(cursor))
+
+    def test_nearby_locations_share_entry_with_given_precision(self):
+        cursor = geocode_cache.open_cache(self.filepath).cursor()
+        geocode_cache.country_code(cursor, 50.00001, 19.50001, 4, 1000, self.fake_lookup)
+        geocode_cache.country_code(cursor, 50.00002, 19.49999, 4, 1000, self.fake_lookup)
+        self.assertEqual(1, len(self.lookups))
+        geocode_cache.country_code(cursor, 50.00002, 19.49999, 5, 1000, self.fake_lookup)
+        self.assertEqual(2, len(self.lookups))
+
+    def test_outdated_entry_is_looked_up_again(self):
+        cursor = geocode_cache.open_cache(self.filepath).cursor()
+        geocode_cache.store_country_code(cursor, 50.0, 19.5, 4, "sk")
+        cursor.execute("UPDATE reverse_geocode_cache SET cached_timestamp = :timestamp", {"timestamp": int(time.time()) - 2000})
+        self.assertEqual("pl", geocode_cache.country_code(cursor, 50.0, 19.5, 4, 1000, self.fake_lookup))
+        self.assertEqual(1, geocode_cache.run_counters["expired"])
+        geocode_cache.store_country_code(cursor, 51.0, 19.5, 4, "pl")
+        cursor.execute("UPDATE reverse_geocode_cache SET cached_timestamp = :timestamp WHERE lat_key = 510000", {"timestamp": int(time.time()) - 2000})
+        geocode_cache.remove_outdated_entries(cursor, 1000)
+        cursor.execute("SELECT COUNT(*) FROM reverse_geocode_cache")
+        self.assertEqual(1, cursor.fetchall()[0][0])
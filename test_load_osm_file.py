@@ -0,0 +1,216 @@
+import unittest
+import database_schema
+import os
+import tempfile
+import load_osm_file
+import object_store
+import report_status
+
+def example_osm_file_content():
+    return """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="Overpass API">
+<note>The data included in this document is from www.openstreetmap.org. The data is made available under ODbL.</note>
+<meta osm_base="2023-01-29T10:00:00Z" areas="2023-01-29T09:00:00Z"/>
+  <node id="1" lat="50.0" lon="19.0">
+    <tag k="name" v="Kraków"/>
+    <tag k="wikidata" v="Q31487"/>
+  </node>
+  <node id="2" lat="50.5" lon="19.5"/>
+  <way id="10">
+    <center lat="50.1" lon="19.1"/>
+    <nd ref="1"/>
+    <nd ref="2"/>
+    <tag k="wikipedia" v="pl:Wisła"/>
+  </way>
+  <way id="11">
+    <nd ref="1"/>
+    <tag k="wikipedia" v="pl:Odra"/>
+  </way>
+  <relation id="100">
+    <center lat="50.2" lon="19.2"/>
+    <member type="way" ref="10" role="outer"/>
+    <tag k="type" v="multipolygon"/>
+    <tag k="subject:wikidata" v="Q1"/>
+  </relation>
+</osm>
+"""
+
+def example_json_file_content():
+    # the same data as example_osm_file_content, as [out:json] output
+    return """{
+  "version": 0.6,
+  "generator": "Overpass API",
+  "osm3s": {
+    "timestamp_osm_base": "2023-01-29T10:00:00Z",
+    "timestamp_areas_base": "2023-01-29T09:00:00Z",
+    "copyright": "The data included in this document is from www.openstreetmap.org. The data is made available under ODbL."
+  },
+  "elements": [
+
+{
+  "type": "node",
+  "id": 1,
+  "lat": 50.0000000,
+  "lon": 19.0000000,
+  "tags": {
+    "name": "Kraków",
+    "wikidata": "Q31487"
+  }
+},
+{
+  "type": "node",
+  "id": 2,
+  "lat": 50.5000000,
+  "lon": 19.5000000
+},
+{
+  "type": "way",
+  "id": 10,
+  "center": {
+    "lat": 50.1000000,
+    "lon": 19.1000000
+  },
+  "nodes": [
+    1,
+    2
+  ],
+  "tags": {
+    "wikipedia": "pl:Wisła"
+  }
+},
+{
+  "type": "way",
+  "id": 11,
+  "nodes": [
+    1
+  ],
+  "tags": {
+    "wikipedia": "pl:Odra"
+  }
+},
+{
+  "type": "relation",
+  "id": 100,
+  "center": {
+    "lat": 50.2000000,
+    "lon": 19.2000000
+  },
+  "members": [
+    {
+      "type": "way",
+      "ref": 10,
+      "role": "outer"
+    }
+  ],
+  "tags": {
+    "type": "multipolygon",
+    "subject:wikidata": "Q1"
+  }
+}
+
+  ]
+}
+"""
+
+def example_entry(tags):
+    return {"osm_type": "node", "osm_id": "1", "lat": 50.0, "lon": 19.0, "osm_tags": tags}
+
+class Tests(unittest.TestCase):
+    def read_example(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "example.osm")
+            with open(filepath, 'w') as file:
+                file.write(example_osm_file_content())
+            return list(load_osm_file.xml_streaming_of_osm_file(filepath))
+
+    def test_streaming_reads_all_element_types_in_single_pass(self):
+        self.assertEqual([
+            {"osm_type": "node", "osm_id": "1", "lat": 50.0, "lon": 19.0, "osm_tags": {"name": "Kraków", "wikidata": "Q31487"}},
+            {"osm_type": "way", "osm_id": "10", "lat": 50.1, "lon": 19.1, "osm_tags": {"wikipedia": "pl:Wisła"}},
+            {"osm_type": "relation", "osm_id": "100", "lat": 50.2, "lon": 19.2, "osm_tags": {"type": "multipolygon", "subject:wikidata": "Q1"}},
+        ], self.read_example())
+
+    def write_example(self, directory, filename, content):
+        filepath = os.path.join(directory, filename)
+        with open(filepath, 'w') as file:
+            file.write(content)
+        return filepath
+
+    def test_json_output_gives_the_same_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = self.write_example(directory, "example.osm", example_json_file_content())
+            self.assertEqual("json", load_osm_file.osm_file_format(filepath))
+            self.assertEqual(self.read_example(), list(load_osm_file.streaming_of_osm_file(filepath)))
+            # elements split between chunks, including numbers
+            for chunk_size in [1, 7, 50]:
+                self.assertEqual(self.read_example(), list(load_osm_file.json_streaming_of_osm_file(filepath, chunk_size)))
+
+    def test_truncated_json_output_is_rejected(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = self.write_example(directory, "example.osm", example_json_file_content()[:500])
+            with self.assertRaises(Exception):
+                list(load_osm_file.json_streaming_of_osm_file(filepath, 7))
+
+    def test_streaming_skips_objects_without_tags_and_without_center(self):
+        for entry in self.read_example():
+            self.assertNotEqual(entry["osm_id"], "2")
+            self.assertNotEqual(entry["osm_id"], "11")
+
+    def test_record_skips_irrelevant_objects(self):
+        cursor = database_schema.create_in_memory_database()
+        self.assertEqual(False, load_osm_file.record(cursor, example_entry({"name": "Kraków"}), "Polska", 1000, "pl"))
+        cursor.execute("SELECT COUNT(*) FROM osm_objects")
+        self.assertEqual(0, cursor.fetchall()[0][0])
+
+    def test_record_replaces_only_with_newer_data(self):
+        cursor = database_schema.create_in_memory_database()
+        self.assertEqual(True, load_osm_file.record(cursor, example_entry({"wikidata": "Q1"}), "Polska", 1000, "pl"))
+        cursor.execute("UPDATE osm_objects SET validator_complaint = '', status = 1")
+        self.assertEqual(False, load_osm_file.record(cursor, example_entry({"wikidata": "Q2"}), "Polska", 500, "pl"))
+        self.assertEqual(True, load_osm_file.record(cursor, example_entry({"wikidata": "Q3"}), "Polska", 2000, "pl"))
+        cursor.execute("SELECT tags, download_timestamp, validator_complaint, status FROM osm_objects")
+        self.assertEqual([('{"wikidata":"Q3"}', 2000, None, report_status.not_checked())], cursor.fetchall())
+
+    def test_object_in_several_areas_is_stored_once(self):
+        cursor = database_schema.create_in_memory_database()
+        self.assertEqual(True, load_osm_file.record(cursor, example_entry({"wikidata": "Q1"}), "Małopolska", 1000, "pl"))
+        self.assertEqual(False, load_osm_file.record(cursor, example_entry({"wikidata": "Q1"}), "Polska", 1000, "pl"))
+        self.assertEqual(True, load_osm_file.record(cursor, example_entry({"wikidata": "Q2"}), "Polska", 2000, "pl"))
+        cursor.execute("SELECT type, id, language_code, tags FROM osm_objects")
+        self.assertEqual([('node', 1, 'pl', '{"wikidata":"Q2"}')], cursor.fetchall())
+        cursor.execute("SELECT osm_object_areas.area_identifier, osm_objects.tags FROM " + object_store.area_join() + " ORDER BY osm_object_areas.area_identifier")
+        self.assertEqual([('Małopolska', '{"wikidata":"Q2"}'), ('Polska', '{"wikidata":"Q2"}')], cursor.fetchall())
+
+    def test_object_is_stored_separately_for_each_language(self):
+        cursor = database_schema.create_in_memory_database()
+        load_osm_file.record(cursor, example_entry({"wikidata": "Q1"}), "Polska", 1000, "pl")
+        load_osm_file.record(cursor, example_entry({"wikidata": "Q1"}), "Deutschland", 1000, "de")
+        cursor.execute("SELECT language_code FROM osm_objects ORDER BY language_code")
+        self.assertEqual([('de',), ('pl',)], cursor.fetchall())
+
+    def test_load_osm_file_writes_in_batches(self):
+        cursor = database_schema.create_in_memory_database()
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "example.osm")
+            with open(filepath, 'w') as file:
+                file.write(example_osm_file_content())
+            load_osm_file.load_osm_file(cursor, filepath, "Polska", 1000, "pl", batch_size=2)
+        cursor.execute("SELECT type, id FROM osm_objects ORDER BY type, id")
+        self.assertEqual([('node', 1), ('relation', 100), ('way', 10)], cursor.fetchall())
+
+    def test_record_keeps_validation_result_when_only_unrelated_tags_changed(self):
+        cursor = database_schema.create_in_memory_database()
+        load_osm_file.record(cursor, example_entry({"wikidata": "Q1", "highway": "residential"}), "Polska", 1000, "pl")
+        cursor.execute("UPDATE osm_objects SET validator_complaint = '', error_id = '', status = 1")
+        self.assertEqual(True, load_osm_file.record(cursor, example_entry({"wikidata": "Q1", "highway": "service"}), "Polska", 2000, "pl"))
+        cursor.execute("SELECT tags, download_timestamp, validator_complaint, status FROM osm_objects")
+        self.assertEqual([('{"wikidata":"Q1","highway":"service"}', 2000, '', report_status.no_problem())], cursor.fetchall())
+
+    def test_validation_input_hash_depends_on_language(self):
+        tags = {"wikipedia": "en:Kraków"}
+        self.assertNotEqual(load_osm_file.validation_input_hash(tags, "pl"), load_osm_file.validation_input_hash(tags, "en"))
+
+    def test_validation_input_hash_ignores_tag_order_and_unrelated_tags(self):
+        first = {"wikidata": "Q1", "wikipedia": "pl:Kraków", "highway": "primary"}
+        second = {"wikipedia": "pl:Kraków", "wikidata": "Q1"}
+        self.assertEqual(load_osm_file.validation_input_hash(first, None), load_osm_file.validation_input_hash(second, None))
@@ -0,0 +1,40 @@
+import unittest
+import database_schema
+import load_osm_file
+import object_store
+
+def store(cursor, object_id, area_identifier, timestamp, language_code):
+    entry = {"osm_type": "node", "osm_id": object_id, "lat": 50.0, "lon": 19.0, "osm_tags": {"wikidata": "Q1"}}
+    load_osm_file.record_batch(cursor, [load_osm_file.database_row(entry, area_identifier, timestamp, language_code)])
+
+def stored_objects(cursor):
+    cursor.execute("SELECT type, id, language_code FROM osm_objects ORDER BY type, id, language_code")
+    return cursor.fetchall()
+
+class Tests(unittest.TestCase):
+    def test_area_without_language_uses_empty_key(self):
+        cursor = database_schema.create_in_memory_database()
+        store(cursor, 1, "World", 1000, None)
+        store(cursor, 1, "Antarctica", 1000, None)
+        self.assertEqual([("node", 1, "")], stored_objects(cursor))
+        self.assertEqual([("node", 1, "")], object_store.members_of_area(cursor, "World"))
+
+    def test_only_orphaned_objects_are_removed_with_area_membership(self):
+        cursor = database_schema.create_in_memory_database()
+        store(cursor, 1, "Polska", 1000, "pl")
+        store(cursor, 1, "Małopolska", 1000, "pl")
+        store(cursor, 2, "Polska", 1000, "pl")
+        removed = object_store.remove_area_membership(cursor, "Polska")
+        self.assertEqual([], object_store.members_of_area(cursor, "Polska"))
+        object_store.remove_orphaned_objects(cursor, removed)
+        self.assertEqual([("node", 1, "pl")], stored_objects(cursor))
+
+    def test_objects_are_removed_from_all_areas_unless_newer(self):
+        cursor = database_schema.create_in_memory_database()
+        store(cursor, 1, "Polska", 1000, "pl")
+        store(cursor, 1, "Deutschland", 1000, "de")
+        store(cursor, 2, "Polska", 3000, "pl")
+        self.assertEqual(2, object_store.remove_objects(cursor, [("node", 1), ("node", 2)], 2000))
+        self.assertEqual([("node", 2, "pl")], stored_objects(cursor))
+        cursor.execute("SELECT area_identifier, id FROM osm_object_areas")
+        self.assertEqual([("Polska", 2)], cursor.fetchall())
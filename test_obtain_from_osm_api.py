@@ -0,0 +1,108 @@
+import unittest
+import threading
+import http.server
+import urllib.parse
+import obtain_from_osm_api
+
+class FakeOsmApi(http.server.BaseHTTPRequestHandler):
+    # stand-in for /api/0.6/nodes?nodes=..., /api/0.6/way/ID/full and similar
+    existing = {
+        ("node", 1): '<node id="1" visible="true" version="3" lat="50.0" lon="19.0"><tag k="wikidata" v="Q1"/></node>',
+        ("node", 2): '<node id="2" visible="false" version="4"/>',
+        ("node", 3): '<node id="3" visible="true" version="1" lat="51.0" lon="20.0"/>',
+        ("way", 10): '<way id="10" visible="true" version="2"><nd ref="1"/><nd ref="3"/><tag k="wikipedia" v="pl:Wisła"/></way>',
+        ("node", 4): '<node id="4" visible="true" version="1" lat="52.0" lon="21.0"/>',
+        ("way", 11): '<way id="11" visible="true" version="1"><nd ref="3"/><nd ref="4"/></way>',
+        ("relation", 100): '<relation id="100" visible="true" version="1"><member type="way" ref="10" role="outer"/><member type="way" ref="11" role="outer"/><member type="node" ref="1" role="label"/><member type="relation" ref="100" role="subarea"/></relation>',
+    }
+    full = {
+        ("way", 10): [("way", 10), ("node", 1), ("node", 3)],
+        ("way", 11): [("way", 11), ("node", 3), ("node", 4)],
+        ("relation", 100): [("relation", 100), ("way", 10), ("way", 11), ("node", 1), ("node", 3), ("node", 4)],
+    }
+    requests = []
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        if parsed.path.endswith("/full"):
+            object_type, object_id = parsed.path.split("/")[-3:-1]
+            FakeOsmApi.requests.append((object_type, "full", int(object_id)))
+            self.respond(self.full[(object_type, int(object_id))])
+            return
+        object_type = parsed.path.split("/")[-1][:-1]
+        ids = [int(object_id) for object_id in urllib.parse.parse_qs(parsed.query)[object_type + "s"][0].split(",")]
+        FakeOsmApi.requests.append((object_type, ids))
+        for object_id in ids:
+            if (object_type, object_id) not in self.existing:
+                self.send_response(404)
+                self.end_headers()
+                return
+        self.respond([(object_type, object_id) for object_id in ids])
+
+    def respond(self, objects):
+        body = '<?xml version="1.0" encoding="UTF-8"?><osm version="0.6">'
+        for key in objects:
+            body += self.existing[key]
+        body += '</osm>'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        FakeOsmApi.requests = []
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeOsmApi)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api = obtain_from_osm_api.get_api("http://127.0.0.1:" + str(self.server.server_address[1]))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetches_many_objects_in_one_request(self):
+        data = obtain_from_osm_api.get_data_of_many_objects(self.api, "node", [1, 3])
+        self.assertEqual([("node", [1, 3])], FakeOsmApi.requests)
+        self.assertEqual({"wikidata": "Q1"}, data[1]["tag"])
+        self.assertEqual(50.0, data[1]["lat"])
+        self.assertEqual({}, data[3]["tag"])
+
+    def test_deleted_objects_are_returned_as_none(self):
+        data = obtain_from_osm_api.get_data_of_many_objects(self.api, "node", [1, 2])
+        self.assertEqual(None, data[2])
+        self.assertNotEqual(None, data[1])
+
+    def test_missing_objects_are_returned_as_none(self):
+        data = obtain_from_osm_api.get_data_of_many_objects(self.api, "node", [1, 2, 3, 404])
+        self.assertEqual([1, 3], sorted([object_id for object_id, value in data.items() if value != None]))
+        self.assertEqual(None, data[404])
+
+    def test_ways(self):
+        data = obtain_from_osm_api.get_data_of_many_objects(self.api, "way", [10])
+        self.assertEqual({"wikipedia": "pl:Wisła"}, data[10]["tag"])
+
+    def test_chunks(self):
+        chunks = list(obtain_from_osm_api.chunks(list(range(450))))
+        self.assertEqual([200, 200, 50], [len(chunk) for chunk in chunks])
+
+    def test_node_coordinates_of_way_in_one_request(self):
+        cache = obtain_from_osm_api.empty_geometry_cache()
+        self.assertEqual([(50.0, 19.0), (51.0, 20.0)], obtain_from_osm_api.node_coordinates_of_object(self.api, "way", "10", cache))
+        self.assertEqual([("way", "full", 10)], FakeOsmApi.requests)
+
+    def test_node_coordinates_of_relation_with_cycle(self):
+        cache = obtain_from_osm_api.empty_geometry_cache()
+        coordinates = obtain_from_osm_api.node_coordinates_of_object(self.api, "relation", 100, cache)
+        self.assertEqual([(50.0, 19.0), (51.0, 20.0), (51.0, 20.0), (52.0, 21.0), (50.0, 19.0)], coordinates)
+        self.assertEqual([("relation", "full", 100)], FakeOsmApi.requests)
+
+    def test_cached_nodes_are_not_fetched_again(self):
+        cache = obtain_from_osm_api.empty_geometry_cache()
+        obtain_from_osm_api.node_coordinates_of_object(self.api, "way", 10, cache)
+        obtain_from_osm_api.node_coordinates_of_object(self.api, "way", 10, cache)
+        self.assertEqual([(51.0, 20.0)], obtain_from_osm_api.node_coordinates_of_object(self.api, "node", 3, cache))
+        self.assertEqual([(52.0, 21.0)], obtain_from_osm_api.node_coordinates_of_object(self.api, "node", 4, cache))
+        self.assertEqual([("way", "full", 10), ("node", [4])], FakeOsmApi.requests)
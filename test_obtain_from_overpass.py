@@ -0,0 +1,139 @@
+import unittest
+import os
+import re
+import tempfile
+import threading
+import http.server
+import urllib.parse
+import obtain_from_overpass
+import load_osm_file
+
+def osm_file(elements):
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="Overpass API">\n<meta osm_base="2023-01-29T10:00:00Z"/>\n' + "".join(elements) + '</osm>\n'
+
+def node(osm_id, lat, lon):
+    return '<node id="' + str(osm_id) + '" lat="' + str(lat) + '" lon="' + str(lon) + '"><tag k="wikidata" v="Q' + str(osm_id) + '"/></node>\n'
+
+def way(osm_id, lat, lon):
+    return '<way id="' + str(osm_id) + '"><center lat="' + str(lat) + '" lon="' + str(lon) + '"/><nd ref="1"/><tag k="wikidata" v="Q' + str(osm_id) + '"/></way>\n'
+
+def json_file(elements):
+    return '{\n  "version": 0.6,\n  "generator": "Overpass API",\n  "elements": [\n\n' + ",\n".join(elements) + '\n\n  ]\n}\n'
+
+def json_node(osm_id, lat, lon):
+    return '{"type": "node", "id": ' + str(osm_id) + ', "lat": ' + str(lat) + ', "lon": ' + str(lon) + ', "tags": {"wikidata": "Q' + str(osm_id) + '"}}'
+
+def json_way(osm_id, lat, lon):
+    return '{"type": "way", "id": ' + str(osm_id) + ', "center": {"lat": ' + str(lat) + ', "lon": ' + str(lon) + '}, "nodes": [1], "tags": {"wikidata": "Q' + str(osm_id) + '"}}'
+
+class FakeOverpass(http.server.BaseHTTPRequestHandler):
+    # entire area is too large, tiles are small enough
+    # way 100 crosses border between tiles and is returned for each of them
+    queries = []
+    changed_count = 0
+
+    def respond(self, body):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def do_GET(self):
+        self.respond("Rate limit: 2\n2 slots available now.\n")
+
+    def do_POST(self):
+        query = urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))["data"][0]
+        FakeOverpass.queries.append(query)
+        if "out count;" in query:
+            self.respond(osm_file(['<count id="0"><tag k="nodes" v="0"/><tag k="ways" v="' + str(FakeOverpass.changed_count) + '"/><tag k="relations" v="0"/><tag k="areas" v="0"/><tag k="total" v="' + str(FakeOverpass.changed_count) + '"/></count>\n']))
+            return
+        if "out bb;" in query:
+            self.respond(osm_file(['<relation id="5"><bounds minlat="50.0" minlon="19.0" maxlat="52.0" maxlon="21.0"/></relation>\n']))
+            return
+        bbox = re.search(r"\(area\.searchArea\)\(([^)]*)\)", query)
+        if bbox == None:
+            self.respond(osm_file(['<remark> runtime error: Query timed out in "query" at line 4 after 1000 seconds. </remark>\n']))
+            return
+        south, west, north, east = [float(value) for value in bbox.group(1).split(",")]
+        elements = [way(100, 51.0, 20.0)]
+        for osm_id, lat, lon in [(1, 50.5, 19.5), (2, 51.5, 20.5)]:
+            if south <= lat <= north and west <= lon <= east:
+                elements.append(node(osm_id, lat, lon))
+        self.respond(osm_file(elements))
+
+    def log_message(self, format, *args):
+        pass
+
+class Tests(unittest.TestCase):
+    def test_query_with_bbox(self):
+        area_finder_string = obtain_from_overpass.area_finder({"name": "Polska"}, "searchArea")
+        query = obtain_from_overpass.download_query_text(area_finder_string, "searchArea", (50.0, 19.0, 51.0, 20.0))
+        self.assertIn('(area.searchArea)(50.0,19.0,51.0,20.0);', query)
+        query = obtain_from_overpass.download_query_text(area_finder_string, "searchArea")
+        self.assertIn('(area.searchArea);', query)
+
+    def test_split_bbox_covers_entire_area(self):
+        tiles = obtain_from_overpass.split_bbox((50.0, 19.0, 52.0, 21.0))
+        self.assertEqual([(50.0, 19.0, 51.0, 20.0), (50.0, 20.0, 51.0, 21.0), (51.0, 19.0, 52.0, 20.0), (51.0, 20.0, 52.0, 21.0)], tiles)
+
+    def test_merge_removes_duplicates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = os.path.join(directory, "first.osm")
+            second = os.path.join(directory, "second.osm")
+            merged = os.path.join(directory, "merged.osm")
+            with open(first, 'w') as file:
+                file.write(osm_file([node(1, 50.0, 19.0), way(100, 50.0, 19.0)]))
+            with open(second, 'w') as file:
+                file.write(osm_file([way(100, 50.0, 19.0), node(2, 51.0, 20.0)]))
+            obtain_from_overpass.merge_osm_files([first, second], merged)
+            entries = list(load_osm_file.xml_streaming_of_osm_file(merged))
+        self.assertEqual([("node", "1"), ("way", "100"), ("node", "2")], [(entry["osm_type"], entry["osm_id"]) for entry in entries])
+
+    def test_query_with_json_output(self):
+        area_finder_string = obtain_from_overpass.area_finder({"name": "Polska"}, "searchArea")
+        self.assertTrue(obtain_from_overpass.download_query_text(area_finder_string, "searchArea", None, "json").startswith("[out:json][timeout:"))
+        self.assertTrue(obtain_from_overpass.download_query_text(area_finder_string, "searchArea").startswith("[timeout:"))
+
+    def test_json_merge_removes_duplicates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = os.path.join(directory, "first.osm")
+            second = os.path.join(directory, "second.osm")
+            merged = os.path.join(directory, "merged.osm")
+            with open(first, 'w') as file:
+                file.write(json_file([json_node(1, 50.0, 19.0), json_way(100, 50.0, 19.0)]))
+            with open(second, 'w') as file:
+                file.write(json_file([json_way(100, 50.0, 19.0), json_node(2, 51.0, 20.0)]))
+            obtain_from_overpass.merge_json_files([first, second], merged)
+            entries = list(load_osm_file.streaming_of_osm_file(merged))
+        self.assertEqual([("node", "1", 50.0), ("way", "100", 50.0), ("node", "2", 51.0)], [(entry["osm_type"], entry["osm_id"], entry["lat"]) for entry in entries])
+
+    def test_changed_objects_are_counted(self):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeOverpass)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_url = "http://127.0.0.1:" + str(server.server_address[1]) + "/api/interpreter"
+        try:
+            for changed_count in [0, 3]:
+                FakeOverpass.changed_count = changed_count
+                self.assertEqual(changed_count, obtain_from_overpass.changed_object_count("[timeout:25];nwr(newer:\"2023-01-29T10:00:00Z\");out count;", api_url))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_too_large_area_is_downloaded_as_tiles(self):
+        FakeOverpass.queries = []
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeOverpass)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_url = "http://127.0.0.1:" + str(server.server_address[1]) + "/api/interpreter"
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                filepath = os.path.join(directory, "area.osm")
+                area_finder_string = obtain_from_overpass.area_finder({"name": "Polska"}, "searchArea")
+                query_for_bbox = lambda bbox: obtain_from_overpass.download_query_text(area_finder_string, "searchArea", bbox)
+                obtain_from_overpass.download_area(query_for_bbox, area_finder_string, "searchArea", filepath, api_url)
+                entries = list(load_osm_file.xml_streaming_of_osm_file(filepath))
+                self.assertEqual(["area.osm"], os.listdir(directory))
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual([("node", "1"), ("node", "2"), ("way", "100")], sorted([(entry["osm_type"], entry["osm_id"]) for entry in entries]))
+        # whole area, bounding box, 4 tiles
+        self.assertEqual(6, len(FakeOverpass.queries))
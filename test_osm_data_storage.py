@@ -0,0 +1,43 @@
+import unittest
+import sqlite3
+import json
+import database_schema
+import osm_data_storage
+
+def create_database_in_memory():
+    connection = sqlite3.connect(":memory:")
+    cursor = connection.cursor()
+    database_schema.create_legacy_osm_data_table(cursor)
+    return cursor
+
+def example_report():
+    return {"error_id": "wikipedia tag links to 404", "error_message": "Kraków", "error_general_intructions": None, "proposed_tagging_changes": None}
+
+class Tests(unittest.TestCase):
+    def test_rehydrated_report_matches_report_in_previous_format(self):
+        tags = {"name": "Kraków", "wikipedia": "pl:Kraków"}
+        previous = example_report()
+        previous['osm_object_url'] = "https://openstreetmap.org/node/1"
+        previous['tags'] = tags
+        rehydrated = osm_data_storage.rehydrated_report("node", 1, osm_data_storage.encode_tags(tags), osm_data_storage.encode_complaint(example_report()))
+        self.assertEqual(json.dumps(previous), json.dumps(rehydrated))
+
+    def test_compact_existing_rows(self):
+        cursor = create_database_in_memory()
+        tags = {"name": "Kraków", "wikidata": "Q31487"}
+        previous = example_report()
+        previous['osm_object_url'] = "https://openstreetmap.org/way/10"
+        previous['tags'] = tags
+        cursor.execute("INSERT INTO osm_data (type, id, tags, validator_complaint) VALUES ('way', 10, :tags, :validator_complaint)", {"tags": json.dumps(tags, indent=3), "validator_complaint": json.dumps(previous)})
+        cursor.execute("INSERT INTO osm_data (type, id, tags, validator_complaint) VALUES ('node', 1, :tags, '')", {"tags": json.dumps(tags)})
+        cursor.execute("INSERT INTO osm_data (type, id, tags, validator_complaint) VALUES ('node', 2, :tags, NULL)", {"tags": json.dumps(tags)})
+        cursor.connection.commit()
+        osm_data_storage.compact_existing_rows(cursor)
+        cursor.execute("SELECT type, id, tags, validator_complaint FROM osm_data ORDER BY rowid")
+        rows = cursor.fetchall()
+        self.assertEqual(osm_data_storage.encode_tags(tags), rows[0][2])
+        self.assertNotIn("osm_object_url", rows[0][3])
+        self.assertEqual(previous, osm_data_storage.rehydrated_report(*rows[0]))
+        self.assertEqual(("", None), (rows[1][3], rows[2][3]))
+        cursor.execute("PRAGMA user_version")
+        self.assertEqual(osm_data_storage.storage_version(), cursor.fetchall()[0][0])
@@ -1,7 +1,28 @@
 import unittest
+import os
+import tempfile
+import config
 import osm_editor_bot_for_approved_tasks
 
 class Tests(unittest.TestCase):
+    def setUp(self):
+        # reverse geocode cache is kept in temporary directory, not in the real cache file
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_filepath = os.path.join(self.directory.name, "cache", "reverse_geocode_cache.db")
+        self.original_reverse_geocode_cache_filepath = config.reverse_geocode_cache_filepath
+        config.reverse_geocode_cache_filepath = lambda: self.cache_filepath
+        self.original_query_nominatim_country_code = osm_editor_bot_for_approved_tasks.query_nominatim_country_code
+        osm_editor_bot_for_approved_tasks.opened_geocode_cache.clear()
+
+    def tearDown(self):
+        config.reverse_geocode_cache_filepath = self.original_reverse_geocode_cache_filepath
+        osm_editor_bot_for_approved_tasks.query_nominatim_country_code = self.original_query_nominatim_country_code
+        for cursor in osm_editor_bot_for_approved_tasks.opened_geocode_cache.values():
+            if cursor != None:
+                cursor.connection.close()
+        osm_editor_bot_for_approved_tasks.opened_geocode_cache.clear()
+        self.directory.cleanup()
+
     def test_filter_reported_errors_on_empty_input(self):
         self.assertEqual([], osm_editor_bot_for_approved_tasks.filter_reported_errors([], []))
 
@@ -18,3 +39,16 @@ class Tests(unittest.TestCase):
 
     def test_polish_mountain_is_in_poland(self):
         self.assertEqual("pl", osm_editor_bot_for_approved_tasks.get_nominatim_country_code(49.5980495, 19.5937181)) # https://www.openstreetmap.org/node/478073419#map=15/49.5961/19.6076
+
+    def test_lookup_is_not_cached_when_cache_cannot_be_opened(self):
+        lookups = []
+        def fake_lookup(lat, lon):
+            lookups.append((lat, lon))
+            return "pl"
+        osm_editor_bot_for_approved_tasks.query_nominatim_country_code = fake_lookup
+        # directory cannot be created where a regular file is present
+        with open(os.path.join(self.directory.name, "cache"), 'w') as file:
+            file.write("")
+        self.assertEqual("pl", osm_editor_bot_for_approved_tasks.get_nominatim_country_code(50.0, 19.5))
+        self.assertEqual("pl", osm_editor_bot_for_approved_tasks.get_nominatim_country_code(50.0, 19.5))
+        self.assertEqual(2, len(lookups))
@@ -0,0 +1,110 @@
+import unittest
+import threading
+import http.server
+import overpass_rate_limiter
+
+def status_text(slots_available, seconds_until_slot):
+    returned = "Connected as: 1234567\nCurrent time: 2023-01-29T10:00:00Z\nAnnounced endpoint: none\nRate limit: 2\n"
+    if slots_available > 0:
+        returned += str(slots_available) + " slots available now.\n"
+    for seconds in seconds_until_slot:
+        returned += "Slot available after: 2023-01-29T10:00:30Z, in " + str(seconds) + " seconds.\n"
+    returned += "Currently running queries (pid, space limit, time limit, start time):\n"
+    return returned
+
+class FakeOverpass(http.server.BaseHTTPRequestHandler):
+    # responses are consumed in order, the last one is repeated
+    status_responses = []
+    interpreter_responses = []
+    log = []
+
+    def respond(self, code, body):
+        self.send_response(code)
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def do_GET(self):
+        FakeOverpass.log.append("status")
+        responses = FakeOverpass.status_responses
+        self.respond(200, responses.pop(0) if len(responses) > 1 else responses[0])
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        FakeOverpass.log.append("interpreter")
+        responses = FakeOverpass.interpreter_responses
+        code, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        self.respond(code, body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        FakeOverpass.log = []
+        self.sleeps = []
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeOverpass)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_url = "http://127.0.0.1:" + str(self.server.server_address[1]) + "/api/interpreter"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def query(self):
+        return overpass_rate_limiter.get_response_from_overpass_server("[timeout:25];node(1);out;", 25, self.api_url, "test", self.sleeps.append)
+
+    def test_parse_status_with_free_slots(self):
+        self.assertEqual({"slots_available": 2, "seconds_until_slot": []}, overpass_rate_limiter.parse_status(status_text(2, [])))
+
+    def test_parse_status_with_all_slots_taken(self):
+        self.assertEqual({"slots_available": 0, "seconds_until_slot": [30, 65]}, overpass_rate_limiter.parse_status(status_text(0, [30, 65])))
+
+    def test_wait_time(self):
+        self.assertEqual(0, overpass_rate_limiter.wait_time_in_seconds(overpass_rate_limiter.parse_status(status_text(1, [10]))))
+        self.assertEqual(31, overpass_rate_limiter.wait_time_in_seconds(overpass_rate_limiter.parse_status(status_text(0, [65, 30]))))
+        self.assertEqual(overpass_rate_limiter.maximum_status_wait_in_seconds(), overpass_rate_limiter.wait_time_in_seconds(overpass_rate_limiter.parse_status("garbage")))
+
+    def test_backoff_grows_and_is_capped(self):
+        for attempt in range(20):
+            wait = overpass_rate_limiter.backoff_in_seconds(attempt)
+            limit = min(overpass_rate_limiter.backoff_base_in_seconds() * 2 ** attempt, overpass_rate_limiter.maximum_backoff_in_seconds())
+            self.assertTrue(limit / 2 <= wait <= limit)
+
+    def test_no_waiting_when_slot_is_free(self):
+        FakeOverpass.status_responses = [status_text(2, [])]
+        FakeOverpass.interpreter_responses = [(200, "<osm></osm>")]
+        self.assertEqual("<osm></osm>", self.query())
+        self.assertEqual([], self.sleeps)
+        self.assertEqual(["status", "interpreter"], FakeOverpass.log)
+
+    def test_waits_only_until_slot_is_freed(self):
+        FakeOverpass.status_responses = [status_text(0, [7, 40]), status_text(1, [])]
+        FakeOverpass.interpreter_responses = [(200, "<osm></osm>")]
+        self.assertEqual("<osm></osm>", self.query())
+        self.assertEqual([8], self.sleeps)
+        self.assertEqual(["status", "status", "interpreter"], FakeOverpass.log)
+
+    def test_retries_on_rate_limiting_with_backoff(self):
+        FakeOverpass.status_responses = [status_text(2, [])]
+        FakeOverpass.interpreter_responses = [(429, "slow down"), (504, "gateway timeout"), (200, "<osm></osm>")]
+        self.assertEqual("<osm></osm>", self.query())
+        self.assertEqual(2, len(self.sleeps))
+        self.assertTrue(self.sleeps[0] <= overpass_rate_limiter.backoff_base_in_seconds())
+        self.assertTrue(self.sleeps[1] >= overpass_rate_limiter.backoff_base_in_seconds())
+
+    def test_other_errors_are_not_retried(self):
+        FakeOverpass.status_responses = [status_text(2, [])]
+        FakeOverpass.interpreter_responses = [(400, "syntax error")]
+        with self.assertRaises(Exception):
+            self.query()
+        self.assertEqual(1, FakeOverpass.log.count("interpreter"))
+
+    def test_runtime_error_in_response_is_failure(self):
+        FakeOverpass.status_responses = [status_text(2, [])]
+        FakeOverpass.interpreter_responses = [(200, '<osm><remark> runtime error: Query timed out in "query" at line 4 after 2 seconds. </remark></osm>')]
+        with self.assertRaises(Exception):
+            self.query()
+
+    def test_runtime_error_in_json_response_is_detected(self):
+        self.assertTrue(overpass_rate_limiter.is_runtime_error('{\n  "version": 0.6,\n  "elements": [\n\n  ],\n  "remark": "runtime error: Query timed out in \\"query\\" at line 4 after 2 seconds."\n}\n'))
+        self.assertFalse(overpass_rate_limiter.is_runtime_error('{\n  "version": 0.6,\n  "elements": [\n\n  ]\n}\n'))
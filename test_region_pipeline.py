@@ -0,0 +1,70 @@
+import unittest
+import threading
+import time
+import region_pipeline
+
+def doubling_stage(inputs):
+    for item in inputs:
+        yield item * 2
+
+def adding_stage(inputs):
+    for item in inputs:
+        yield item + 1
+
+class Tests(unittest.TestCase):
+    def test_items_pass_through_all_stages_in_order(self):
+        self.assertEqual([3, 5, 7, 9], region_pipeline.run_pipeline([1, 2, 3, 4], [doubling_stage, adding_stage]))
+
+    def test_empty_input(self):
+        self.assertEqual([], region_pipeline.run_pipeline([], [doubling_stage, adding_stage, doubling_stage]))
+
+    def test_each_stage_runs_in_its_own_thread(self):
+        threads = {}
+        def stage(name):
+            def recording_stage(inputs):
+                for item in inputs:
+                    threads[name] = threading.current_thread()
+                    yield item
+            return recording_stage
+        region_pipeline.run_pipeline([1], [stage("a"), stage("b"), stage("c")])
+        self.assertEqual(3, len(set(threads.values())))
+
+    def test_stage_does_not_run_too_far_ahead(self):
+        produced = []
+        def producing_stage(inputs):
+            for item in inputs:
+                produced.append(item)
+                yield item
+        def slow_stage(inputs):
+            for item in inputs:
+                if item == 0:
+                    time.sleep(0.3)
+                    # queue with one item in, one waiting to be put and one taken
+                    self.assertTrue(len(produced) <= 3)
+                yield item
+        self.assertEqual(list(range(10)), region_pipeline.run_pipeline(list(range(10)), [producing_stage, slow_stage], maximum_queue_size=1))
+
+    def test_downloads_overlap_with_processing(self):
+        def waiting_stage(inputs):
+            for item in inputs:
+                time.sleep(0.2)
+                yield item
+        start = time.time()
+        region_pipeline.run_pipeline(list(range(5)), [waiting_stage, waiting_stage])
+        # 2 seconds if done one after another
+        self.assertTrue(time.time() - start < 1.6)
+
+    def test_failure_stops_pipeline_and_is_reraised(self):
+        processed = []
+        def failing_stage(inputs):
+            for item in inputs:
+                if item == 2:
+                    raise ValueError("failure on 2")
+                yield item
+        def recording_stage(inputs):
+            for item in inputs:
+                processed.append(item)
+                yield item
+        with self.assertRaises(ValueError):
+            region_pipeline.run_pipeline(list(range(100)), [recording_stage, failing_stage, recording_stage])
+        self.assertTrue(len(processed) < 100)
@@ -0,0 +1,121 @@
+import unittest
+import os
+import tempfile
+import config
+import database_schema
+import generate_webpage_with_error_output as webpage
+
+def insert_report(cursor, osm_id, area_identifier, message):
+    cursor.execute("INSERT INTO osm_object_areas (area_identifier, type, id, language_code, download_timestamp) VALUES (:area_identifier, 'node', :id, '', 1675000000)", {"area_identifier": area_identifier, "id": osm_id})
+    cursor.execute("INSERT INTO osm_objects (type, id, language_code, tags, download_timestamp, validator_complaint, error_id, status) VALUES ('node', :id, '', '{}', 1675000000, :complaint, 'wikipedia tag links to 404', 2)", {"id": osm_id, "complaint": example_complaint(osm_id, message)})
+
+def example_complaint(osm_id, message):
+    # osm_id is not stored in complaint, see osm_data_storage.encode_complaint
+    return '{"error_id": "wikipedia tag links to 404", "error_message": "' + message + '", "error_general_intructions": null, "proposed_tagging_changes": null}'
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.original_report_directory = config.get_report_directory
+        config.get_report_directory = lambda: self.directory.name
+        self.original_entries_to_process = config.get_entries_to_process
+        self.cursor = database_schema.create_in_memory_database()
+        self.cursor.execute("INSERT INTO osm_data_update_log (area_identifier, filename, download_type, download_timestamp) VALUES ('Kraków', 'file.osm', 'initial_full_data', 1675000000)")
+        insert_report(self.cursor, 1, "Kraków", "first")
+        self.entry = {"internal_region_name": "Kraków", "website_main_title_part": "Kraków"}
+        self.page = os.path.join(self.directory.name, "Kraków.html")
+
+    def tearDown(self):
+        config.get_report_directory = self.original_report_directory
+        config.get_entries_to_process = self.original_entries_to_process
+        self.directory.cleanup()
+
+    def render_and_modify_page(self, force=False):
+        webpage.generate_website_file_for_given_area(self.cursor, self.entry)
+        with open(self.page, 'w') as file:
+            file.write("marker")
+        webpage.generate_website_file_for_given_area(self.cursor, self.entry, force)
+        with open(self.page) as file:
+            return file.read()
+
+    def test_unchanged_page_is_not_regenerated(self):
+        self.assertEqual("marker", self.render_and_modify_page())
+
+    def test_force_regenerates_page(self):
+        self.assertIn("first", self.render_and_modify_page(force=True))
+
+    def test_page_is_regenerated_when_reports_changed(self):
+        webpage.generate_website_file_for_given_area(self.cursor, self.entry)
+        insert_report(self.cursor, 2, "Kraków", "second")
+        webpage.generate_website_file_for_given_area(self.cursor, self.entry)
+        with open(self.page) as file:
+            self.assertIn("second", file.read())
+
+    def test_missing_page_is_regenerated(self):
+        webpage.generate_website_file_for_given_area(self.cursor, self.entry)
+        os.remove(self.page)
+        webpage.generate_website_file_for_given_area(self.cursor, self.entry)
+        self.assertTrue(os.path.isfile(self.page))
+
+    def test_fingerprint_ignores_order_of_reports(self):
+        self.assertEqual(webpage.page_fingerprint(["a", "b"], [1675000000], []), webpage.page_fingerprint(["b", "a"], [1675000000], []))
+
+    def test_fingerprint_depends_on_displayed_date_and_ignored_problems(self):
+        fingerprint = webpage.page_fingerprint(["a"], [1675000000], [])
+        self.assertEqual(fingerprint, webpage.page_fingerprint(["a"], [1675000001], []))
+        self.assertNotEqual(fingerprint, webpage.page_fingerprint(["a"], [1675000000 + 3 * 24 * 60 * 60], []))
+        self.assertNotEqual(fingerprint, webpage.page_fingerprint(["a"], [1675000000], ["wikipedia tag links to 404"]))
+
+    def read_report_files(self):
+        returned = {}
+        for filename in os.listdir(self.directory.name):
+            with open(os.path.join(self.directory.name, filename)) as file:
+                returned[filename] = file.read()
+        return returned
+
+    def test_incremental_index_matches_full_rebuild(self):
+        self.cursor.execute("INSERT INTO osm_data_update_log (area_identifier, filename, download_type, download_timestamp) VALUES ('Warszawa', 'file.osm', 'initial_full_data', 1675000000)")
+        self.cursor.execute("INSERT INTO osm_data_update_log (area_identifier, filename, download_type, download_timestamp) VALUES ('Gdańsk', 'file.osm', 'initial_full_data', 1675000000)")
+        entries = [
+            {"internal_region_name": "Kraków", "website_main_title_part": "Kraków", "merged_into": ["Polska", "Południe"]},
+            {"internal_region_name": "Warszawa", "website_main_title_part": "Warszawa", "merged_into": ["Polska"]},
+            {"internal_region_name": "Gdańsk", "website_main_title_part": "Gdańsk", "merged_into": ["Północ"]},
+        ]
+        config.get_entries_to_process = lambda: entries
+        for entry in entries:
+            webpage.generate_website_file_for_given_area(self.cursor, entry)
+        webpage.write_index_and_merged_entries(self.cursor)
+
+        insert_report(self.cursor, 2, "Warszawa", "second")
+        webpage.generate_website_file_for_given_area(self.cursor, entries[1])
+        webpage.write_index_and_merged_entries(self.cursor, updated_areas=["Warszawa"])
+        with open(os.path.join(self.directory.name, "index.html")) as file:
+            index = file.read()
+        self.assertIn(">Warszawa</a> (found 1 problem)", index)
+        with open(os.path.join(self.directory.name, "Polska.html")) as file:
+            self.assertIn("second", file.read())
+
+        incremental = self.read_report_files()
+        for filename in os.listdir(self.directory.name):
+            os.remove(os.path.join(self.directory.name, filename))
+        self.cursor.execute("DELETE FROM render_state")
+        for entry in entries:
+            webpage.generate_website_file_for_given_area(self.cursor, entry)
+        webpage.write_index_and_merged_entries(self.cursor)
+        self.assertEqual(incremental, self.read_report_files())
+
+    def test_merged_page_without_updated_areas_is_not_regenerated(self):
+        entries = [{"internal_region_name": "Kraków", "website_main_title_part": "Kraków", "merged_into": ["Polska"]}]
+        config.get_entries_to_process = lambda: entries
+        webpage.generate_website_file_for_given_area(self.cursor, entries[0])
+        webpage.write_index_and_merged_entries(self.cursor)
+        merged_page = os.path.join(self.directory.name, "Polska.html")
+        with open(merged_page, 'w') as file:
+            file.write("marker")
+        insert_report(self.cursor, 2, "Kraków", "second")
+        webpage.write_index_and_merged_entries(self.cursor, updated_areas=["Warszawa"])
+        with open(merged_page) as file:
+            self.assertEqual("marker", file.read())
+        webpage.write_index_and_merged_entries(self.cursor, updated_areas=["Kraków"])
+        with open(merged_page) as file:
+            self.assertIn("second", file.read())
@@ -0,0 +1,174 @@
+import unittest
+import database_schema
+import os
+import gzip
+import json
+import tempfile
+import boundary_index
+import load_osm_file
+import object_store
+import replication_diff
+import report_status
+
+def example_diff_content():
+    return """<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6" generator="osmium">
+  <modify>
+    <node id="1" version="2" timestamp="2023-01-29T10:30:00Z" lat="50.6" lon="19.6">
+      <tag k="name" v="Kraków"/>
+      <tag k="wikidata" v="Q31487"/>
+    </node>
+    <way id="10" version="3" timestamp="2023-01-29T10:31:00Z">
+      <nd ref="1"/>
+      <nd ref="2"/>
+      <tag k="highway" v="primary"/>
+    </way>
+    <node id="7" version="4" timestamp="2023-01-29T10:31:00Z" lat="50.1" lon="19.1"/>
+  </modify>
+  <delete>
+    <node id="3" version="5" timestamp="2023-01-29T10:32:00Z"/>
+  </delete>
+  <create>
+    <node id="20" version="1" timestamp="2023-01-29T10:33:00Z" lat="50.5" lon="19.5"/>
+    <node id="21" version="1" timestamp="2023-01-29T10:33:00Z" lat="50.7" lon="19.9"/>
+    <way id="30" version="1" timestamp="2023-01-29T10:33:00Z">
+      <nd ref="20"/>
+      <nd ref="21"/>
+      <tag k="waterway" v="river"/>
+      <tag k="wikipedia" v="pl:Dłubnia"/>
+    </way>
+    <node id="40" version="1" timestamp="2023-01-29T10:34:00Z" lat="10.0" lon="10.0">
+      <tag k="wikidata" v="Q1"/>
+    </node>
+    <node id="41" version="1" timestamp="2023-01-29T10:34:00Z" lat="50.2" lon="19.2">
+      <tag k="wikidata" v="Q2"/>
+    </node>
+  </create>
+  <modify>
+    <node id="41" version="2" timestamp="2023-01-29T10:35:00Z" lat="50.2" lon="19.2">
+      <tag k="wikidata" v="Q3"/>
+    </node>
+  </modify>
+</osmChange>
+"""
+
+def example_geojson():
+    # square region identified by wikidata, like most entries in regions_processed.yaml
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"wikidata": "Q54169"}, "geometry": {"type": "Polygon", "coordinates": [
+            [[19.0, 50.0], [20.0, 50.0], [20.0, 51.0], [19.0, 51.0], [19.0, 50.0]],
+        ]}},
+    ]}
+
+def example_entries():
+    return [
+        {"internal_region_name": "Małopolska", "website_main_title_part": "Małopolska", "identifier": {"wikidata": "Q54169"}, "language_code": "pl"},
+        {"internal_region_name": "Kraków", "website_main_title_part": "Kraków", "identifier": {"name": "Kraków"}, "language_code": "pl"},
+    ]
+
+def store(cursor, object_type, object_id, tags, area_identifier, timestamp):
+    entry = {"osm_type": object_type, "osm_id": object_id, "lat": 50.0, "lon": 19.0, "osm_tags": tags}
+    load_osm_file.record_batch(cursor, [load_osm_file.database_row(entry, area_identifier, timestamp, "pl")])
+    cursor.execute("UPDATE osm_objects SET status = :no_problem, validator_complaint = ''", {"no_problem": report_status.no_problem()})
+
+def state_text(sequence_number, timestamp):
+    return "#Sun Jan 29 11:00:00 UTC 2023\nsequenceNumber=" + str(sequence_number) + "\ntimestamp=" + timestamp.replace(":", "\\:") + "\n"
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "replication")
+        os.makedirs(os.path.join(self.source, "000", "001"))
+        self.write_diff(1001, "2023-01-29T11:00:00Z", example_diff_content())
+        with open(os.path.join(self.source, "state.txt"), 'w') as file:
+            file.write(state_text(1001, "2023-01-29T11:00:00Z"))
+        geojson_filepath = os.path.join(self.directory.name, "boundaries.geojson")
+        with open(geojson_filepath, 'w') as file:
+            json.dump(example_geojson(), file)
+        self.index = boundary_index.load_index(geojson_filepath)
+        self.cursor = database_schema.create_in_memory_database()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_diff(self, sequence_number, timestamp, content):
+        path = os.path.join(self.source, replication_diff.sequence_path(sequence_number))
+        with gzip.open(path + ".osc.gz", 'wt') as file:
+            file.write(content)
+        with open(path + ".state.txt", 'w') as file:
+            file.write(state_text(sequence_number, timestamp))
+
+    def rows(self):
+        self.cursor.execute("SELECT osm_objects.type, osm_objects.id, osm_object_areas.area_identifier, osm_objects.tags, osm_objects.status FROM " + object_store.area_join() + " ORDER BY osm_objects.type, osm_objects.id, osm_object_areas.area_identifier")
+        return self.cursor.fetchall()
+
+    def test_state_parsing(self):
+        self.assertEqual({"sequence_number": 1001, "timestamp": 1674990000}, replication_diff.parse_state(state_text(1001, "2023-01-29T11:00:00Z")))
+        self.assertEqual("001/234/567", replication_diff.sequence_path(1234567))
+
+    def test_diff_elements_are_read_with_their_action(self):
+        elements = list(replication_diff.diff_elements(os.path.join(self.source, "000/001/001.osc.gz")))
+        self.assertEqual(10, len(elements))
+        self.assertEqual({"action": "delete", "osm_type": "node", "osm_id": 3, "lat": None, "lon": None, "osm_tags": {}, "node_refs": []}, elements[3])
+        self.assertEqual([20, 21], elements[6]["node_refs"])
+
+    def test_tracked_objects_are_updated_or_removed(self):
+        store(self.cursor, "node", 1, {"wikidata": "Q31487"}, "Kraków", 1000)
+        store(self.cursor, "way", 10, {"highway": "primary", "wikipedia": "pl:Aleje"}, "Kraków", 1000)
+        store(self.cursor, "node", 3, {"wikidata": "Q5"}, "Kraków", 1000)
+        store(self.cursor, "node", 7, {"wikidata": "Q7"}, "Kraków", 1000)
+        counts = replication_diff.apply_diff(self.cursor, os.path.join(self.source, "000/001/001.osc.gz"), 2000, example_entries(), None)
+        self.assertEqual({"updated": 1, "added": 0, "removed": 3, "not_assigned": 3}, counts)
+        # name was added, what affects validation
+        self.assertEqual([("node", 1, "Kraków", '{"name":"Kraków","wikidata":"Q31487"}', report_status.not_checked())], self.rows())
+
+    def test_the_last_version_in_diff_decides_about_removal(self):
+        store(self.cursor, "node", 1, {"wikipedia": "pl:Kraków"}, "Kraków", 100)
+        diff_filepath = os.path.join(self.directory.name, "restored.osc.gz")
+        with gzip.open(diff_filepath, 'wt') as file:
+            file.write("""<osmChange version="0.6">
+  <modify><node id="1" version="2" lat="50.0" lon="19.0"><tag k="name" v="Kraków"/></node></modify>
+  <modify><node id="1" version="3" lat="50.0" lon="19.0"><tag k="name" v="Kraków"/><tag k="wikipedia" v="pl:Kraków"/></node></modify>
+</osmChange>""")
+        counts = replication_diff.apply_diff(self.cursor, diff_filepath, 2000, example_entries(), None)
+        self.assertEqual({"updated": 1, "added": 0, "removed": 0, "not_assigned": 0}, counts)
+        self.assertEqual([("node", 1, "Kraków", '{"name":"Kraków","wikipedia":"pl:Kraków"}', report_status.not_checked())], self.rows())
+
+    def test_new_objects_are_assigned_with_boundary_index(self):
+        counts = replication_diff.apply_diff(self.cursor, os.path.join(self.source, "000/001/001.osc.gz"), 2000, example_entries(), self.index)
+        self.assertEqual({"updated": 0, "added": 3, "removed": 0, "not_assigned": 1}, counts)
+        self.assertEqual([
+            ("node", 1, "Małopolska", '{"name":"Kraków","wikidata":"Q31487"}', report_status.not_checked()),
+            ("node", 41, "Małopolska", '{"wikidata":"Q3"}', report_status.not_checked()),
+            ("way", 30, "Małopolska", '{"waterway":"river","wikipedia":"pl:Dłubnia"}', report_status.not_checked()),
+        ], self.rows())
+        self.cursor.execute("SELECT lat, lon FROM osm_objects WHERE type = 'way'")
+        lat, lon = self.cursor.fetchall()[0]
+        self.assertAlmostEqual(50.6, lat)
+        self.assertAlmostEqual(19.7, lon)
+
+    def test_newer_data_is_not_overwritten(self):
+        store(self.cursor, "node", 1, {"wikidata": "Q31487"}, "Kraków", 3000)
+        store(self.cursor, "node", 3, {"wikidata": "Q5"}, "Kraków", 3000)
+        replication_diff.apply_diff(self.cursor, os.path.join(self.source, "000/001/001.osc.gz"), 2000, example_entries(), None)
+        self.assertEqual([
+            ("node", 1, "Kraków", '{"wikidata":"Q31487"}', report_status.no_problem()),
+            ("node", 3, "Kraków", '{"wikidata":"Q5"}', report_status.no_problem()),
+        ], self.rows())
+
+    def test_pending_diffs_are_applied_once(self):
+        self.assertEqual(None, replication_diff.applied_state(self.cursor, self.source))
+        replication_diff.store_applied_state(self.cursor, self.source, {"sequence_number": 1000, "timestamp": 1674986400})
+        self.write_diff(1002, "2023-01-29T12:00:00Z", '<osmChange version="0.6"><delete><node id="1" version="3"/></delete></osmChange>')
+        with open(os.path.join(self.source, "state.txt"), 'w') as file:
+            file.write(state_text(1002, "2023-01-29T12:00:00Z"))
+        replication_diff.apply_pending_diffs(self.cursor, self.source, example_entries()[0:1], self.index)
+        self.assertEqual({"sequence_number": 1002, "timestamp": 1674993600}, replication_diff.applied_state(self.cursor, self.source))
+        self.assertEqual([("node", 41), ("way", 30)], [(row[0], row[1]) for row in self.rows()])
+        # one row for area, with timestamp of the last diff and without filename of removed diff
+        self.cursor.execute("SELECT area_identifier, filename, download_type, download_timestamp FROM osm_data_update_log")
+        self.assertEqual([("Małopolska", None, "replication_diff", 1674993600)], self.cursor.fetchall())
+        # nothing new to apply
+        replication_diff.apply_pending_diffs(self.cursor, self.source, example_entries()[0:1], self.index)
+        self.cursor.execute("SELECT COUNT(*) FROM osm_data_update_log")
+        self.assertEqual(1, self.cursor.fetchall()[0][0])
@@ -0,0 +1,16 @@
+import unittest
+import sqlite3
+import report_status
+
+class Tests(unittest.TestCase):
+    def test_sql_expression_matches_python_function(self):
+        cursor = sqlite3.connect(":memory:").cursor()
+        cursor.execute("CREATE TABLE osm_data (validator_complaint text)")
+        for validator_complaint in [None, "", '{"error_id": "a"}']:
+            cursor.execute("DELETE FROM osm_data")
+            cursor.execute("INSERT INTO osm_data VALUES (:validator_complaint)", {"validator_complaint": validator_complaint})
+            cursor.execute("SELECT " + report_status.status_for_complaint_sql("validator_complaint") + " FROM osm_data")
+            self.assertEqual(report_status.status_for_complaint(validator_complaint), cursor.fetchall()[0][0])
+
+    def test_statuses_are_distinct(self):
+        self.assertEqual(3, len(set([report_status.not_checked(), report_status.no_problem(), report_status.reported()])))
@@ -0,0 +1,44 @@
+import unittest
+import database_schema
+import validation_cache
+
+def example_settings(language_code):
+    return {"forced_refresh": False, "expected_language_code": language_code}
+
+class Tests(unittest.TestCase):
+    def test_key_ignores_unrelated_tags(self):
+        first = validation_cache.cache_key({"wikidata": "Q1", "highway": "primary"}, (50.01, 19.01), "way", example_settings("pl"))
+        second = validation_cache.cache_key({"wikidata": "Q1", "highway": "secondary", "lanes": "2"}, (50.02, 19.02), "way", example_settings("pl"))
+        self.assertEqual(first, second)
+
+    def test_key_depends_on_language_type_and_location(self):
+        base = validation_cache.cache_key({"wikidata": "Q1"}, (50.0, 19.0), "way", example_settings("pl"))
+        self.assertNotEqual(base, validation_cache.cache_key({"wikidata": "Q1"}, (50.0, 19.0), "way", example_settings("de")))
+        self.assertNotEqual(base, validation_cache.cache_key({"wikidata": "Q1"}, (50.0, 19.0), "node", example_settings("pl")))
+        self.assertNotEqual(base, validation_cache.cache_key({"wikidata": "Q1"}, (51.0, 19.0), "way", example_settings("pl")))
+
+    def test_stored_result_is_returned_only_for_the_same_version(self):
+        cursor = database_schema.create_in_memory_database()
+        report = {"error_id": "wikipedia tag links to 404", "error_message": "404"}
+        validation_cache.store_result(cursor, "key", "v1", report)
+        self.assertEqual(report, validation_cache.get_cached_result(cursor, "key", "v1"))
+        self.assertEqual(None, validation_cache.get_cached_result(cursor, "key", "v2"))
+
+    def test_no_problem_is_cached_as_empty_string(self):
+        cursor = database_schema.create_in_memory_database()
+        self.assertEqual(None, validation_cache.get_cached_result(cursor, "key", "v1"))
+        validation_cache.store_result(cursor, "key", "v1", None)
+        self.assertEqual("", validation_cache.get_cached_result(cursor, "key", "v1"))
+
+    def test_location_dependent_reports_are_not_cached(self):
+        cursor = database_schema.create_in_memory_database()
+        validation_cache.store_result(cursor, "key", "v1", {"error_id": "link to an unlinkable article"})
+        self.assertEqual(None, validation_cache.get_cached_result(cursor, "key", "v1"))
+
+    def test_outdated_entries_are_removed(self):
+        cursor = database_schema.create_in_memory_database()
+        validation_cache.store_result(cursor, "old", "v1", None)
+        validation_cache.store_result(cursor, "new", "v2", None)
+        validation_cache.remove_outdated_entries(cursor, "v2")
+        cursor.execute("SELECT cache_key FROM validation_cache")
+        self.assertEqual([("new",)], cursor.fetchall())
@@ -0,0 +1,68 @@
+import unittest
+import database_schema
+import load_osm_file
+import script
+
+class StubReport():
+    def __init__(self, data):
+        self.report_data = data
+
+    def data(self):
+        return dict(self.report_data)
+
+class StubIssueDetector():
+    # deterministic replacement of WikimediaLinkIssueDetector, without network access
+    def get_the_most_important_problem_generic(self, tags, location, object_type, object_description):
+        if tags["wikidata"] == "Q2":
+            return StubReport({"error_id": "wikipedia tag links to 404", "error_message": tags["wikidata"], "error_general_intructions": None, "proposed_tagging_changes": None})
+        if tags["wikidata"] == "Q3":
+            # message depends on exact location, so result must not be reused for other objects
+            return StubReport({"error_id": "link to an unlinkable article", "error_message": "distance from " + str(location), "error_general_intructions": None, "proposed_tagging_changes": None})
+        return None
+
+def stub_issue_detector(language_code, forced_refresh):
+    # used as detector_factory in worker processes, so it must be defined at module level
+    return StubIssueDetector()
+
+def store_objects(cursor):
+    rows = []
+    for object_id in range(1, 15):
+        wikidata = ["Q1", "Q2", "Q3"][object_id % 3]
+        # all objects are in the same location bucket
+        entry = {"osm_type": "node", "osm_id": object_id, "lat": 50.0 + object_id / 10000, "lon": 19.0, "osm_tags": {"wikidata": wikidata}}
+        rows.append(load_osm_file.database_row(entry, "Kraków", 1000, "pl"))
+    load_osm_file.record_batch(cursor, rows)
+
+def objects_to_validate(cursor):
+    cursor.execute(script.area_objects_query("1 = 1"), {"identifier": "Kraków"})
+    return cursor.fetchall()
+
+def stored_validation(cursor):
+    cursor.execute("SELECT type, id, validator_complaint, status, error_id FROM osm_objects ORDER BY type, id")
+    return cursor.fetchall()
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.original_slice_size = script.parallel_validation_slice_size
+        # objects sharing cache key end in different slices
+        script.parallel_validation_slice_size = lambda: 4
+
+    def tearDown(self):
+        script.parallel_validation_slice_size = self.original_slice_size
+
+    def test_worker_processes_give_the_same_results_as_serial_validation(self):
+        detector_settings = script.get_wikimedia_link_issue_reporter_settings("pl")
+
+        serial = database_schema.create_in_memory_database()
+        store_objects(serial)
+        serial_statistics = script.update_problem_for_all_this_entries(stub_issue_detector("pl", False), detector_settings, serial, objects_to_validate(serial), [])
+
+        parallel = database_schema.create_in_memory_database()
+        store_objects(parallel)
+        parallel_statistics = script.update_problem_for_all_this_entries_in_parallel("pl", detector_settings, parallel, objects_to_validate(parallel), [], 2, stub_issue_detector)
+
+        self.assertEqual(stored_validation(serial), stored_validation(parallel))
+        self.assertEqual(serial_statistics, parallel_statistics)
+        # Q1 and Q2 validated once, each Q3 object validated separately
+        self.assertEqual({"validated": 2 + 5, "reused": 7}, parallel_statistics)
+        self.assertEqual(5, len(set(validator_complaint for object_type, object_id, validator_complaint, status, error_id in stored_validation(parallel) if error_id == "link to an unlinkable article")))
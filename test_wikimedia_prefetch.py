@@ -0,0 +1,91 @@
+import unittest
+import json
+import threading
+import tempfile
+import http.server
+import urllib.parse
+import wikimedia_connection.wikimedia_connection as wikimedia_connection
+import wikimedia_prefetch
+
+def fake_entity(wikidata_id, sitelinks):
+    returned = {"type": "item", "id": wikidata_id, "claims": {}, "sitelinks": {}}
+    for site, title in sitelinks.items():
+        returned["sitelinks"][site] = {"site": site, "title": title}
+    return returned
+
+class FakeWikidataApi(http.server.BaseHTTPRequestHandler):
+    # stand-in for wbgetentities
+    entities = {
+        "Q31487": fake_entity("Q31487", {"plwiki": "Kraków"}),
+        "Q270": fake_entity("Q270", {"plwiki": "Warszawa"}),
+    }
+    requests = []
+
+    def do_GET(self):
+        parameters = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        FakeWikidataApi.requests.append(parameters)
+        entities = {}
+        if "ids" in parameters:
+            for wikidata_id in parameters["ids"][0].split("|"):
+                entities[wikidata_id] = self.entities.get(wikidata_id, {"id": wikidata_id, "missing": ""})
+        else:
+            site = parameters["sites"][0]
+            missing_index = 0
+            for title in parameters["titles"][0].split("|"):
+                found = [entity for entity in self.entities.values() if entity["sitelinks"].get(site, {}).get("title") == title]
+                if found == []:
+                    missing_index -= 1
+                    entities[str(missing_index)] = {"site": site, "title": title, "missing": ""}
+                else:
+                    entities[found[0]["id"]] = found[0]
+        body = json.dumps({"entities": entities, "success": 1}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.cache_directory = tempfile.TemporaryDirectory()
+        wikimedia_connection.set_cache_location(self.cache_directory.name)
+        FakeWikidataApi.requests = []
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeWikidataApi)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_url = "http://127.0.0.1:" + str(self.server.server_address[1]) + "/w/api.php"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache_directory.cleanup()
+
+    def test_referenced_wikimedia_data(self):
+        tags_list = [
+            {"wikidata": "Q1;Q2", "brand:wikidata": "Q3", "name": "Q4"},
+            {"wikipedia": "pl:Kraków", "subject:wikipedia": "en:Oak", "wikipedia:pl": "ignored old style"},
+            {"wikipedia": "pl:bad|title", "wikidata": "not an id"},
+        ]
+        wikidata_ids, articles = wikimedia_prefetch.referenced_wikimedia_data(tags_list)
+        self.assertEqual({"Q1", "Q2", "Q3"}, wikidata_ids)
+        self.assertEqual({("pl", "Kraków"), ("en", "Oak")}, articles)
+
+    def test_prefetched_data_is_readable_from_wikimedia_connection_cache(self):
+        tags_list = [{"wikipedia": "pl:Kraków"}, {"wikidata": "Q270"}, {"wikidata": "Q404"}, {"wikipedia": "pl:Nieistniejąca strona"}]
+        wikimedia_prefetch.prefetch_for_tags(tags_list, self.api_url)
+        for wikidata_id in ["Q31487", "Q270", "Q404"]:
+            self.assertEqual(False, wikimedia_connection.it_is_necessary_to_reload_wikidata_by_id_files(wikidata_id))
+        self.assertEqual("Q31487", wikimedia_connection.get_wikidata_object_id_from_article("pl", "Kraków"))
+        self.assertEqual(None, wikimedia_connection.get_wikidata_object_id_from_article("pl", "Nieistniejąca strona"))
+        self.assertEqual("Warszawa", wikimedia_connection.get_interwiki_article_name_by_id("Q270", "pl"))
+        self.assertEqual(None, wikimedia_connection.get_data_from_wikidata_by_id("Q404"))
+
+    def test_prefetch_uses_batches_and_skips_cached_entries(self):
+        tags_list = []
+        for index in range(1, 121):
+            tags_list.append({"wikidata": "Q" + str(1000 + index)})
+        wikimedia_prefetch.prefetch_for_tags(tags_list, self.api_url)
+        self.assertEqual(3, len(FakeWikidataApi.requests))
+        wikimedia_prefetch.prefetch_for_tags(tags_list, self.api_url)
+        self.assertEqual(3, len(FakeWikidataApi.requests))
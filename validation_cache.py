@@ -0,0 +1,93 @@
+import json
+import math
+import functools
+import hashlib
+import importlib.util
+import os
+import time
+import load_osm_file
+
+# many objects share identical tags, for example every segment of a river
+# or road with the same wikidata - there is no need to validate each separately
+#
+# validation results are stored in validation_cache table, keyed by
+# - tags affecting validation
+# - object type
+# - settings of WikimediaLinkIssueDetector (including language code)
+# - coarse location bucket (some checks, like distance from company headquarters, depend on location)
+# and stamped with version of wikibrain code that produced them
+
+def location_dependent_error_ids():
+    # error messages listing disambiguation targets with distances from the object
+    # such results are not cached
+    return ['link to an unlinkable article']
+
+def location_bucket_size_in_degrees():
+    # about 5 km - objects in the same bucket share result
+    # what matters only for objects close to 20 km threshold of headquarters check
+    return 0.05
+
+def location_bucket(location):
+    lat, lon = location
+    if lat == None or lon == None:
+        return None
+    size = location_bucket_size_in_degrees()
+    return [math.floor(lat / size), math.floor(lon / size)]
+
+def maximum_age_of_cached_result_in_seconds():
+    # underlying Wikidata/Wikipedia data may change
+    return 7 * 24 * 60 * 60
+
+@functools.lru_cache(maxsize=None)
+def validator_version():
+    # hash of wikibrain source code, so any change in validation rules
+    # (also in locally reinstalled wikibrain without version bump) invalidates cache
+    package_directory = os.path.dirname(importlib.util.find_spec("wikibrain").origin)
+    hashed = hashlib.sha256()
+    for filename in sorted(os.listdir(package_directory)):
+        if filename.endswith(".py"):
+            with open(os.path.join(package_directory, filename), 'rb') as file:
+                hashed.update(filename.encode('utf-8'))
+                hashed.update(file.read())
+    return hashed.hexdigest()
+
+def cache_key(tags, location, object_type, detector_settings):
+    key = {
+        "tags": load_osm_file.tags_affecting_validation(tags),
+        "location_bucket": location_bucket(location),
+        "object_type": object_type,
+        "detector_settings": detector_settings,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_cached_result(cursor, key, version):
+    # returns None if there is no usable cached result
+    # returns "" if object was validated and no problem was found
+    # returns dictionary with report data otherwise
+    cursor.execute("""SELECT validation_result FROM validation_cache
+    WHERE cache_key = :cache_key AND validator_version = :validator_version AND cached_timestamp > :oldest_allowed_timestamp""",
+    {"cache_key": key, "validator_version": version, "oldest_allowed_timestamp": int(time.time()) - maximum_age_of_cached_result_in_seconds()})
+    returned = cursor.fetchall()
+    if len(returned) == 0:
+        return None
+    if returned[0][0] == "":
+        return ""
+    return json.loads(returned[0][0])
+
+def store_result(cursor, key, version, report_data):
+    # report_data is None if no problem was found
+    if report_data == None:
+        validation_result = ""
+    else:
+        if report_data['error_id'] in location_dependent_error_ids():
+            return
+        validation_result = json.dumps(report_data)
+    cursor.execute("""INSERT OR REPLACE INTO validation_cache (cache_key, validator_version, validation_result, cached_timestamp)
+    VALUES (:cache_key, :validator_version, :validation_result, :cached_timestamp)""",
+    {"cache_key": key, "validator_version": version, "validation_result": validation_result, "cached_timestamp": int(time.time())})
+
+def remove_outdated_entries(cursor, version):
+    cursor.execute("""DELETE FROM validation_cache
+    WHERE validator_version <> :validator_version OR cached_timestamp <= :oldest_allowed_timestamp""",
+    {"validator_version": version, "oldest_allowed_timestamp": int(time.time()) - maximum_age_of_cached_result_in_seconds()})
+    print(cursor.rowcount, "outdated entries removed from validation cache")
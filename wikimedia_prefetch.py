@@ -0,0 +1,170 @@
+import json
+import re
+import urllib.request, urllib.error, urllib.parse
+import concurrent.futures
+import wikimedia_connection.wikimedia_connection as wikimedia_connection
+import config
+import report_status
+import object_store
+
+# validator fetches Wikidata entities lazily, one by one, what makes every cache miss
+# a separate round trip
+#
+# this prefetches them in batches (wbgetentities accepts up to 50 ids or titles)
+# and writes responses to wikimedia_connection cache in the same form as
+# it would be stored by wikimedia_connection itself, so validation later reads them from cache
+
+def wikidata_api_url():
+    return "https://www.wikidata.org/w/api.php"
+
+def entity_batch_size():
+    return 50
+
+def maximum_parallel_requests():
+    return 4
+
+def prefetch_for_unvalidated_entries(cursor, internal_region_name, api_url=None):
+    cursor.execute('SELECT osm_objects.tags FROM ' + object_store.area_join() + ' WHERE osm_object_areas.area_identifier = :identifier AND osm_objects.status = :not_checked', {"identifier": internal_region_name, "not_checked": report_status.not_checked()})
+    tags_list = []
+    for entry in cursor.fetchall():
+        tags_list.append(json.loads(entry[0]))
+    prefetch_for_tags(tags_list, api_url)
+
+def prefetch_for_tags(tags_list, api_url=None):
+    if api_url == None:
+        api_url = wikidata_api_url()
+    wikidata_ids, articles = referenced_wikimedia_data(tags_list)
+    titles_by_language = {}
+    for language_code, article_name in articles:
+        if wikimedia_connection.it_is_necessary_to_reload_wikidata_files(language_code, article_name):
+            if language_code not in titles_by_language:
+                titles_by_language[language_code] = []
+            titles_by_language[language_code].append(article_name)
+    tasks = []
+    for language_code in sorted(titles_by_language.keys()):
+        for batch in batches(sorted(titles_by_language[language_code])):
+            tasks.append((prefetch_wikidata_entities_by_titles, language_code, batch))
+    print("prefetching Wikidata entities for", len(articles), "Wikipedia articles, using", len(tasks), "requests")
+    for found_ids in run_in_parallel(tasks, api_url):
+        wikidata_ids |= found_ids
+
+    missing_ids = sorted([id for id in wikidata_ids if wikimedia_connection.it_is_necessary_to_reload_wikidata_by_id_files(id)])
+    tasks = []
+    for batch in batches(missing_ids):
+        tasks.append((prefetch_wikidata_entities, batch))
+    print("prefetching", len(missing_ids), "of", len(wikidata_ids), "Wikidata entities, using", len(tasks), "requests")
+    run_in_parallel(tasks, api_url)
+
+def batches(items):
+    for index in range(0, len(items), entity_batch_size()):
+        yield items[index:index + entity_batch_size()]
+
+def run_in_parallel(tasks, api_url):
+    returned = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=maximum_parallel_requests()) as executor:
+        futures = []
+        for task in tasks:
+            function = task[0]
+            arguments = list(task[1:]) + [api_url]
+            futures.append(executor.submit(function, *arguments))
+        for future in futures:
+            returned.append(future.result())
+    return returned
+
+def referenced_wikimedia_data(tags_list):
+    # returns set of wikidata ids and set of (language_code, article_name) pairs
+    # from wikidata, wikipedia, *:wikidata and *:wikipedia tags
+    wikidata_ids = set()
+    articles = set()
+    for tags in tags_list:
+        for key, value in tags.items():
+            if key == "wikidata" or key.endswith(":wikidata"):
+                for part in value.split(";"):
+                    part = part.strip()
+                    if re.fullmatch(r"Q[1-9][0-9]*", part):
+                        wikidata_ids.add(part)
+            if key == "wikipedia" or key.endswith(":wikipedia"):
+                if ":" not in value:
+                    continue
+                language_code = wikimedia_connection.get_language_code_from_link(value)
+                article_name = wikimedia_connection.get_article_name_from_link(value)
+                if is_article_title_safe_for_batch_request(language_code, article_name):
+                    articles.add((language_code, article_name))
+    return wikidata_ids, articles
+
+def is_article_title_safe_for_batch_request(language_code, article_name):
+    # titles that are invalid or could break batch request are left for lazy fetching
+    if language_code not in wikimedia_connection.interwiki_language_codes():
+        return False
+    if article_name.strip() == "":
+        return False
+    for letter in ["#", "<", ">", "[", "]", "{", "}", "|"]:
+        if letter in article_name:
+            return False
+    return True
+
+def download_json(url):
+    request = urllib.request.Request(url, headers={'User-Agent': config.user_agent()})
+    try:
+        with urllib.request.urlopen(request, timeout=360) as response:
+            return json.loads(response.read().decode())
+    except (urllib.error.URLError, json.decoder.JSONDecodeError) as e:
+        # not fatal, validator will fetch missing data on its own
+        print("prefetch failed for", url, e)
+        return None
+
+def site_code(language_code):
+    # see wikimedia_connection.download_data_from_wikidata
+    if language_code in ["be-tarask", "be-x-old"]:
+        return "be_x_oldwiki"
+    return language_code + "wiki"
+
+def prefetch_wikidata_entities(wikidata_ids, api_url):
+    url = api_url + "?action=wbgetentities&ids=" + urllib.parse.quote("|".join(wikidata_ids)) + "&format=json"
+    response = download_json(url)
+    if response == None or "entities" not in response:
+        return
+    wikimedia_connection.ensure_that_cache_folder_exists(wikimedia_connection.wikidata_language_placeholder())
+    for wikidata_id in wikidata_ids:
+        entity = response["entities"].get(wikidata_id)
+        if entity == None:
+            continue
+        if "missing" in entity:
+            # matches response to a single id request
+            content = {"error": {"code": "no-such-entity", "info": "Could not find an entity with the ID \"" + wikidata_id + "\".", "id": wikidata_id}}
+        elif entity.get("id") != wikidata_id:
+            # redirect, left for lazy fetching
+            continue
+        else:
+            content = {"entities": {wikidata_id: entity}, "success": 1}
+        wikimedia_connection.write_to_text_file(wikimedia_connection.get_filename_with_wikidata_entity_by_id(wikidata_id), json.dumps(content))
+        wikimedia_connection.write_to_text_file(wikimedia_connection.get_filename_with_wikidata_by_id_response_code(wikidata_id), "200")
+
+def prefetch_wikidata_entities_by_titles(language_code, article_names, api_url):
+    # returns set of wikidata ids of found entities
+    site = site_code(language_code)
+    url = api_url + "?action=wbgetentities&sites=" + urllib.parse.quote(site) + "&titles=" + urllib.parse.quote("|".join(article_names)) + "&format=json"
+    response = download_json(url)
+    if response == None or "entities" not in response:
+        return set()
+    entity_by_title = {}
+    for key, entity in response["entities"].items():
+        if "missing" in entity:
+            # matches response to a single title request
+            entity_by_title[entity.get("title")] = ("-1", entity)
+        else:
+            title = entity.get("sitelinks", {}).get(site, {}).get("title")
+            entity_by_title[title] = (key, entity)
+    found_ids = set()
+    wikimedia_connection.ensure_that_cache_folder_exists(language_code)
+    for article_name in article_names:
+        if article_name not in entity_by_title:
+            # for example title that would be normalized, left for lazy fetching
+            continue
+        key, entity = entity_by_title[article_name]
+        if key != "-1":
+            found_ids.add(key)
+        content = {"entities": {key: entity}, "success": 1}
+        wikimedia_connection.write_to_text_file(wikimedia_connection.get_filename_with_wikidata_entity(language_code, article_name), json.dumps(content))
+        wikimedia_connection.write_to_text_file(wikimedia_connection.get_filename_with_wikidata_response_code(language_code, article_name), "200")
+    return found_ids